@@ -1,110 +1,523 @@
+import asyncio
 import json
 import os
-import re
+import threading
 import time
+import uuid
+import weakref
+from collections import OrderedDict
 from pprint import pprint
 
-import openai
-import requests
-
-import datetime
+import search
+import structured_output
+import tracing
+from cache import DiskCache, make_key
+from rate_limit import (PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, BudgetExhausted,
+                        estimate_tokens, llm_scheduler)
+from evidence_filter import EvidenceFilter
+from evidence_memo import EvidenceMemo
+from results_sink import ResultsSink, result_record
+from retrieval import GoogleRetriever, LocalIndexRetriever
+from search import aclose_search_client
+from article_fetch import aclose_article_client, enrich_results_async
 # -------------------------- Configuration -------------------------- #
 
-# Set your OpenAI API key
-# openai.api_key = 'put your key here'
+class Config:
+    """
+    Credentials and endpoint of the API clients. Importing this module has no side effects: the clients
+    are built from the configuration on first use. Without a configure() call, it is read once from the
+    environment and the .env file, whose values never override variables already set in the environment.
+    """
+
+    # Attribute -> environment variable
+    ENV_VARS = {"openai_api_key": "OPENAI_API_KEY", "openai_base_url": "OPENAI_BASE_URL",
+                "google_api_key": "GOOGLE_API_KEY", "search_engine_id": "SEARCH_ENGINE_ID"}
+
+    def __init__(self, openai_api_key=None, openai_base_url=None, google_api_key=None, search_engine_id=None):
+        """
+        :param openai_api_key: OpenAI API key (None lets the OpenAI client read OPENAI_API_KEY).
+        :param openai_base_url: Optional OpenAI-compatible endpoint, for example a local stand-in.
+        :param google_api_key: Google Custom Search API key.
+        :param search_engine_id: Google Custom Search engine ID.
+        """
+        self.openai_api_key = openai_api_key
+        self.openai_base_url = openai_base_url
+        self.google_api_key = google_api_key
+        self.search_engine_id = search_engine_id
+
+    @classmethod
+    def from_env(cls, env_file=".env"):
+        """
+        :param env_file: Optional .env file; its values only fill variables missing from the environment.
+        :return: Config read from the environment, without modifying it.
+        """
+        values = {}
+        if env_file and os.path.exists(env_file):
+            from dotenv import dotenv_values  # Only needed when there is a .env file
 
-from dotenv import load_dotenv
-load_dotenv(override=True)
+            values.update((name, value) for name, value in dotenv_values(env_file).items() if value is not None)
+        values.update(os.environ)
+        return cls(**{attribute: values.get(name) for attribute, name in cls.ENV_VARS.items()})
 
-openai_api_key = os.getenv('OPENAI_API_KEY')
+    def openai_options(self):
+        """
+        :return: Keyword arguments of the OpenAI client constructors.
+        """
+        options = {"api_key": self.openai_api_key, "base_url": self.openai_base_url}
+        return {name: value for name, value in options.items() if value}
 
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set - please head to the troubleshooting guide in the guides folder")
+    def __repr__(self):
+        # Keys are never shown
+        return (f"Config(openai_api_key={'set' if self.openai_api_key else None}, openai_base_url={self.openai_base_url!r}, "
+                f"google_api_key={'set' if self.google_api_key else None}, search_engine_id={self.search_engine_id!r})")
+
+_config = None
+_config_lock = threading.Lock()
+
+def get_config():
+    """
+    Returns the client configuration, reading it from the environment on first use.
+
+    :return: Config instance.
+    """
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = Config.from_env()
+            if not _config.openai_api_key:
+                print("OpenAI API Key not set - please head to the troubleshooting guide in the guides folder")
+            search.GOOGLE_API_KEY, search.SEARCH_ENGINE_ID = _config.google_api_key, _config.search_engine_id
+    return _config
+
+def configure(config=None, **settings):
+    """
+    Sets the client configuration explicitly. Clients that were already built are dropped and
+    rebuilt from the new configuration on their next use.
+
+    :param config: Config instance (defaults to the current configuration).
+    :param settings: Config attributes to change, for example openai_base_url.
+    :return: The new Config.
+    """
+    global _config, _client
+    config = config or get_config()
+    for name, value in settings.items():
+        if name not in Config.ENV_VARS:
+            raise ValueError(f"Unknown setting: {name}")
+        setattr(config, name, value)
+    with _config_lock:
+        _config = config
+        _client = None
+        _loop_resources.clear()
+        search.GOOGLE_API_KEY, search.SEARCH_ENGINE_ID = config.google_api_key, config.search_engine_id
+    return config
 
 llm_model = "gpt-4o-mini"
 
+# Model of each pipeline stage ("key_claim", "query", "analysis", "decision", "explanation").
+# Stages that are not listed use llm_model
+STAGE_MODELS = {}
+
+# Cascade: when the decision is still NEI or below CONFIDENCE_THRESHOLD after the last round,
+# the claim is decided again by ESCALATION_MODEL on the same analyses
+CASCADE = False
+ESCALATION_MODEL = "gpt-4o"
+
+# Persistent LLM response cache, keyed on model, messages and temperature.
+# Modes: "readwrite", "readonly" (replay stored responses without writing) or "bypass"
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join('.cache', 'llm_cache.sqlite'))
+LLM_CACHE_MODE = os.getenv('LLM_CACHE_MODE', 'readwrite')
+LLM_CACHE_TTL = None  # Seconds, None keeps responses forever
+LLM_CACHE_MAX_ENTRIES = 200000
+
 # Maximum number of search rounds
 MAX_ROUNDS = 3
 
+# Number of new search results requested per round; each retry round fetches the next page
+RESULTS_PER_ROUND = 10
+
+# Local evidence pre-filtering before analysis: drops duplicate URLs, near-duplicate snippets and
+# results sharing no terms with the key claim, and keeps the EVIDENCE_TOP_N most relevant per round
+EVIDENCE_FILTER = False
+EVIDENCE_TOP_N = 5
+
+# Article enrichment: the linked pages of the results to analyze are fetched concurrently (see article_fetch.py),
+# and the passages most relevant to the key claim are given to the analyzer next to the snippet
+ARTICLE_FETCH = False
+
+# Cross-claim evidence memo: analyses of (normalized claim, search result) pairs are stored and reused
+# without calling the model when the pair comes back, also for other inputs and across runs.
+# EVIDENCE_MEMO_SIMILARITY additionally matches stored claims for the same result whose token
+# Jaccard similarity reaches the threshold (None for exact matches only)
+EVIDENCE_MEMO = False
+EVIDENCE_MEMO_PATH = os.getenv('EVIDENCE_MEMO_PATH', os.path.join('.cache', 'evidence_memo.sqlite'))
+EVIDENCE_MEMO_MAX_ENTRIES = 100000
+EVIDENCE_MEMO_SIMILARITY = None
+
+# Triage: a local classifier trained with triage.py decides the inputs whose probability margin (difference
+# between the fake and real probabilities) reaches TRIAGE_MARGIN, without any LLM or search call
+TRIAGE = False
+TRIAGE_MARGIN = 0.8
+TRIAGE_MODEL_PATH = os.getenv('TRIAGE_MODEL_PATH', os.path.join('.cache', 'triage_model.pkl'))
+
+# Retrieval backend: "google" (live Custom Search) or "local" (BM25 index built with retrieval.py)
+RETRIEVER = os.getenv('RETRIEVER', 'google')
+LOCAL_INDEX_DIR = os.getenv('LOCAL_INDEX_DIR', os.path.join('.cache', 'evidence_index'))
+
 # Confidence threshold (percentage)
 CONFIDENCE_THRESHOLD = 50  # 50%
 
-# -------------------------- Google Search Function -------------------------- #
+# Maximum number of search results analyzed concurrently
+ANALYSIS_CONCURRENCY = 10
+
+# Analysis mode: "per_item" sends one request per search result, "fused" scores all
+# search results of a round in one request and falls back to per-item requests only
+# for results whose analysis could not be parsed
+ANALYSIS_MODE = "per_item"
+
+# Maximum number of LLM requests in flight per event loop, shared by all claims
+LLM_CONCURRENCY = 32
+
+# Number of times a rate-limited LLM request is retried after the scheduler backed off
+LLM_MAX_RETRIES = 3
+
+# Default number of inputs processed concurrently by process_many
+PROCESS_MANY_CONCURRENCY = 16
+
+# Structured output: "json_object" requests JSON mode, "json_schema" schema-constrained responses and
+# None plain text. Outputs are repaired locally (code fences, surrounding text, single quotes, trailing
+# commas) and validated against the schema of their stage; only a call whose output is still invalid
+# is sent again, up to STRUCTURED_MAX_RETRIES times
+STRUCTURED_OUTPUT = "json_object"
+STRUCTURED_MAX_RETRIES = 1
 
-def google_search(query, result_total=10):
+# Aggregation policy: "once" decides a single time after all analyses of a round,
+# "incremental" re-decides after every DECISION_EVERY_K results or when the local
+# support/negate tally crosses TALLY_THRESHOLD, and stops at the first confident decision
+AGGREGATION_POLICY = "once"
+DECISION_EVERY_K = 3
+TALLY_THRESHOLD = 150  # Margin of summed support vs. negate confidence points
+
+# Full trace: every claim runs all MAX_ROUNDS rounds, recording the decision after each round, so that
+# simulate.py can replay the traces under other stopping rules. The final decision is unchanged
+FULL_TRACE = False
+
+# -------------------------- LLM Functions -------------------------- #
+
+_llm_cache = None
+
+def get_llm_cache():
     """
-    Conducts a Google search using the provided query and retrieves a specified number of results.
-    
-    :param query: The search query string.
-    :param result_total: Total number of results desired.
-    :return: List of search result items.
+    Returns the shared LLM response cache, opening it on first use.
+
+    :return: DiskCache instance.
     """
-    def build_payload(query, start=1, num=10, **params):
-        """
-        Builds the payload for the Google Search API request.
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = DiskCache(LLM_CACHE_PATH, mode=LLM_CACHE_MODE, ttl=LLM_CACHE_TTL,
+                               max_entries=LLM_CACHE_MAX_ENTRIES)
+    return _llm_cache
 
-        :param query: Search term.
-        :param start: The index of the first result to return.
-        :param num: Number of search results per request.
-        :param params: Additional parameters for the API request.
-        :return: Dictionary containing the API request parameters.
-        """
-        # api_key = "Aput your key here"
-        api_key = os.getenv('GOOGLE_API_KEY')
-        # search_engine_ID = "put your key here"
-        search_engine_ID = os.getenv('SEARCH_ENGINE_ID')
-        payload = {
-            'key':api_key,
-            'q': query,
-            'cx': search_engine_ID,
-            'start': start,
-            'num': num,
-        }
-        payload.update(params)
-        return payload
+_evidence_memo = None
 
-    def make_request(payload):
-        """
-        Sends a GET request to the Google Search API and handles potential errors.
+def get_evidence_memo():
+    """
+    Returns the shared cross-claim evidence memo, opening it on first use.
 
-        :param payload: Dictionary containing the API request parameters.
-        :return: JSON response from the API.
-        """
-        response = requests.get('https://www.googleapis.com/customsearch/v1', params=payload)
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 403:
-            raise Exception('API key quota exceeded or access forbidden.')
-        else:
-            raise Exception(f'Request failed with status code {response.status_code}')
-
-    items = []
-    pages = (result_total + 9) // 10  # Ensuring we account for all pages including the last one which might be partial
-    for i in range(pages):
-        start_index = i * 10 + 1
-        num_results = 10 if i < pages - 1 else result_total - (i * 10)
-        payload = build_payload(query, start=start_index, num=num_results)
+    :return: EvidenceMemo instance.
+    """
+    global _evidence_memo
+    if _evidence_memo is None:
+        _evidence_memo = EvidenceMemo(EVIDENCE_MEMO_PATH, max_entries=EVIDENCE_MEMO_MAX_ENTRIES,
+                                      similarity_threshold=EVIDENCE_MEMO_SIMILARITY)
+    return _evidence_memo
+
+def stage_model(stage):
+    """
+    :param stage: Output stage (a key of OUTPUT_SCHEMAS).
+    :return: The model configured for the stage in STAGE_MODELS, or llm_model.
+    """
+    return STAGE_MODELS.get(stage, llm_model)
+
+_triage = None
+_triage_lock = threading.Lock()
+
+def get_triage():
+    """
+    Returns the triage classifier, loading it from TRIAGE_MODEL_PATH on first use.
+
+    :return: triage.TriageClassifier instance.
+    """
+    global _triage
+    # Worker threads may ask for it at the same time; scikit-learn is imported and the model loaded once
+    with _triage_lock:
+        if _triage is None:
+            from triage import TriageClassifier
+            _triage = TriageClassifier.load(TRIAGE_MODEL_PATH)
+    return _triage
+
+def _record_usage(usage, response, model):
+    if response.usage is not None:
+        tracing.record_tokens(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+    if usage is not None:
+        usage["calls"] = usage.get("calls", 0) + 1
+        if response.usage is not None:
+            usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + response.usage.prompt_tokens
+            usage["completion_tokens"] = usage.get("completion_tokens", 0) + response.usage.completion_tokens
+
+def _lookup_cache(key, usage, model):
+    cached = get_llm_cache().get(key)
+    if cached is not None:
+        tracing.record_cache_hit(model)
+        if usage is not None:
+            usage["cache_hits"] = usage.get("cache_hits", 0) + 1
+    return cached
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _handle_rate_limit(error, attempt):
+    """
+    Backs the shared LLM scheduler off after a rate-limit error, and decides whether to retry.
+    An exhausted account quota marks the LLM budget as exhausted.
+    """
+    if getattr(error, "code", None) == "insufficient_quota":
+        llm_scheduler.exhaust()
+        raise BudgetExhausted("OpenAI quota exhausted") from error
+    llm_scheduler.on_rate_limited(_retry_after(error))
+    if attempt == LLM_MAX_RETRIES:
+        raise error
+    tracing.record_retry()
+
+def _settle_usage(estimate, response):
+    llm_scheduler.on_success()
+    if response.usage is not None:
+        llm_scheduler.settle(estimate, response.usage.total_tokens)
+
+def llm_cache_key(messages, temperature, response_format=None, model=None):
+    """
+    :return: LLM cache key of a request (the response format is only part of the key when one is requested).
+    """
+    model = model or llm_model
+    if response_format is None:
+        return make_key(model, messages, temperature)
+    return make_key(model, messages, temperature, response_format)
+
+def chat_completion(messages, temperature=0.3, usage=None, priority=PRIORITY_NORMAL, response_format=None, model=None):
+    """
+    Sends a chat completion request and returns the text of the first choice.
+    Responses are served from and stored in the persistent LLM cache. Requests that reach
+    the API go through the shared rate limiter and are retried after rate-limit errors.
+    Like the other blocking helpers below, it runs its async version on a fresh event loop (see run_sync).
+
+    :param messages: List of chat messages.
+    :param temperature: Sampling temperature.
+    :param usage: Optional dictionary that accumulates "calls", "cache_hits", "prompt_tokens" and "completion_tokens".
+    :param priority: Scheduling priority of the request (rate_limit.PRIORITY_*).
+    :param response_format: Optional response_format of the request (JSON mode or a JSON schema).
+    :param model: Model of the request (defaults to llm_model).
+    :return: The response content as a string.
+    """
+    return run_sync(chat_completion_async(messages, temperature, usage=usage, priority=priority,
+                                          response_format=response_format, model=model))
+
+_client = None
+
+def get_client():
+    """
+    Returns the shared OpenAI client, importing openai and building the client from the configuration on first use.
+
+    :return: openai.OpenAI instance.
+    """
+    global _client
+    config = get_config()
+    with _config_lock:
+        if _client is None:
+            _client = search.load_backends().openai.OpenAI(**config.openai_options())
+    return _client
+
+# Async clients and semaphores are bound to an event loop, so they are kept per loop
+_loop_resources = weakref.WeakKeyDictionary()
+
+def _get_loop_resources():
+    loop = asyncio.get_running_loop()
+    resources = _loop_resources.get(loop)
+    if resources is None:
+        resources = {"client": None, "semaphore": asyncio.Semaphore(LLM_CONCURRENCY)}
+        _loop_resources[loop] = resources
+    return resources
+
+def get_async_client():
+    """
+    Returns the async OpenAI client of the running event loop, creating it on first use.
+
+    :return: openai.AsyncOpenAI instance.
+    """
+    resources = _get_loop_resources()
+    if resources["client"] is None:
+        resources["client"] = search.load_backends().openai.AsyncOpenAI(**get_config().openai_options())
+    return resources["client"]
+
+async def aclose_clients():
+    """
+    Closes the async OpenAI, search and article clients of the running event loop.
+    """
+    resources = _loop_resources.pop(asyncio.get_running_loop(), None)
+    if resources is not None and resources["client"] is not None:
+        await resources["client"].close()
+    await aclose_search_client()
+    await aclose_article_client()
+
+async def chat_completion_async(messages, temperature=0.3, usage=None, priority=PRIORITY_NORMAL, response_format=None, model=None):
+    """
+    Async version of chat_completion. Requests go through the async OpenAI client and
+    at most LLM_CONCURRENCY of them are in flight per event loop.
+
+    :param messages: List of chat messages.
+    :param temperature: Sampling temperature.
+    :param usage: Optional dictionary that accumulates "calls", "cache_hits", "prompt_tokens" and "completion_tokens".
+    :param priority: Scheduling priority of the request (rate_limit.PRIORITY_*).
+    :param response_format: Optional response_format of the request (JSON mode or a JSON schema).
+    :param model: Model of the request (defaults to llm_model).
+    :return: The response content as a string.
+    """
+    model = model or llm_model
+    key = llm_cache_key(messages, temperature, response_format, model)
+    options = {"response_format": response_format} if response_format is not None else {}
+    cached = _lookup_cache(key, usage, model)
+    if cached is not None:
+        return cached
+
+    openai = search.load_backends().openai
+    estimate = estimate_tokens(messages)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await llm_scheduler.acquire_async(estimate, priority)
         try:
-            response = make_request(payload)
-            items.extend(response.get('items', []))
-        except Exception as e:
-            print(f"Google Search Error: {e}")
-            break  # Exit on error since there's no alternative API key
-    
-    
-   
-    return items
+            async with _get_loop_resources()["semaphore"]:
+                response = await get_async_client().chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    **options,
+                )
+            break
+        except openai.RateLimitError as e:
+            _handle_rate_limit(e, attempt)
+    _settle_usage(estimate, response)
+    _record_usage(usage, response, model)
+    output = response.choices[0].message.content
+    get_llm_cache().set(key, output)
+    return output
 
-# -------------------------- LLM Functions -------------------------- #
+def stage_response_format(stage):
+    """
+    :param stage: Output stage (a key of OUTPUT_SCHEMAS, or "fused_analysis").
+    :return: The response_format requested for the stage with the configured STRUCTURED_OUTPUT mode.
+    """
+    if stage == "fused_analysis":
+        # The fused output is validated per item, JSON mode is enough
+        return structured_output.response_format(stage, {}, STRUCTURED_OUTPUT and "json_object")
+    return structured_output.response_format(stage, OUTPUT_SCHEMAS[stage], STRUCTURED_OUTPUT)
+
+def _retry_messages(messages, output, error):
+    return messages + [
+        {"role": "assistant", "content": output},
+        {"role": "user", "content": f"Your answer could not be used ({error}). Reply again with only the JSON object in the requested format."},
+    ]
+
+def _settle_structured(stage, messages, temperature, response_format, model, value, repaired, error, retries, output, usage):
+    """
+    Records the outcome of a structured call and returns its output, as canonical JSON when it is valid.
+    A repaired or re-requested output is cached under the original request, so later runs skip the repair.
+    """
+    if error is not None:
+        print(f"Invalid {stage} output after {retries} retries: {error}")
+        structured_output.record("failed")
+        return output
+    structured_output.record("repaired" if repaired or retries else "valid")
+    if (repaired or retries) and usage is not None:
+        usage["rescued"] = usage.get("rescued", 0) + 1
+    output = json.dumps(value, ensure_ascii=False)
+    if repaired or retries:
+        get_llm_cache().set(llm_cache_key(messages, temperature, response_format, model), output)
+    return output
+
+def structured_chat_completion(messages, stage, temperature=0.3, usage=None, priority=PRIORITY_NORMAL, model=None):
+    """
+    Sends a chat completion request for a pipeline stage with structured output enforced. The output
+    is repaired and validated against the stage schema, and the call alone is retried while it is invalid.
+
+    :param messages: List of chat messages.
+    :param stage: Output stage, a key of OUTPUT_SCHEMAS.
+    :param temperature: Sampling temperature.
+    :param usage: Optional dictionary that also accumulates the number of "rescued" (repaired or retried) outputs.
+    :param priority: Scheduling priority of the request (rate_limit.PRIORITY_*).
+    :param model: Model of the request (defaults to the model of the stage, see stage_model).
+    :return: The validated output as JSON text, or the last raw output if it stayed invalid.
+    """
+    return run_sync(structured_chat_completion_async(messages, stage, temperature, usage=usage, priority=priority, model=model))
 
-def extract_key_claim(content):
+async def structured_chat_completion_async(messages, stage, temperature=0.3, usage=None, priority=PRIORITY_NORMAL, model=None):
     """
-    Extracts the key claim from the input content using OpenAI's GPT model.
+    Async version of structured_chat_completion.
+    """
+    model = model or stage_model(stage)
+    response_format = stage_response_format(stage)
+    output = await chat_completion_async(messages, temperature, usage=usage, priority=priority, response_format=response_format, model=model)
+    value, repaired, error = structured_output.parse(output, OUTPUT_SCHEMAS[stage])
+    retries = 0
+    while error is not None and retries < STRUCTURED_MAX_RETRIES:
+        structured_output.record("invalid")
+        structured_output.record("retried")
+        retries += 1
+        output = await chat_completion_async(_retry_messages(messages, output, error), temperature, usage=usage,
+                                             priority=priority, response_format=response_format, model=model)
+        value, repaired, error = structured_output.parse(output, OUTPUT_SCHEMAS[stage])
+    return _settle_structured(stage, messages, temperature, response_format, model, value, repaired, error, retries, output, usage)
+
+_retriever = None
+
+def get_retriever():
+    """
+    Returns the configured retrieval backend, creating it on first use.
+
+    :return: Retriever instance.
+    """
+    global _retriever
+    if _retriever is None:
+        if RETRIEVER == "google":
+            get_config()  # Passes the Custom Search credentials to the search module
+            _retriever = GoogleRetriever()
+        elif RETRIEVER == "local":
+            _retriever = LocalIndexRetriever(LOCAL_INDEX_DIR)
+        else:
+            raise ValueError(f"Unknown retriever: {RETRIEVER}")
+    return _retriever
+
+# -------------------------- Prompts and Output Parsing -------------------------- #
+
+ANALYSIS_LABELS = ("support", "negate", "baseless", "contradict", "unrelated")
+
+# Expected output of every stage (see structured_output)
+OUTPUT_SCHEMAS = {
+    "key_claim": {"key_claim": structured_output.STRING},
+    "query": {"query": structured_output.STRING},
+    "analysis": {"support_or_contradict_or_unrelated": ANALYSIS_LABELS, "confidence": structured_output.NUMBER,
+                 "rationale?": structured_output.STRING},
+    "decision": {"decision": ("real", "fake", "NEI"), "confidence": structured_output.NUMBER},
+    "explanation": {"explanation": structured_output.STRING},
+}
+FUSED_ITEM_SCHEMA = {"label": ANALYSIS_LABELS, "confidence": structured_output.NUMBER, "rationale?": structured_output.STRING}
+
+def build_key_claim_messages(content):
+    """
+    Builds the chat messages that ask for the key claim of the input content.
 
     :param content: Input text content.
-    :return: The key claim as a string.
+    :return: List of chat messages.
     """
     prompt = f"""
     Given the input content below, please summarize the single key claim.
@@ -114,29 +527,21 @@ def extract_key_claim(content):
     Please output with the following JSON format:
     {{"key_claim": "XXX"}}
     """
+    return [
+        {"role": "system", "content": "You are an assistant that extracts key claims from text."},
+        {"role": "user", "content": prompt}
+    ]
 
-    response = openai.chat.completions.create(
-        model= llm_model,
-        messages=[
-            {"role": "system", "content": "You are an assistant that extracts key claims from text."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-    )
-
-    output = response.choices[0].message.content    
-    try:
-        key_claim = json.loads(output)["key_claim"]
-    except json.JSONDecodeError:
-        key_claim = output.strip()
-    return key_claim
+def parse_key_claim(output):
+    value, _, error = structured_output.parse(output, OUTPUT_SCHEMAS["key_claim"])
+    return value["key_claim"] if error is None else output.strip()
 
-def generate_query(claim):
+def build_query_messages(claim):
     """
-    Generates a Google search query based on the provided claim.
+    Builds the chat messages that ask for a Google search query for the claim.
 
     :param claim: The claim to verify.
-    :return: The search query as a string.
+    :return: List of chat messages.
     """
     prompt = f"""
     Given the claim below, please generate a Google query which can be used to search content to verify this claim.
@@ -146,30 +551,44 @@ def generate_query(claim):
     Please output with the following JSON format:
     {{"query": "XXX"}}
     """
+    return [
+        {"role": "system", "content": "You are an assistant that generates search queries based on claims."},
+        {"role": "user", "content": prompt}
+    ]
 
-    response = openai.chat.completions.create(
-        model= llm_model,
-        messages=[
-            {"role": "system", "content": "You are an assistant that generates search queries based on claims."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-    )
+def parse_query(output):
+    value, _, error = structured_output.parse(output, OUTPUT_SCHEMAS["query"])
+    return value["query"] if error is None else output.strip()
 
-    output = response.choices[0].message.content
-    try:
-        query = json.loads(output)["query"]
-    except json.JSONDecodeError:
-        query = output.strip()
-    return query
+def format_search_result(item):
+    """
+    Formats a search result item as the text given to the analyzer.
 
-def analyze_search_result(search_result, claim):
+    :param item: Search result item with title, link and snippet, and the article passages when it was enriched.
+    :return: Tuple (title, link, search_result text).
     """
-    Analyzes a single search result to determine if it supports, negates, or is baseless regarding the claim.
+    snippet = item.get('snippet', 'No snippet provided.')
+    link = item.get('link', 'No link provided.')
+    title = item.get('title', 'No title provided.')
+    search_result = f"Title: {title}\nLink: {link}\nSnippet: {snippet}"
+    if item.get('passages'):
+        search_result += "\nArticle excerpts:\n" + "\n...\n".join(item['passages'])
+    return title, link, search_result
+
+def evidence_text(item):
+    """
+    :param item: Search result item.
+    :return: The evidence of the item given to the analyzer (snippet and article passages), used in memo keys.
+    """
+    return "\n".join([item.get('snippet', '')] + item.get('passages', []))
+
+def build_analysis_messages(search_result, claim):
+    """
+    Builds the chat messages that ask whether a search result supports, negates or is baseless regarding the claim.
 
     :param search_result: A single search result item.
     :param claim: The claim to verify.
-    :return: A dictionary with analysis results.
+    :return: List of chat messages.
     """
     prompt = f"""
     Below is one web search result:
@@ -191,28 +610,19 @@ def analyze_search_result(search_result, claim):
 
     To clarify: if the content of the search results does not contradict the claim, but lacks some or all of the information presented in the claim, please use the label "baseless" rather than "negate".
     """
-
-    response = openai.chat.completions.create(
-        model= llm_model,
-        messages=[
-            {"role": "system", "content": "You are an assistant that analyzes search results against claims."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-    )
-
-    output = response.choices[0].message.content
-    try:
-        analysis = json.loads(output)
+    return [
+        {"role": "system", "content": "You are an assistant that analyzes search results against claims."},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_analysis(output):
+    analysis, _, error = structured_output.parse(output, OUTPUT_SCHEMAS["analysis"])
+    if error is None:
         # Ensure confidence is within [0, 100]
-        confidence = analysis.get("confidence", 0)
-        if isinstance(confidence, (int, float)):
-            confidence = max(0, min(100, confidence))
-        else:
-            confidence = 0  # Default if not a number
-        analysis["confidence"] = confidence
-    except json.JSONDecodeError:
-        # Fallback parsing if JSON fails
+        analysis["confidence"] = max(0, min(100, analysis["confidence"]))
+        analysis.setdefault("rationale", "")
+    else:
+        # Fallback if the output is not a valid analysis
         analysis = {
             "support_or_contradict_or_unrelated": "unrelated",
             "confidence": 0,
@@ -220,17 +630,79 @@ def analyze_search_result(search_result, claim):
         }
     return analysis
 
-def make_final_decision2(claim):
+def build_fused_analysis_messages(search_results, claim):
     """
-    Aggregates the analyses of all search results to make a final decision using an LLM prompt. If there is no evidence, the function 
-    will prompt GPT to classify the claim based on the available text.
+    Builds the chat messages that ask for the analysis of all search results of a round in one request.
 
+    :param search_results: List of formatted search results, numbered from 1 in the prompt.
     :param claim: The claim to verify.
-    :param analyses: List of analysis dictionaries.
-    :return: Final decision with confidence.
+    :return: List of chat messages.
+    """
+    results_text = "\n\n".join(f"Search Result idx={idx}:\n{search_result}"
+                                for idx, search_result in enumerate(search_results, 1))
+    prompt = f"""
+    Below are {len(search_results)} web search results:
+
+    {results_text}
+
+    Below is a claim to be verified:
+    Claim: {claim}
+
+    For each search result, perform the following rules and output a JSON array with one object per search result, with this format:
+    [{{"idx": 1, "label": "support" or "negate" or "baseless", "confidence": XX (0-100), "rationale": "XXX"}}, ...]
+
+    Rule 1: if the search result content supports the claim, set the "label" field as "support", and offer a confident score and a rationale.
+
+    Rule 2: if the search result content negates the claim, set the "label" field as "negate", and offer a confident score and a rationale.
+
+    Rule 3: if the search result content cannot either support or negate the claim, set the "label" field as "baseless", and offer a confident score and a rationale.
+
+    To clarify: if the content of the search results does not contradict the claim, but lacks some or all of the information presented in the claim, please use the label "baseless" rather than "negate".
+    """
+    return [
+        {"role": "system", "content": "You are an assistant that analyzes search results against claims."},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_fused_analysis(output, count):
+    """
+    Parses the output of a fused analysis request and validates every item.
+
+    :param output: Response content.
+    :param count: Number of search results in the request.
+    :return: Dictionary mapping the 1-based index to the analysis, for the valid items only.
+    """
+    try:
+        items, _ = structured_output.load_json(output)
+    except ValueError:
+        items = []
+    if isinstance(items, dict):
+        items = next((value for value in items.values() if isinstance(value, list)), [])
+    if not isinstance(items, list):
+        return {}
+
+    analyses = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        idx = item.get("idx")
+        value, _, error = structured_output.validate(item, FUSED_ITEM_SCHEMA)
+        if not isinstance(idx, int) or isinstance(idx, bool) or not 1 <= idx <= count or error is not None:
+            continue
+        analyses[idx] = {
+            "support_or_contradict_or_unrelated": value["label"],
+            "confidence": max(0, min(100, value["confidence"])),
+            "rationale": str(value.get("rationale", "")),
+        }
+    return analyses
+
+def build_claim_only_decision_messages(claim):
+    """
+    Builds the chat messages that ask for a decision based solely on the claim text.
+
+    :param claim: The claim to verify.
+    :return: List of chat messages.
     """
-    print('decision without analyses')
-    # If no analyses are available, prompt GPT to classify based solely on the claim text.
     prompt = f"""
     You are an assistant that determines the veracity of a claim based solely on the text provided.
 
@@ -249,45 +721,19 @@ def make_final_decision2(claim):
             "confidence": XX  # Confidence score as a percentage between 0 and 100
         }}
         """
+    return [
+        {"role": "system", "content": "You are an assistant that makes final decisions based on a claim and multiple pieces of evidence."},
+        {"role": "user", "content": prompt}
+    ]
 
-    response = openai.chat.completions.create(
-        model= llm_model,
-        messages=[
-            {"role": "system", "content": "You are an assistant that makes final decisions based on a claim and multiple pieces of evidence."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-    )
-
-    output = response.choices[0].message.content
-    try:
-        final_decision = json.loads(output)
-        # Ensure confidence is within [0, 100]
-        confidence = final_decision.get("confidence", 0)
-        if isinstance(confidence, (int, float)):
-            confidence = max(0, min(100, confidence))
-        else:
-            confidence = 0  # Default if not a number
-        final_decision["confidence"] = confidence
-    except json.JSONDecodeError:
-        # Fallback decision if JSON parsing fails
-        final_decision = {
-            "decision": "NEI",
-            "confidence": 0
-        }
-
-    return final_decision
-
-def make_final_decision(claim, analyses):
+def build_decision_messages(claim, analyses):
     """
-    Aggregates the analyses of all search results to make a final decision using an LLM prompt.
+    Builds the chat messages that ask for a decision based on the claim and the analyses of the evidence.
 
     :param claim: The claim to verify.
     :param analyses: List of analysis dictionaries.
-    :return: Final decision with confidence.
+    :return: List of chat messages.
     """
-    print('decision with analyses')
-
     # Construct a detailed prompt with the claim and all analyses
     analyses_text = "\n".join([
         f"Evidence {i+1}:\nLabel: {analysis['support_or_contradict_or_unrelated']}\nConfidence: {analysis['confidence']}%\nRationale: {analysis['rationale']}\n"
@@ -315,28 +761,18 @@ def make_final_decision(claim, analyses):
         "confidence": XX  # Confidence score as a percentage between 0 and 100
     }}
     """
-
-    response = openai.chat.completions.create(
-        model= llm_model,
-        messages=[
-            {"role": "system", "content": "You are an assistant that makes final decisions based on a claim and multiple pieces of evidence."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3,
-    )
-
-    output = response.choices[0].message.content
-    try:
-        final_decision = json.loads(output)
+    return [
+        {"role": "system", "content": "You are an assistant that makes final decisions based on a claim and multiple pieces of evidence."},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_decision(output):
+    final_decision, _, error = structured_output.parse(output, OUTPUT_SCHEMAS["decision"])
+    if error is None:
         # Ensure confidence is within [0, 100]
-        confidence = final_decision.get("confidence", 0)
-        if isinstance(confidence, (int, float)):
-            confidence = max(0, min(100, confidence))
-        else:
-            confidence = 0  # Default if not a number
-        final_decision["confidence"] = confidence
-    except json.JSONDecodeError:
-        # Fallback decision if JSON parsing fails
+        final_decision["confidence"] = max(0, min(100, final_decision["confidence"]))
+    else:
+        # Fallback decision if the output is not a valid decision
         final_decision = {
             "decision": "NEI",
             "confidence": 0
@@ -344,30 +780,15 @@ def make_final_decision(claim, analyses):
 
     return final_decision
 
-def generate_explanation2(claim, decision, confidence):
+def build_claim_only_explanation_messages(claim, decision, confidence):
     """
-    Generates an explanation for the final decision, including reasons, the label, and supporting evidence links. 
-    If no evidence is available, prompts GPT to generate an explanation based solely on the claim text and the decision.
+    Builds the chat messages that ask for an explanation based solely on the claim text and the decision.
 
     :param claim: The claim to verify.
     :param decision: The final decision ("real", "fake", or "NEI").
     :param confidence: The confidence score as a percentage.
-    :param analyses: List of analysis dictionaries.
-    :return: A list of dictionaries containing the explanation components (title, rationale, link, etc.)
+    :return: List of chat messages.
     """
-    explanation_data = []
-
-    # Add the decision label at the top of the explanation
-    explanation_data.append({
-        "type": "label",
-        "label": decision,
-        "confidence": confidence
-    })
-    explanation_data.append({
-                "type": "intro",
-                "content": f"The classification as {decision} is based on the following evidence:"
-            })
-    # If no analyses are available, prompt GPT to generate an explanation based on the claim and the decision
     prompt = f"""
         You are an assistant that generates an explanation for a decision based solely on the text of the claim and the classification.
 
@@ -389,23 +810,377 @@ def generate_explanation2(claim, decision, confidence):
             "explanation": "<explanation text>"
         }}
         """
-        
-    response = openai.chat.completions.create(
-            model= llm_model,
-            messages=[
-                {"role": "system", "content": "You are an assistant that provides explanations for decisions."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-        )
+    return [
+        {"role": "system", "content": "You are an assistant that provides explanations for decisions."},
+        {"role": "user", "content": prompt}
+    ]
 
-    output = response.choices[0].message.content
+def build_claim_only_explanation(decision, confidence, output):
+    explanation_data = []
+
+    # Add the decision label at the top of the explanation
+    explanation_data.append({
+        "type": "label",
+        "label": decision,
+        "confidence": confidence
+    })
+    explanation_data.append({
+                "type": "intro",
+                "content": f"The classification as {decision} is based on the following evidence:"
+            })
     explanation_data.append({
             "type": "evidence",
             "content": output.strip()
         })
     return explanation_data
 
+# -------------------------- Agents -------------------------- #
+
+# Key claims memoized per input content
+KEY_CLAIM_MEMO_SIZE = 1024
+_key_claim_memo = OrderedDict()
+_key_claim_lock = threading.Lock()
+
+def _memoized_key_claim(content):
+    with _key_claim_lock:
+        if content in _key_claim_memo:
+            _key_claim_memo.move_to_end(content)
+            return _key_claim_memo[content]
+    return None
+
+def _memoize_key_claim(content, key_claim):
+    with _key_claim_lock:
+        _key_claim_memo[content] = key_claim
+        if len(_key_claim_memo) > KEY_CLAIM_MEMO_SIZE:
+            _key_claim_memo.popitem(last=False)
+
+def extract_key_claim(content):
+    """
+    Extracts the key claim from the input content using OpenAI's GPT model.
+    Results are memoized per input content.
+
+    :param content: Input text content.
+    :return: The key claim as a string.
+    """
+    return run_sync(extract_key_claim_async(content))
+
+async def extract_key_claim_async(content):
+    """
+    Async version of extract_key_claim.
+    """
+    with tracing.span("extract_key_claim"):
+        key_claim = _memoized_key_claim(content)
+        if key_claim is None:
+            key_claim = parse_key_claim(await structured_chat_completion_async(build_key_claim_messages(content), "key_claim"))
+            _memoize_key_claim(content, key_claim)
+        else:
+            tracing.record_cache_hit()
+    return key_claim
+
+def generate_query(claim):
+    """
+    Generates a Google search query based on the provided claim.
+
+    :param claim: The claim to verify.
+    :return: The search query as a string.
+    """
+    return run_sync(generate_query_async(claim))
+
+async def generate_query_async(claim):
+    """
+    Async version of generate_query.
+    """
+    with tracing.span("generate_query"):
+        return parse_query(await structured_chat_completion_async(build_query_messages(claim), "query"))
+
+def analyze_search_result(search_result, claim, usage=None):
+    """
+    Analyzes a single search result to determine if it supports, negates, or is baseless regarding the claim.
+
+    :param search_result: A single search result item.
+    :param claim: The claim to verify.
+    :param usage: Optional dictionary that accumulates the token usage of the call.
+    :return: A dictionary with analysis results.
+    """
+    return run_sync(analyze_search_result_async(search_result, claim, usage=usage))
+
+async def analyze_search_result_async(search_result, claim, usage=None):
+    """
+    Async version of analyze_search_result.
+    """
+    with tracing.span("analyze_search_result"):
+        return parse_analysis(await structured_chat_completion_async(build_analysis_messages(search_result, claim), "analysis", usage=usage, priority=PRIORITY_LOW))
+
+def analyze_search_results(search_results, claim, max_workers=None, usage=None):
+    """
+    Analyzes all search results of a round concurrently.
+
+    :param search_results: List of search result items, in search-rank order.
+    :param claim: The claim to verify.
+    :param max_workers: Maximum number of concurrent analyses (defaults to ANALYSIS_CONCURRENCY).
+    :param usage: Optional dictionary that accumulates the token usage of the calls.
+    :return: List of analysis dictionaries, in the same order as the search results.
+    """
+    return run_sync(analyze_search_results_async(search_results, claim, max_workers=max_workers, usage=usage))
+
+async def analyze_search_results_async(search_results, claim, max_workers=None, usage=None):
+    """
+    Async version of analyze_search_results: fans out the analyses of a round with at most
+    max_workers of them in flight, and returns them in search-rank order.
+    """
+    if max_workers is None:
+        max_workers = ANALYSIS_CONCURRENCY
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def analyze(item):
+        title, link, search_result = format_search_result(item)
+        async with semaphore:
+            analysis = await analyze_search_result_async(search_result, claim, usage=usage)
+        # Ensure that title and link are correctly assigned
+        analysis['title'] = title
+        analysis['link'] = link
+        return analysis
+
+    return list(await asyncio.gather(*(analyze(item) for item in search_results)))
+
+async def analyze_search_results_fused_async(search_results, claim, usage=None):
+    """
+    Analyzes all search results of a round in a single LLM request. Only the results whose analysis
+    is missing or invalid in the response are analyzed again with per-item requests.
+
+    :param search_results: List of search result items, in search-rank order.
+    :param claim: The claim to verify.
+    :param usage: Optional dictionary that accumulates the token usage of the calls and the number of "fallbacks".
+    :return: List of analysis dictionaries, in the same order as the search results.
+    """
+    if not search_results:
+        return []
+    formatted = [format_search_result(item) for item in search_results]
+    with tracing.span("analyze_search_results_fused", results=len(formatted)):
+        output = await chat_completion_async(build_fused_analysis_messages([text for _, _, text in formatted], claim),
+                                             usage=usage, priority=PRIORITY_LOW, response_format=stage_response_format("fused_analysis"),
+                                             model=stage_model("analysis"))
+    parsed = parse_fused_analysis(output, len(formatted))
+
+    missing = [idx for idx in range(1, len(formatted) + 1) if idx not in parsed]
+    if missing:
+        print(f"Fused analysis incomplete, analyzing results {missing} individually")
+        if usage is not None:
+            usage["fallbacks"] = usage.get("fallbacks", 0) + len(missing)
+        fallbacks = await analyze_search_results_async([search_results[idx - 1] for idx in missing], claim, usage=usage)
+        parsed.update(zip(missing, fallbacks))
+
+    analyses = []
+    for idx, (title, link, _) in enumerate(formatted, 1):
+        analysis = parsed[idx]
+        analysis['title'] = title
+        analysis['link'] = link
+        analyses.append(analysis)
+    return analyses
+
+async def analyze_round_async(search_results, claim, mode=None, usage=None):
+    """
+    Analyzes the search results of a round with the configured analysis mode.
+
+    :param search_results: List of search result items, in search-rank order.
+    :param claim: The claim to verify.
+    :param mode: "per_item" or "fused" (defaults to ANALYSIS_MODE).
+    :param usage: Optional dictionary that accumulates the token usage of the calls.
+    :return: List of analysis dictionaries, in the same order as the search results.
+    """
+    if mode is None:
+        mode = ANALYSIS_MODE
+    if mode not in ("per_item", "fused"):
+        raise ValueError(f"Unknown analysis mode: {mode}")
+
+    # Results whose analysis for this claim and analysis model is in the evidence memo are not sent to the model
+    memo = get_evidence_memo() if EVIDENCE_MEMO else None
+    model = stage_model("analysis")
+    analyses = [None] * len(search_results)
+    if memo is not None:
+        for idx, item in enumerate(search_results):
+            stored = memo.get(claim, item.get('link', ''), evidence_text(item), model=model)
+            if stored is not None:
+                title, link, _ = format_search_result(item)
+                analyses[idx] = dict(stored, title=title, link=link)
+        hits = sum(analysis is not None for analysis in analyses)
+        if usage is not None:
+            usage["memo_hits"] = usage.get("memo_hits", 0) + hits
+        if hits:
+            print(f"Reusing {hits} memoized analyses")
+
+    pending = [idx for idx, analysis in enumerate(analyses) if analysis is None]
+    pending_results = [search_results[idx] for idx in pending]
+    if mode == "fused":
+        new_analyses = await analyze_search_results_fused_async(pending_results, claim, usage=usage)
+    else:
+        new_analyses = await analyze_search_results_async(pending_results, claim, usage=usage)
+    for idx, analysis in zip(pending, new_analyses):
+        analyses[idx] = analysis
+        # Analyses that could not be parsed are not memoized
+        if memo is not None and analysis.get("rationale") != "Unable to parse analysis.":
+            item = search_results[idx]
+            memo.put(claim, item.get('link', ''), evidence_text(item), analysis, model=model)
+    return analyses
+
+def make_final_decision2(claim, usage=None):
+    """
+    Aggregates the analyses of all search results to make a final decision using an LLM prompt. If there is no evidence, the function 
+    will prompt GPT to classify the claim based on the available text.
+
+    :param claim: The claim to verify.
+    :param usage: Optional dictionary that accumulates the token usage of the call.
+    :return: Final decision with confidence.
+    """
+    return run_sync(make_final_decision2_async(claim, usage=usage))
+
+async def make_final_decision2_async(claim, usage=None):
+    """
+    Async version of make_final_decision2.
+    """
+    print('decision without analyses')
+    with tracing.span("make_final_decision", evidence=0):
+        return parse_decision(await structured_chat_completion_async(build_claim_only_decision_messages(claim), "decision", usage=usage, priority=PRIORITY_HIGH))
+
+def make_final_decision(claim, analyses, usage=None, model=None):
+    """
+    Aggregates the analyses of all search results to make a final decision using an LLM prompt.
+
+    :param claim: The claim to verify.
+    :param analyses: List of analysis dictionaries.
+    :param usage: Optional dictionary that accumulates the token usage of the call.
+    :param model: Model of the decision (defaults to the model of the "decision" stage).
+    :return: Final decision with confidence.
+    """
+    return run_sync(make_final_decision_async(claim, analyses, usage=usage, model=model))
+
+async def make_final_decision_async(claim, analyses, usage=None, model=None):
+    """
+    Async version of make_final_decision.
+    """
+    print('decision with analyses')
+    with tracing.span("make_final_decision", evidence=len(analyses)):
+        return parse_decision(await structured_chat_completion_async(build_decision_messages(claim, analyses), "decision", usage=usage,
+                                                                     priority=PRIORITY_HIGH, model=model))
+
+async def escalate_decision_async(claim, analyses, usage=None):
+    """
+    Decides the claim again with ESCALATION_MODEL, on all analyses of the earlier rounds.
+
+    :param claim: The claim to verify.
+    :param analyses: List of analysis dictionaries.
+    :param usage: Optional dictionary that accumulates the token usage of the call.
+    :return: Decision of the escalation model with confidence.
+    """
+    with tracing.span("escalate_decision", evidence=len(analyses)):
+        return await make_final_decision_async(claim, analyses, usage=usage, model=ESCALATION_MODEL)
+
+def is_confident(decision):
+    """
+    :param decision: Decision dictionary.
+    :return: True if the decision is real/fake with a confidence at or above CONFIDENCE_THRESHOLD.
+    """
+    return decision["decision"] != "NEI" and decision["confidence"] >= CONFIDENCE_THRESHOLD
+
+def tally_analyses(analyses):
+    """
+    Sums the confidence of supporting and negating analyses without calling the LLM.
+
+    :param analyses: List of analysis dictionaries.
+    :return: Tuple (support_score, negate_score).
+    """
+    support_score = 0
+    negate_score = 0
+    for analysis in analyses:
+        label = analysis.get('support_or_contradict_or_unrelated')
+        if label == "support":
+            support_score += analysis.get('confidence', 0)
+        elif label in ("negate", "contradict"):
+            negate_score += analysis.get('confidence', 0)
+    return support_score, negate_score
+
+def decision_points(analyses, policy=None, decided=0):
+    """
+    Yields the number of leading analyses after which the aggregation policy asks for a decision.
+
+    :param analyses: List of analysis dictionaries, in search-rank order.
+    :param policy: "once" or "incremental" (defaults to AGGREGATION_POLICY).
+    :param decided: Number of leading analyses already decided on in earlier rounds; only later points are yielded.
+    """
+    if policy is None:
+        policy = AGGREGATION_POLICY
+    if policy == "once":
+        yield len(analyses)
+        return
+    if policy != "incremental":
+        raise ValueError(f"Unknown aggregation policy: {policy}")
+
+    support_score, negate_score = tally_analyses(analyses[:decided])
+    tally_crossed = abs(support_score - negate_score) >= TALLY_THRESHOLD
+    for n in range(decided + 1, len(analyses) + 1):
+        support_score, negate_score = tally_analyses(analyses[:n])
+        crossed = abs(support_score - negate_score) >= TALLY_THRESHOLD
+        if n % DECISION_EVERY_K == 0 or n == len(analyses) or (crossed and not tally_crossed):
+            yield n
+        tally_crossed = crossed
+
+def aggregate_analyses(claim, analyses, policy=None, usage=None, decided=0):
+    """
+    Turns the analyses of a round into a decision according to the aggregation policy.
+    The incremental policy stops at the first confident decision.
+
+    :param claim: The claim to verify.
+    :param analyses: List of analysis dictionaries, in search-rank order.
+    :param policy: "once" or "incremental" (defaults to AGGREGATION_POLICY).
+    :param usage: Optional dictionary that accumulates the token usage of the decision calls.
+    :param decided: Number of leading analyses whose decision points were already tried in earlier rounds.
+    :return: Tuple (decision, number of analyses the decision is based on).
+    """
+    return run_sync(aggregate_analyses_async(claim, analyses, policy=policy, usage=usage, decided=decided))
+
+async def aggregate_analyses_async(claim, analyses, policy=None, usage=None, decided=0):
+    """
+    Async version of aggregate_analyses.
+    """
+    decision, used = None, 0
+    for n in decision_points(analyses, policy, decided):
+        decision, used = await make_final_decision_async(claim, analyses[:n], usage=usage), n
+        if is_confident(decision):
+            break
+    return decision, used
+
+def generate_explanation2(claim, decision, confidence):
+    """
+    Generates an explanation for the final decision, including reasons, the label, and supporting evidence links. 
+    If no evidence is available, prompts GPT to generate an explanation based solely on the claim text and the decision.
+
+    :param claim: The claim to verify.
+    :param decision: The final decision ("real", "fake", or "NEI").
+    :param confidence: The confidence score as a percentage.
+    :return: A list of dictionaries containing the explanation components (title, rationale, link, etc.)
+    """
+    return run_sync(generate_explanation2_async(claim, decision, confidence))
+
+async def generate_explanation2_async(claim, decision, confidence):
+    """
+    Async version of generate_explanation2.
+    """
+    with tracing.span("generate_explanation", evidence=0):
+        output = await structured_chat_completion_async(build_claim_only_explanation_messages(claim, decision, confidence), "explanation", priority=PRIORITY_HIGH)
+    return build_claim_only_explanation(decision, confidence, output)
+
+
+def build_triage_explanation(decision, margin):
+    """
+    :param decision: Decision of the triage classifier.
+    :param margin: Probability margin of the decision.
+    :return: Explanation of a decision made by the triage classifier, in the format of generate_explanation.
+    """
+    return [
+        {"type": "label", "label": decision["decision"], "confidence": decision["confidence"]},
+        {"type": "triage", "content": f"Decided by the local triage classifier (probability margin {margin:.2f}) "
+                                      "without searching for evidence."},
+    ]
 
 def generate_explanation(claim, decision, confidence, analyses):
     """
@@ -486,108 +1261,322 @@ def generate_explanation(claim, decision, confidence, analyses):
 
 # -------------------------- Main Processing Function -------------------------- #
 
-def process_content(content):
+def _emit(on_event, event, **fields):
+    if on_event is not None:
+        on_event(dict(event=event, **fields))
+
+async def process_content_async(content, stats=None, on_event=None):
     """
     Processes the input content to determine if it's fake, real, or NEI.
 
+    The key claim and the search query are computed once per input. Each retry round requests
+    the next page of search results, skips links that were already analyzed and carries the
+    earlier analyses forward, so only new evidence is sent to the analyzer.
+
     :param content: Input text content.
+    :param stats: Optional dictionary that receives per-claim statistics (key claim and analyses, rounds, aggregation
+                  policy, number of decision calls and their prompt tokens, per-stage totals of the tracing spans).
+    :param on_event: Optional callable that receives a dictionary for every pipeline event as it happens
+                     ("triage", "claim", "round", "analysis", "decision", "escalation" and "explanation").
     :return: Final decision with confidence and explanation.
     """
+    with tracing.claim_trace(uuid.uuid4().hex[:16]) as trace:
+        with tracing.span("process_content"):
+            result = await _process_content_async(content, stats=stats, on_event=on_event)
+    if stats is not None:
+        stats["stages"] = trace.totals()
+        stats["tiers"] = trace.model_totals()
+        stats["llm_calls"] = sum(record["calls"] for record in trace.spans)
+        stats["prompt_tokens"] = sum(record["prompt_tokens"] for record in trace.spans)
+        stats["completion_tokens"] = sum(record["completion_tokens"] for record in trace.spans)
+    return result
+
+async def _process_content_async(content, stats, on_event):
+    # Step 0: Decide confident inputs with the local triage classifier
+    if TRIAGE:
+        with tracing.span("triage"):
+            decision, label, margin = get_triage().decide(content, TRIAGE_MARGIN)
+        if stats is not None:
+            stats.update(triage_label=label, triage_margin=round(margin, 4), triage_decided=decision is not None)
+        if decision is not None:
+            decision["decided_by"] = "triage"
+            explanation = build_triage_explanation(decision, margin)
+            print(f"Triage Decision: {decision['decision']} with confidence {decision['confidence']}% (margin {margin:.2f})")
+            _emit(on_event, "triage", decision=decision['decision'], confidence=decision['confidence'], margin=round(margin, 4))
+            _emit(on_event, "explanation", round=0, explanation=explanation)
+            if stats is not None:
+                stats["rounds"] = 0
+            return decision, explanation
+
     round_number = 1
     final_decision = {"decision": "NEI", "confidence": 0}
     explanation = []
+    decision_usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    analysis_usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "fallbacks": 0, "memo_hits": 0}
+    article_report = {"fetched": 0, "failed": 0, "enriched": 0}
+    analysis_seconds = 0.0
+    budget_exhausted = False
+    rounds_avoided = 0
+    first_tier_decision = None
+    escalation_usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    key_claim = None
+    query = None
+    round_trace = []
+    settled_round = None
+    setup_start = time.perf_counter()
+
+    def trace_round(retrieved, new_analyses=(), decision=None, **fields):
+        # Compact record of one round for replaying the claim with simulate.py
+        round_trace.append(dict(
+            round=round_number, retrieved=retrieved,
+            links=[analysis.get('link') for analysis in new_analyses],
+            analyses=[[analysis.get('support_or_contradict_or_unrelated'), analysis.get('confidence', 0)] for analysis in new_analyses],
+            decision=[decision['decision'], decision['confidence']] if decision is not None else None,
+            analysis_calls=analysis_usage["calls"] - round_usage[0], decision_calls=decision_usage["calls"] - round_usage[1],
+            prompt_tokens=analysis_usage["prompt_tokens"] + decision_usage["prompt_tokens"] - round_usage[2],
+            seconds=round(time.perf_counter() - round_start, 3), **fields))
 
-    while round_number <= MAX_ROUNDS:
-        print(f"\n--- Round {round_number} ---")
-    
+    try:
         # Step 1: Extract key claim
-        key_claim = extract_key_claim(content)
+        key_claim = await extract_key_claim_async(content)
         print(f"Extracted Key Claim: {key_claim}")
-    
+
         # Step 2: Generate search query
-        query = generate_query(key_claim)
+        query = await generate_query_async(key_claim)
         print(f"Generated Search Query: {query}")
+        _emit(on_event, "claim", key_claim=key_claim, query=query)
+    except BudgetExhausted as e:
+        print(f"{e}. Returning NEI.")
+        round_number = MAX_ROUNDS + 1
+        budget_exhausted = True
+
+    analyses = []
+    seen_links = set()
+    evidence_filter = EvidenceFilter(key_claim, top_n=EVIDENCE_TOP_N) if EVIDENCE_FILTER and not budget_exhausted else None
+    setup_seconds = time.perf_counter() - setup_start
+
+    while round_number <= MAX_ROUNDS:
+        print(f"\n--- Round {round_number} ---")
+        round_start = time.perf_counter()
+        round_usage = (analysis_usage["calls"], decision_usage["calls"], analysis_usage["prompt_tokens"] + decision_usage["prompt_tokens"])
     
-        # Step 3: Perform Google search
+        # Step 3: Retrieve evidence (Google search by default), asking for the next page of results in each round
         try:
-            search_results = google_search(query, result_total=10)
-            print(f"Number of Search Results Retrieved: {len(search_results)}")
-            if len(search_results) != 0:
-                # Step 4: Analyze search results
-                analyses = []
-                for idx, item in enumerate(search_results, 1):
-                    snippet = item.get('snippet', 'No snippet provided.')
-                    link = item.get('link', 'No link provided.')
-                    title = item.get('title', 'No title provided.')
-                    search_result = f"Title: {title}\nLink: {link}\nSnippet: {snippet}"
-                    print(f"\nAnalyzing Search Result {idx}:")
-                    print(search_result)
-                    analysis = analyze_search_result(search_result, key_claim)
+            start = (round_number - 1) * RESULTS_PER_ROUND + 1
+            with tracing.span("search", round=round_number):
+                search_results = await get_retriever().search_async(query, result_total=RESULTS_PER_ROUND, start=start)
+            new_results = [item for item in search_results if item.get('link') not in seen_links]
+            seen_links.update(item.get('link') for item in new_results)
+            print(f"Number of Search Results Retrieved: {len(search_results)} ({len(new_results)} new)")
+            if evidence_filter is not None and new_results:
+                new_results = evidence_filter.filter(new_results)
+                print(f"Search Results Kept After Filtering: {len(new_results)}")
+                if not new_results:
+                    print("All new search results were filtered out. Initiating another retrieval round.")
+                    _emit(on_event, "round", round=round_number, retrieved=len(search_results), new=0)
+                    trace_round(len(search_results))
+                    round_number += 1
+                    continue
+            _emit(on_event, "round", round=round_number, retrieved=len(search_results), new=len(new_results))
+            if len(new_results) != 0 and ARTICLE_FETCH:
+                # Step 3b: Enrich the results to analyze with passages of the linked articles
+                with tracing.span("fetch_articles", round=round_number, results=len(new_results)):
+                    new_results = await enrich_results_async(new_results, key_claim, report=article_report)
+                print(f"Search Results Enriched With Article Passages: {sum(bool(item.get('passages')) for item in new_results)}")
+            if len(new_results) != 0:
+                # Step 4: Analyze the new search results of the round (concurrently, or in one fused request)
+                analysis_start = time.perf_counter()
+                new_analyses = await analyze_round_async(new_results, key_claim, usage=analysis_usage)
+                analysis_seconds += time.perf_counter() - analysis_start
+                for idx, analysis in enumerate(new_analyses, len(analyses) + 1):
+                    print(f"\nSearch Result {idx} Analysis:")
+                    print(f"Title: {analysis['title']}\nLink: {analysis['link']}")
                     pprint(analysis)
-                    # Ensure that title and link are correctly assigned
-                    analysis['title'] = title
-                    analysis['link'] = link
-                    analyses.append(analysis)
+                analyses.extend(new_analyses)
+                _emit(on_event, "analysis", round=round_number, analyses=new_analyses)
     
-                    # Step 5: Make final decision using LLM
-                    decision = make_final_decision(key_claim, analyses)
-                    print(f"\nFinal Decision: {decision['decision']} with confidence {decision['confidence']}%")
+                # Step 5: Aggregate the analyses of all rounds into a decision using LLM
+                rescued = decision_usage.get("rescued", 0)
+                decision_start = time.perf_counter()
+                # Decision points of the earlier rounds were not confident, so only the new ones are tried
+                decision, used = await aggregate_analyses_async(key_claim, analyses, usage=decision_usage,
+                                                                decided=len(analyses) - len(new_analyses))
+                decision_seconds = time.perf_counter() - decision_start
+                if (decision_usage.get("rescued", 0) > rescued and is_confident(decision) and round_number < MAX_ROUNDS
+                        and settled_round is None):
+                    # Without repairing or re-requesting the decision output, it would have fallen back to NEI
+                    rounds_avoided += 1
+                print(f"\nFinal Decision: {decision['decision']} with confidence {decision['confidence']}% (based on {used} results)")
+                _emit(on_event, "decision", round=round_number, decision=decision['decision'], confidence=decision['confidence'], used=used)
     
-                    # Step 6: Generate explanation
-                    explanation = generate_explanation(key_claim, decision['decision'], decision['confidence'], analyses)
-                    print("\n=== Explanation ===")
-                    print(explanation)
-                    # Check if we need to re-trigger retrieval
-                    if decision["decision"] != "NEI" and decision["confidence"] >= CONFIDENCE_THRESHOLD:
-                        final_decision = decision
-                        break
-                    else:
-                        final_decision = decision
-                        round_number += 1
-                        print("Confidence below threshold or NEI. Initiating another retrieval round.")
+                # Step 6: Generate explanation
+                with tracing.span("generate_explanation", evidence=used):
+                    round_explanation = generate_explanation(key_claim, decision['decision'], decision['confidence'], analyses[:used])
+                print("\n=== Explanation ===")
+                print(round_explanation)
+                _emit(on_event, "explanation", round=round_number, explanation=round_explanation)
+                trace_round(len(search_results), new_analyses, decision, decision_seconds=round(decision_seconds, 3))
+                # In the full trace mode, the rounds after the first confident decision are only traced
+                if settled_round is None:
+                    final_decision, explanation = decision, round_explanation
+                    if is_confident(decision):
+                        settled_round = round_number
+                # Check if we need to re-trigger retrieval
+                if settled_round is not None and not FULL_TRACE:
+                    break
+                round_number += 1
+                if settled_round is None:
+                    print("Confidence below threshold or NEI. Initiating another retrieval round.")
+            elif analyses:
+                # No new evidence available, keep the decision based on the evidence of earlier rounds
+                print("No new search results. Keeping the decision of the previous round.")
+                trace_round(len(search_results))
+                break
             else:
                 # Step 5: Make final decision using LLM
-                decision = make_final_decision2(key_claim)
+                decision = await make_final_decision2_async(key_claim, usage=decision_usage)
                 print(f"\nFinal Decision: {decision['decision']} with confidence {decision['confidence']}%")
+                _emit(on_event, "decision", round=round_number, decision=decision['decision'], confidence=decision['confidence'], used=0)
     
                 # Step 6: Generate explanation
-                explanation = generate_explanation2(key_claim, decision['decision'], decision['confidence'])
+                final_decision = decision
+                explanation = await generate_explanation2_async(key_claim, decision['decision'], decision['confidence'])
                 print("\n=== Explanation ===")
                 print(explanation)
+                _emit(on_event, "explanation", round=round_number, explanation=explanation)
+                trace_round(len(search_results), decision=decision, claim_only=True)
                 break
     
             
+        except BudgetExhausted as e:
+            # Keep the decision reached so far (NEI if there is none)
+            print(f"{e}. Keeping the current decision.")
+            budget_exhausted = True
+            break
         except Exception as e:
-            print(f"Google Search Error: {e}")
-            #break  # Exit if search fails   
-            
-    
+            print(f"Round {round_number} failed: {e}")
+            trace_round(0, error=type(e).__name__)
+            round_number += 1
+
+    # Step 7: Escalate claims the first-tier model could not decide confidently
+    if CASCADE and analyses and not budget_exhausted and not is_confident(final_decision):
+        try:
+            decision = await escalate_decision_async(key_claim, analyses, usage=escalation_usage)
+            print(f"\nEscalated Decision ({ESCALATION_MODEL}): {decision['decision']} with confidence {decision['confidence']}%")
+            _emit(on_event, "escalation", model=ESCALATION_MODEL, decision=decision['decision'], confidence=decision['confidence'],
+                  used=len(analyses))
+            first_tier_decision = final_decision
+            final_decision = decision
+            explanation = generate_explanation(key_claim, decision['decision'], decision['confidence'], analyses)
+            _emit(on_event, "explanation", round=min(round_number, MAX_ROUNDS), explanation=explanation)
+        except BudgetExhausted as e:
+            print(f"{e}. Keeping the first-tier decision.")
+            budget_exhausted = True
+
     print("\n=== Final Decision ===")
     pprint(final_decision)
+    print(f"Decision calls: {decision_usage['calls']}, decision prompt tokens: {decision_usage['prompt_tokens']} (policy: {AGGREGATION_POLICY})")
+    print(f"Analysis calls: {analysis_usage['calls']}, analysis tokens: {analysis_usage['prompt_tokens']} prompt / "
+          f"{analysis_usage['completion_tokens']} completion, {analysis_seconds:.2f}s (mode: {ANALYSIS_MODE})")
+    if stats is not None:
+        stats["key_claim"] = key_claim
+        stats["analyses"] = analyses
+        # No round ran when the budget ran out before the query was generated
+        stats["rounds"] = 0 if query is None else settled_round or min(round_number, MAX_ROUNDS)
+        stats["aggregation_policy"] = AGGREGATION_POLICY
+        stats["decision_calls"] = decision_usage["calls"]
+        stats["decision_prompt_tokens"] = decision_usage["prompt_tokens"]
+        stats["budget_exhausted"] = budget_exhausted
+        stats["analysis_mode"] = ANALYSIS_MODE
+        stats["analysis_calls"] = analysis_usage["calls"]
+        stats["analysis_prompt_tokens"] = analysis_usage["prompt_tokens"]
+        stats["analysis_completion_tokens"] = analysis_usage["completion_tokens"]
+        stats["analysis_fallbacks"] = analysis_usage["fallbacks"]
+        stats["analysis_seconds"] = round(analysis_seconds, 3)
+        stats["analysis_memo_hits"] = analysis_usage["memo_hits"]
+        stats["articles_fetched"] = article_report["fetched"]
+        stats["articles_failed"] = article_report["failed"]
+        stats["articles_enriched"] = article_report["enriched"]
+        stats["outputs_rescued"] = analysis_usage.get("rescued", 0) + decision_usage.get("rescued", 0)
+        stats["rounds_avoided"] = rounds_avoided
+        stats["escalated"] = first_tier_decision is not None
+        stats["first_tier_decision"] = first_tier_decision or final_decision
+        stats["escalation_calls"] = escalation_usage["calls"]
+        stats["escalation_prompt_tokens"] = escalation_usage["prompt_tokens"]
+        stats["round_trace"] = {"key_claim": key_claim, "query": query, "setup_seconds": round(setup_seconds, 3),
+                                "full": FULL_TRACE, "max_rounds": MAX_ROUNDS, "confidence_threshold": CONFIDENCE_THRESHOLD,
+                                "settled_round": settled_round, "rounds": round_trace}
+        if evidence_filter is not None:
+            stats["evidence_filter"] = dict(evidence_filter.report)
+            stats["analysis_calls_saved"] = evidence_filter.calls_saved
     return final_decision, explanation
+
+async def process_many_async(contents, concurrency=PROCESS_MANY_CONCURRENCY, stats=None):
+    """
+    Processes many inputs concurrently on the running event loop.
+
+    :param contents: List of input text contents.
+    :param concurrency: Maximum number of inputs in flight at once.
+    :param stats: Optional list that receives one statistics dictionary per input.
+    :return: List of (final decision, explanation) tuples, in input order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    claim_stats = [{} for _ in contents]
+
+    async def process(content, content_stats):
+        async with semaphore:
+            return await process_content_async(content, stats=content_stats)
+
+    results = await asyncio.gather(*(process(content, content_stats) for content, content_stats in zip(contents, claim_stats)))
+    if stats is not None:
+        stats.extend(claim_stats)
+    return list(results)
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine on a fresh event loop and closes the async clients it opened.
+
+    :param coroutine: Coroutine to run.
+    :return: The result of the coroutine.
+    """
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await aclose_clients()
+    return asyncio.run(run())
+
+def process_content(content, stats=None):
+    """
+    Blocking wrapper around process_content_async.
+
+    :param content: Input text content.
+    :param stats: Optional dictionary that receives per-claim statistics.
+    :return: Final decision with confidence and explanation.
+    """
+    return run_sync(process_content_async(content, stats=stats))
+
+def process_many(contents, concurrency=PROCESS_MANY_CONCURRENCY, stats=None):
+    """
+    Blocking entry point that keeps up to `concurrency` inputs in flight in a single event loop.
+
+    :param contents: List of input text contents.
+    :param concurrency: Maximum number of inputs in flight at once.
+    :param stats: Optional list that receives one statistics dictionary per input.
+    :return: List of (final decision, explanation) tuples, in input order.
+    """
+    return run_sync(process_many_async(contents, concurrency=concurrency, stats=stats))
             
 
 if __name__ == "__main__":
     content = input("Enter the content to verify: ")
-    decision, explanation = process_content(content)
-
-    # Create output directory if it doesn't exist
-    output_dir = "timestamps"
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Generate timestamped filename
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    # filename = f"result_{timestamp}.json"
-    filename = os.path.join(output_dir, f"result_{timestamp}.json")
-
-    # Save output
-    output = {
-        "input": content,
-        "decision": decision,
-        "explanation": explanation
-    }
-
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    stats = {}
+    start = time.perf_counter()
+    decision, explanation = process_content(content, stats=stats)
+
+    # Append the result to the results file of the single-claim runs
+    filename = os.path.join("timestamps", "results.jsonl")
+    with ResultsSink(filename) as sink:
+        sink.write(result_record(content, decision, explanation, stats, seconds=time.perf_counter() - start))
 
     print(f"\n✅ Results saved to {filename}")
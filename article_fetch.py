@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import math
+import os
+import time
+import weakref
+from collections import Counter
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import tracing
+from cache import DiskCache, make_key
+from retrieval import tokenize
+from search import load_backends
+
+# -------------------------- Configuration -------------------------- #
+
+# Connection pool, per-host limit and timeouts of the article downloads
+ARTICLE_POOL_SIZE = 32
+ARTICLE_CONCURRENCY = 16  # Downloads in flight per event loop
+ARTICLE_PER_HOST = 2  # Downloads in flight per host
+ARTICLE_CONNECT_TIMEOUT = 3  # Seconds
+ARTICLE_TIMEOUT = 8  # Seconds per read
+ARTICLE_DEADLINE = 12  # Seconds per download, including redirects and slow servers
+ARTICLE_MAX_REDIRECTS = 5
+ARTICLE_USER_AGENT = "Mozilla/5.0 (compatible; AA2S evidence fetcher)"
+
+# Only the first ARTICLE_MAX_BYTES of a page are downloaded, and at most ARTICLE_MAX_CHARS of extracted text are kept
+ARTICLE_MAX_BYTES = 1_000_000
+ARTICLE_MAX_CHARS = 50_000
+ARTICLE_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+# Persistent URL -> extracted text cache, bounded in size. Failed downloads are retried after ARTICLE_ERROR_TTL
+ARTICLE_CACHE_PATH = os.getenv('ARTICLE_CACHE_PATH', os.path.join('.cache', 'article_cache.sqlite'))
+ARTICLE_CACHE_MODE = os.getenv('ARTICLE_CACHE_MODE', 'readwrite')
+ARTICLE_CACHE_TTL = 7 * 24 * 3600  # Seconds
+ARTICLE_CACHE_MAX_BYTES = 500_000_000
+ARTICLE_ERROR_TTL = 3600  # Seconds
+
+# Passages: paragraphs shorter than MIN_PARAGRAPH_WORDS (menus, bylines, buttons) are dropped, the rest are
+# merged into passages of about PASSAGE_WORDS words, and the PASSAGES_PER_ARTICLE most relevant ones are kept
+MIN_PARAGRAPH_WORDS = 6
+PASSAGE_WORDS = 120
+PASSAGES_PER_ARTICLE = 3
+
+# -------------------------- Shared Client and Cache -------------------------- #
+
+_article_cache = None
+
+
+def get_article_cache():
+    """
+    Returns the shared article cache, opening it on first use.
+
+    :return: DiskCache instance.
+    """
+    global _article_cache
+    if _article_cache is None:
+        _article_cache = DiskCache(ARTICLE_CACHE_PATH, mode=ARTICLE_CACHE_MODE, ttl=ARTICLE_CACHE_TTL,
+                                   max_bytes=ARTICLE_CACHE_MAX_BYTES)
+    return _article_cache
+
+# Async clients and semaphores are bound to an event loop, so they are kept per loop
+_loop_resources = weakref.WeakKeyDictionary()
+
+
+def _get_loop_resources():
+    loop = asyncio.get_running_loop()
+    resources = _loop_resources.get(loop)
+    if resources is None:
+        httpx = load_backends().httpx
+        limits = httpx.Limits(max_connections=ARTICLE_POOL_SIZE, max_keepalive_connections=ARTICLE_POOL_SIZE)
+        timeout = httpx.Timeout(ARTICLE_TIMEOUT, connect=ARTICLE_CONNECT_TIMEOUT)
+        resources = {
+            "client": httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True,
+                                        max_redirects=ARTICLE_MAX_REDIRECTS, headers={"User-Agent": ARTICLE_USER_AGENT}),
+            "semaphore": asyncio.Semaphore(ARTICLE_CONCURRENCY),
+            "hosts": {},
+            "pending": {},  # URL -> download in flight, shared by the claims that need the same page
+        }
+        _loop_resources[loop] = resources
+    return resources
+
+
+async def aclose_article_client():
+    """
+    Closes the async HTTP client of the running event loop, if one was opened.
+    """
+    resources = _loop_resources.pop(asyncio.get_running_loop(), None)
+    if resources is not None:
+        await resources["client"].aclose()
+
+# -------------------------- Text Extraction -------------------------- #
+
+class _TextExtractor(HTMLParser):
+    # Elements whose text is never evidence
+    SKIP = {"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form",
+            "button", "select", "iframe"}
+    # Elements that end a paragraph
+    BLOCKS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+              "blockquote", "pre", "table", "tr", "td", "th", "dd", "dt", "br", "figcaption"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = []
+        self.paragraphs = []  # (text, inside an article or main element)
+        self._current = []
+        self._skip = 0
+        self._main = 0
+        self._in_title = False
+
+    def _flush(self):
+        text = " ".join("".join(self._current).split())
+        if text:
+            self.paragraphs.append((text, self._main > 0))
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        if tag in self.BLOCKS:
+            self._flush()
+        if tag in ("article", "main"):
+            self._main += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title":
+            self._in_title = False
+        if tag in self.BLOCKS:
+            self._flush()
+        if tag in ("article", "main"):
+            self._main = max(0, self._main - 1)
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title.append(data)
+        elif not self._skip:
+            self._current.append(data)
+
+
+def extract_text(body, content_type="text/html"):
+    """
+    Extracts the main text of a page. When the page marks its content with <article> or <main>
+    elements, only their paragraphs are kept; short paragraphs (menus, bylines) are dropped.
+
+    :param body: Decoded page content.
+    :param content_type: Content type of the page (HTML or plain text).
+    :return: Dictionary with the page title and the list of its paragraphs.
+    """
+    if "html" not in content_type:
+        paragraphs = [" ".join(block.split()) for block in body.split("\n\n")]
+        title = ""
+    else:
+        parser = _TextExtractor()
+        parser.feed(body)
+        parser.close()
+        parser._flush()
+        main = [text for text, in_main in parser.paragraphs if in_main]
+        paragraphs = main if sum(len(text) for text in main) >= 500 else [text for text, _ in parser.paragraphs]
+        title = " ".join("".join(parser.title).split())
+
+    kept, size = [], 0
+    for paragraph in paragraphs:
+        if len(paragraph.split()) < MIN_PARAGRAPH_WORDS:
+            continue
+        kept.append(paragraph[:ARTICLE_MAX_CHARS - size])
+        size += len(kept[-1])
+        if size >= ARTICLE_MAX_CHARS:
+            break
+    return {"title": title, "paragraphs": kept}
+
+
+def select_passages(paragraphs, claim, top_k=PASSAGES_PER_ARTICLE, words=PASSAGE_WORDS):
+    """
+    Splits the paragraphs of an article into passages of about `words` words and keeps the ones
+    most relevant to the claim (BM25 over the passages of the article).
+
+    :param paragraphs: List of paragraphs of the article.
+    :param claim: The key claim.
+    :param top_k: Maximum number of passages kept.
+    :param words: Approximate passage length in words.
+    :return: List of passages in article order; empty if no passage shares a term with the claim.
+    """
+    passages, current = [], []
+    for paragraph in paragraphs:
+        tokens = paragraph.split()
+        if current and len(current) + len(tokens) > words:
+            passages.append(" ".join(current))
+            current = []
+        for i in range(0, len(tokens), words):
+            chunk = tokens[i:i + words]
+            if len(chunk) == words:
+                passages.append(" ".join(chunk))
+            else:
+                current.extend(chunk)
+    if current:
+        passages.append(" ".join(current))
+
+    claim_terms = set(tokenize(claim))
+    if not passages or not claim_terms:
+        return []
+    counts = [Counter(tokenize(passage)) for passage in passages]
+    lengths = [sum(count.values()) for count in counts]
+    avg_length = sum(lengths) / len(lengths) or 1.0
+    idf = {}
+    for term in claim_terms:
+        df = sum(term in count for count in counts)
+        idf[term] = math.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+    k1, b = 1.5, 0.75
+    scores = []
+    for count, length in zip(counts, lengths):
+        norm = k1 * (1 - b + b * length / avg_length)
+        scores.append(sum(idf[term] * count[term] * (k1 + 1) / (count[term] + norm) for term in claim_terms if term in count))
+    best = sorted((i for i in range(len(passages)) if scores[i] > 0), key=lambda i: -scores[i])[:top_k]
+    return [passages[i] for i in sorted(best)]
+
+# -------------------------- Article Fetching -------------------------- #
+
+async def _download(client, url):
+    # Streams the page and stops reading after ARTICLE_MAX_BYTES
+    async with client.stream("GET", url) as response:
+        if response.status_code != 200:
+            raise Exception(f"status code {response.status_code}")
+        content_type = response.headers.get("content-type", "").lower()
+        if not any(allowed in content_type for allowed in ARTICLE_CONTENT_TYPES):
+            raise Exception(f"unsupported content type {content_type or 'unknown'}")
+        chunks, size = [], 0
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= ARTICLE_MAX_BYTES:
+                break
+        body = b"".join(chunks)[:ARTICLE_MAX_BYTES]
+        return body.decode(response.charset_encoding or "utf-8", errors="replace"), content_type
+
+
+async def fetch_article_async(url):
+    """
+    Downloads a page and extracts its text, using the persistent article cache. Downloads share a
+    pooled client and are limited per event loop and per host.
+
+    :param url: URL of the page.
+    :return: Dictionary with the url, title and paragraphs of the page, or with an "error" field if it could not be fetched.
+    """
+    host = urlsplit(url).hostname or ""
+    with tracing.span("fetch_article", host=host):
+        cache = get_article_cache()
+        key = make_key("article", url)
+        page = cache.get(key)
+        if page is not None and (page.get("error") is None or time.time() - page["fetched_at"] < ARTICLE_ERROR_TTL):
+            tracing.record_cache_hit()
+            return page
+
+        resources = _get_loop_resources()
+        pending = resources["pending"].get(url)
+        if pending is None:
+            pending = asyncio.ensure_future(_fetch_and_store(resources, url, host, key))
+            resources["pending"][url] = pending
+            pending.add_done_callback(lambda _: resources["pending"].pop(url, None))
+        # Shielded, so a cancelled claim does not cancel the download for the others
+        return await asyncio.shield(pending)
+
+
+async def _fetch_and_store(resources, url, host, key):
+    host_semaphore = resources["hosts"].setdefault(host, asyncio.Semaphore(ARTICLE_PER_HOST))
+    try:
+        # The host slot is taken first, so downloads waiting on a busy host do not hold global slots
+        async with host_semaphore, resources["semaphore"]:
+            body, content_type = await asyncio.wait_for(_download(resources["client"], url), ARTICLE_DEADLINE)
+        page = {"url": url, **extract_text(body, content_type)}
+    except Exception as e:
+        page = {"url": url, "error": f"{type(e).__name__}: {e}"}
+    page["fetched_at"] = time.time()
+    get_article_cache().set(key, page)
+    return page
+
+
+async def enrich_results_async(items, claim, report=None):
+    """
+    Fetches the linked pages of search result items concurrently and attaches the passages most
+    relevant to the claim. Items whose page cannot be fetched or has no relevant passage keep their snippet only.
+
+    :param items: Search result items with title, link and snippet.
+    :param claim: The key claim.
+    :param report: Optional dictionary that accumulates the "fetched", "failed" and "enriched" counts.
+    :return: List of the items, in the same order, with a "passages" field where passages were found.
+    """
+    async def enrich(item):
+        link = item.get('link')
+        if not link or not link.startswith(("http://", "https://")):
+            return item, None
+        page = await fetch_article_async(link)
+        return item, page
+
+    enriched = []
+    for item, page in await asyncio.gather(*(enrich(item) for item in items)):
+        passages = select_passages(page.get("paragraphs", []), claim) if page is not None else []
+        if report is not None and page is not None:
+            key = "failed" if page.get("error") else "fetched"
+            report[key] = report.get(key, 0) + 1
+            report["enriched"] = report.get("enriched", 0) + bool(passages)
+        enriched.append(dict(item, passages=passages) if passages else item)
+    return enriched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch pages and show the passages selected for a claim.")
+    parser.add_argument("urls", nargs="+", help="Pages to fetch (for example from a local HTTP server)")
+    parser.add_argument("--claim", required=True, help="Key claim used to select the passages")
+    args = parser.parse_args()
+
+    async def main():
+        report = {}
+        start = time.perf_counter()
+        items = await enrich_results_async([{"link": url} for url in args.urls], args.claim, report=report)
+        elapsed = time.perf_counter() - start
+        await aclose_article_client()
+        for item in items:
+            print(f"\n{item['link']}")
+            for passage in item.get("passages", []):
+                print(f"  - {passage}")
+        print(f"\n{report} in {elapsed:.2f}s, cache: {get_article_cache().stats()}")
+
+    asyncio.run(main())
@@ -0,0 +1,321 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import agents_LLM_RAG as agents
+from results_sink import ResultsSink
+
+# -------------------------- Offline Batch Evaluation -------------------------- #
+#
+# The pipeline is split into stages (claim extraction, query generation, search, per-result
+# analysis, decision, claim-only explanation). Each LLM stage writes all of its requests to one
+# job file in OpenAI Batch API JSONL format, a backend turns the job file into a results file,
+# and the parsed results feed the next stage. Only one retrieval round is run per claim.
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TEMPERATURE = 0.3
+
+
+def batch_request(custom_id, messages, response_format=None, model=None):
+    """
+    Builds one line of a Batch API job file.
+
+    :param custom_id: Identifier used to match the result to the request.
+    :param messages: List of chat messages.
+    :param response_format: Optional response_format of the request.
+    :param model: Model of the request (defaults to agents.llm_model).
+    :return: Dictionary in Batch API request format.
+    """
+    body = {"model": model or agents.llm_model, "messages": messages, "temperature": TEMPERATURE}
+    if response_format is not None:
+        body["response_format"] = response_format
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": body,
+    }
+
+
+def stub_responder(body):
+    """
+    Deterministic stand-in for the chat model, answering every stage with well-formed JSON.
+    Decisions are a fixed real or fake verdict derived from the prompt, so the report has decided claims.
+
+    :param body: Request body with the chat messages.
+    :return: The response content as a string.
+    """
+    system = body["messages"][0]["content"]
+    user = body["messages"][-1]["content"]
+    if "extracts key claims" in system:
+        content = user.split("Input content:", 1)[-1].split("Please output", 1)[0].strip()
+        return json.dumps({"key_claim": content})
+    if "generates search queries" in system:
+        claim = user.split("Claim:", 1)[-1].split("Please output", 1)[0].strip()
+        return json.dumps({"query": claim})
+    if "analyzes search results" in system:
+        return json.dumps({"support_or_contradict_or_unrelated": "baseless", "confidence": 50,
+                           "rationale": "Stub analysis."})
+    if "final decisions" in system:
+        digest = hashlib.sha256(user.encode("utf-8")).digest()
+        return json.dumps({"decision": "real" if digest[0] % 2 else "fake", "confidence": 60 + digest[1] % 40})
+    return json.dumps({"explanation": "Stub explanation."})
+
+
+def stub_search(query, result_total=10):
+    """
+    Deterministic stand-in for google_search that returns one synthetic result echoing the query.
+
+    :param query: The search query string.
+    :param result_total: Total number of results desired (ignored).
+    :return: List of search result items.
+    """
+    return [{"title": f"Result for {query}", "link": "https://example.com/stub", "snippet": query}]
+
+
+class LocalBatchBackend:
+    """
+    Consumes Batch API job files locally, without network access.
+    """
+
+    def __init__(self, responder=None):
+        """
+        :param responder: Function mapping a request body to the response content (defaults to stub_responder).
+        """
+        self.responder = responder or stub_responder
+
+    def run(self, requests_path, results_path):
+        with open(requests_path, encoding="utf-8") as f, open(results_path, "w", encoding="utf-8") as out:
+            for i, line in enumerate(f):
+                request = json.loads(line)
+                content = self.responder(request["body"])
+                result = {
+                    "id": f"batch_req_{i}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]},
+                    },
+                    "error": None,
+                }
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+class OpenAIBatchBackend:
+    """
+    Submits job files to the OpenAI Batch API and waits for the results.
+    """
+
+    def __init__(self, poll_interval=60, completion_window="24h"):
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    def run(self, requests_path, results_path):
+        client = agents.get_client()
+        with open(requests_path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                      completion_window=self.completion_window)
+        print(f"Submitted batch {batch.id} for {requests_path}")
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(self.poll_interval)
+            batch = client.batches.retrieve(batch.id)
+            print(f"Batch {batch.id}: {batch.status} {batch.request_counts}")
+        if batch.status != "completed" or batch.output_file_id is None:
+            raise Exception(f"Batch {batch.id} ended with status {batch.status}")
+        with open(results_path, "w", encoding="utf-8") as out:
+            out.write(client.files.content(batch.output_file_id).text)
+
+
+def read_results(results_path):
+    """
+    Reads a Batch API results file.
+
+    :param results_path: Path of the results JSONL file.
+    :return: Dictionary mapping custom_id to the response content (None for failed requests).
+    """
+    results = {}
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") == 200:
+                results[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            else:
+                results[result["custom_id"]] = None
+    return results
+
+
+def run_stage(name, requests, backend, workdir, output_stage=None, model=None):
+    """
+    Runs one LLM stage as a single batch job. Requests already in the LLM cache are not submitted,
+    new results are added to the cache, and a stage whose results file exists is not submitted again.
+
+    :param name: Stage name, used for the job file names.
+    :param requests: Dictionary mapping custom_id to chat messages.
+    :param backend: Backend with a run(requests_path, results_path) method.
+    :param workdir: Directory holding the job and results files.
+    :param output_stage: Output stage whose structured output mode and model are used (see agents.OUTPUT_SCHEMAS).
+    :param model: Model of the requests (defaults to the model of the output stage, see agents.stage_model).
+    :return: Dictionary mapping custom_id to the response content.
+    """
+    cache = agents.get_llm_cache()
+    response_format = agents.stage_response_format(output_stage) if output_stage else None
+    model = model or (agents.stage_model(output_stage) if output_stage else agents.llm_model)
+    keys = {custom_id: agents.llm_cache_key(messages, TEMPERATURE, response_format, model) for custom_id, messages in requests.items()}
+    outputs = {}
+    pending = {}
+    for custom_id, messages in requests.items():
+        cached = cache.get(keys[custom_id])
+        if cached is not None:
+            outputs[custom_id] = cached
+        else:
+            pending[custom_id] = messages
+    print(f"Stage {name}: {len(requests)} requests, {len(outputs)} from cache, {len(pending)} to submit")
+    if not pending:
+        return outputs
+
+    requests_path = os.path.join(workdir, f"{name}_requests.jsonl")
+    results_path = os.path.join(workdir, f"{name}_results.jsonl")
+    job = "".join(json.dumps(batch_request(custom_id, messages, response_format, model), ensure_ascii=False) + "\n"
+                  for custom_id, messages in pending.items())
+    previous_job = None
+    if os.path.exists(requests_path):
+        with open(requests_path, encoding="utf-8") as f:
+            previous_job = f.read()
+    # Results of an identical earlier job are reused instead of submitting it again
+    if previous_job != job or not os.path.exists(results_path):
+        with open(requests_path, "w", encoding="utf-8") as f:
+            f.write(job)
+        backend.run(requests_path, results_path)
+
+    results = read_results(results_path)
+    for custom_id in pending:
+        content = results.get(custom_id)
+        if content is not None:
+            cache.set(keys[custom_id], content)
+        outputs[custom_id] = content if content is not None else ""
+    return outputs
+
+
+def run_offline(texts, backend, workdir, search_fn=None, result_total=10, search_workers=8):
+    """
+    Runs the verification pipeline over many inputs stage by stage.
+
+    :param texts: List of input texts.
+    :param backend: Batch backend (LocalBatchBackend or OpenAIBatchBackend).
+    :param workdir: Directory holding the job and results files.
+    :param search_fn: Search function (defaults to the configured retriever).
+    :param result_total: Number of search results per claim.
+    :param search_workers: Number of concurrent search requests.
+    :return: List of (final decision, explanation) tuples, in input order.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    search_fn = search_fn or agents.get_retriever().search
+    rows = range(len(texts))
+
+    # Stage 1: Extract key claims
+    outputs = run_stage("extract", {f"extract-{i}": agents.build_key_claim_messages(texts[i]) for i in rows}, backend, workdir, "key_claim")
+    claims = [agents.parse_key_claim(outputs[f"extract-{i}"]) for i in rows]
+
+    # Stage 2: Generate search queries
+    outputs = run_stage("query", {f"query-{i}": agents.build_query_messages(claims[i]) for i in rows}, backend, workdir, "query")
+    queries = [agents.parse_query(outputs[f"query-{i}"]) for i in rows]
+
+    # Stage 3: Search (not an LLM stage, runs concurrently against the configured retriever)
+    with ThreadPoolExecutor(max_workers=search_workers) as executor:
+        search_results = list(executor.map(lambda query: search_fn(query, result_total=result_total), queries))
+
+    # Stage 4: Analyze every search result
+    requests = {}
+    for i in rows:
+        for idx, item in enumerate(search_results[i]):
+            _, _, search_result = agents.format_search_result(item)
+            requests[f"analysis-{i}-{idx}"] = agents.build_analysis_messages(search_result, claims[i])
+    outputs = run_stage("analysis", requests, backend, workdir, "analysis")
+    analyses = []
+    for i in rows:
+        row_analyses = []
+        for idx, item in enumerate(search_results[i]):
+            title, link, _ = agents.format_search_result(item)
+            analysis = agents.parse_analysis(outputs[f"analysis-{i}-{idx}"])
+            analysis['title'] = title
+            analysis['link'] = link
+            row_analyses.append(analysis)
+        analyses.append(row_analyses)
+
+    # Stage 5: Decide, with the claim-only prompt for claims without search results
+    requests = {}
+    for i in rows:
+        if analyses[i]:
+            requests[f"decision-{i}"] = agents.build_decision_messages(claims[i], analyses[i])
+        else:
+            requests[f"decision-{i}"] = agents.build_claim_only_decision_messages(claims[i])
+    outputs = run_stage("decision", requests, backend, workdir, "decision")
+    decisions = [agents.parse_decision(outputs[f"decision-{i}"]) for i in rows]
+
+    # Stage 5b: With the cascade, decide NEI and low-confidence claims again with the escalation model
+    if agents.CASCADE:
+        requests = {f"escalation-{i}": agents.build_decision_messages(claims[i], analyses[i])
+                    for i in rows if analyses[i] and not agents.is_confident(decisions[i])}
+        outputs = run_stage("escalation", requests, backend, workdir, "decision", model=agents.ESCALATION_MODEL) if requests else {}
+        for custom_id, output in outputs.items():
+            decisions[int(custom_id.split("-")[1])] = agents.parse_decision(output)
+        print(f"Escalated {len(requests)}/{len(texts)} claims to {agents.ESCALATION_MODEL}")
+
+    # Stage 6: Explain; only claims without search results need an LLM explanation
+    requests = {f"explanation-{i}": agents.build_claim_only_explanation_messages(claims[i], decisions[i]['decision'], decisions[i]['confidence'])
+                for i in rows if not analyses[i]}
+    outputs = run_stage("explanation", requests, backend, workdir, "explanation") if requests else {}
+
+    results = []
+    for i in rows:
+        decision = decisions[i]
+        if analyses[i]:
+            explanation = agents.generate_explanation(claims[i], decision['decision'], decision['confidence'], analyses[i])
+        else:
+            # As in process_content, the claim-only decision is the final decision of a claim without search results
+            explanation = agents.build_claim_only_explanation(decision['decision'], decision['confidence'], outputs[f"explanation-{i}"])
+        results.append((decision, explanation))
+    return results
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    from sklearn.metrics import classification_report
+
+    parser = argparse.ArgumentParser(description="Evaluate the pipeline offline with batch jobs.")
+    parser.add_argument("--input", default="politifact.csv", help="CSV file with 'text' and 'label' columns")
+    parser.add_argument("--workdir", default="batch_jobs", help="Directory for job and results files")
+    parser.add_argument("--backend", choices=["openai", "local"], default="openai", help="Batch backend")
+    parser.add_argument("--search", choices=["google", "stub"], default="google", help="Search backend")
+    parser.add_argument("--output", default="politifact_batch_predictions.csv", help="CSV file with the predictions")
+    parser.add_argument("--results", default="politifact_batch_results.jsonl", help="JSONL file receiving the results with their explanations")
+    parser.add_argument("--parquet", help="Directory also receiving the results as Parquet row groups (requires pyarrow)")
+    parser.add_argument("--cascade", action="store_true", help="Decide NEI and low-confidence claims again with the escalation model")
+    parser.add_argument("--escalation-model", default=agents.ESCALATION_MODEL, help="Model used for the escalated decisions")
+    args = parser.parse_args()
+    agents.CASCADE = args.cascade
+    agents.ESCALATION_MODEL = args.escalation_model
+
+    df = pd.read_csv(args.input)
+    backend = OpenAIBatchBackend() if args.backend == "openai" else LocalBatchBackend()
+    search_fn = stub_search if args.search == "stub" else None
+    results = run_offline(df['text'].tolist(), backend, args.workdir, search_fn=search_fn)
+
+    with ResultsSink(args.results, parquet_dir=args.parquet) as sink:
+        for i, text, (decision, explanation) in zip(df.index, df['text'], results):
+            sink.write({"row": int(i), "input": text, "predicted_label": decision.get('decision', 'NEI'),
+                        "confidence": decision.get('confidence', 0), "explanation": explanation})
+    df['predicted_label'] = [decision.get('decision', 'NEI') for decision, _ in results]
+    df.to_csv(args.output, index=False)
+
+    filtered_df = df[df['predicted_label'].isin(['real', 'fake'])]
+    if filtered_df.empty:
+        print("\nNo claim was decided real or fake, skipping the classification report.")
+    else:
+        print("\nClassification Report (excluding NEI):")
+        print(classification_report(filtered_df['label'], filtered_df['predicted_label'], target_names=["fake", "real"]))
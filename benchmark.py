@@ -0,0 +1,354 @@
+import argparse
+import contextlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# The stand-ins answer as fast as configured, so the account rate limits are lifted unless set explicitly
+os.environ.setdefault('LLM_RPM', '1000000')
+os.environ.setdefault('LLM_TPM', '1000000000')
+os.environ.setdefault('SEARCH_QPM', '1000000')
+
+import agents_LLM_RAG as agents
+import search
+from cache import make_key
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# -------------------------- Configuration -------------------------- #
+
+# Relative change of a metric beyond which it is reported as a regression
+REGRESSION_TOLERANCE = 0.10
+
+# Metrics compared against the baseline, and whether higher values are better
+BENCHMARK_METRICS = {
+    "claims_per_sec": True,
+    "llm_calls_per_claim": False,
+    "llm_prompt_tokens_per_claim": False,
+    "search_requests_per_claim": False,
+    "rounds_per_claim": False,
+    "peak_rss_mb": False,
+}
+
+# -------------------------- Deterministic Stand-ins -------------------------- #
+
+def _score(*parts):
+    """
+    :return: Deterministic integer in [0, 100) derived from the parts.
+    """
+    return int(make_key(*parts)[:8], 16) % 100
+
+
+def _between(text, start, end):
+    return text.split(start, 1)[-1].split(end, 1)[0].strip()
+
+
+def fake_llm_responder(body):
+    """
+    Deterministic stand-in for the chat model. Every stage gets a well-formed answer that depends
+    only on the prompt, and decisions depend on the analyses so that some claims need several rounds.
+
+    :param body: Chat completion request body.
+    :return: The response content as a string.
+    """
+    system = body["messages"][0]["content"]
+    user = body["messages"][-1]["content"]
+    if "extracts key claims" in system:
+        return json.dumps({"key_claim": " ".join(_between(user, "Input content:", "Please output").split())[:300]})
+    if "generates search queries" in system:
+        return json.dumps({"query": " ".join(_between(user, "Claim:", "Please output").split()[:12])})
+    if "analyzes search results" in system:
+        claim = _between(user, "Claim:", "Please perform" if "Please perform" in user else "For each search result")
+        labels = ("support", "negate", "baseless")
+        blocks = re.split(r"Search Result idx=\d+:", user)[1:]
+        if blocks:
+            return json.dumps([{"idx": idx, "label": labels[_score(claim, block) % 3],
+                                "confidence": 40 + _score(block, claim) % 60, "rationale": "Deterministic analysis."}
+                               for idx, block in enumerate(blocks, 1)])
+        result = _between(user, "Search Result:", "Below is a claim")
+        return json.dumps({"support_or_contradict_or_unrelated": labels[_score(claim, result) % 3],
+                           "confidence": 40 + _score(result, claim) % 60, "rationale": "Deterministic analysis."})
+    if "final decisions" in system:
+        support = user.count("Label: support")
+        negate = user.count("Label: negate")
+        if support + negate == 0:
+            if "Evidence 1:" in user:
+                return json.dumps({"decision": "NEI", "confidence": 20})
+            return json.dumps({"decision": "real" if _score(user) % 2 else "fake", "confidence": 60})
+        margin = abs(support - negate) / (support + negate)
+        if margin < 0.2:
+            return json.dumps({"decision": "NEI", "confidence": 30})
+        return json.dumps({"decision": "real" if support > negate else "fake", "confidence": int(40 + 60 * margin)})
+    return json.dumps({"explanation": "Deterministic explanation."})
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.prompt_tokens = 0
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOpenAIServer(_StandInServer):
+    """
+    Local chat completions endpoint (POST .../chat/completions) answering with a responder function
+    after a fixed latency. Point the OpenAI clients at it with agents_LLM_RAG.configure(openai_base_url="<url>/v1").
+    """
+
+    def __init__(self, latency=0.0, responder=None):
+        """
+        :param latency: Seconds to wait before answering each request.
+        :param responder: Function mapping a request body to the response content (defaults to fake_llm_responder).
+        """
+        self.responder = responder or fake_llm_responder
+        super().__init__(_FakeOpenAIHandler, latency)
+
+
+class _FakeOpenAIHandler(_StandInHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        time.sleep(self.server.latency)
+        content = self.server.responder(body)
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        completion_tokens = len(content) // 4
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.prompt_tokens += prompt_tokens
+        self.send_json(200, {
+            "id": f"chatcmpl-{self.server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", agents.llm_model),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+class FakeSearchServer(_StandInServer):
+    """
+    Local Custom Search endpoint (GET with q, start and num) returning `results_per_query`
+    deterministic results per query, paged like the real API.
+    """
+
+    def __init__(self, latency=0.0, results_per_query=25):
+        """
+        :param latency: Seconds to wait before answering each request.
+        :param results_per_query: Number of results available for every query.
+        """
+        self.results_per_query = results_per_query
+        super().__init__(_FakeSearchHandler, latency)
+
+
+class _FakeSearchHandler(_StandInHandler):
+    def do_GET(self):
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        query = params.get("q", "")
+        start = int(params.get("start", 1))
+        num = int(params.get("num", 10))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        digest = make_key(query)[:8]
+        words = query.split()
+        items = []
+        for rank in range(start, min(start + num, self.server.results_per_query + 1)):
+            shown = " ".join(words[:max(1, len(words) - rank % 4)])
+            items.append({"title": f"Result {rank} for {shown}", "link": f"https://example.org/{digest}/{rank}",
+                          "snippet": f"Report {rank} about {shown}."})
+        self.send_json(200, {"items": items} if items else {})
+
+# -------------------------- Benchmark -------------------------- #
+
+def peak_rss_mb():
+    """
+    :return: Peak resident set size of the process in MB (None where unavailable).
+    """
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def use_stand_ins(llm_server, search_server):
+    """
+    Points the pipeline at the stand-in servers, with the LLM and search caches bypassed
+    so that every run does the same work.
+    """
+    agents.configure(agents.Config(openai_api_key="benchmark", openai_base_url=f"{llm_server.url}/v1"))
+    search.SEARCH_URL = f"{search_server.url}/customsearch/v1"
+    search.SEARCH_CACHE_MODE = "bypass"
+    search._search_cache = None
+    agents.LLM_CACHE_MODE = "bypass"
+    agents._llm_cache = None
+    agents.RETRIEVER = "google"
+    agents._retriever = None
+
+
+def run_benchmark(texts, llm_server, search_server, flow="many", concurrency=16, workers=4, verbose=False):
+    """
+    Runs the pipeline over the texts against the stand-in servers.
+
+    :param texts: List of input texts.
+    :param llm_server: FakeOpenAIServer.
+    :param search_server: FakeSearchServer.
+    :param flow: "many" (process_many on one event loop) or "main" (the main.py batch loop).
+    :param concurrency: Number of inputs in flight for the "many" flow.
+    :param workers: Number of rows in flight for the "main" flow.
+    :param verbose: Keep the pipeline output instead of discarding it.
+    :return: Dictionary of metrics and the decisions, in input order.
+    """
+    llm_server.reset()
+    search_server.reset()
+    agents._key_claim_memo.clear()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+
+    start = time.perf_counter()
+    with output:
+        if flow == "many":
+            stats = []
+            results = agents.process_many(texts, concurrency=concurrency, stats=stats)
+            decisions = [decision.get('decision', 'NEI') for decision, _ in results]
+            rounds = [claim_stats.get('rounds', 0) for claim_stats in stats]
+        elif flow == "main":
+            import pandas as pd
+            from main import run_batch
+            from results_sink import iter_results
+            with tempfile.TemporaryDirectory() as workdir:
+                results_path = os.path.join(workdir, "results.jsonl")
+                run_batch(pd.DataFrame({"text": texts}), results_path, workers=workers)
+                records = {record["row"]: record for record in iter_results(results_path, columns=["row", "predicted_label", "rounds"])}
+            decisions = [records.get(i, {}).get('predicted_label', 'NEI') for i in range(len(texts))]
+            rounds = [records.get(i, {}).get('rounds', 0) for i in range(len(texts))]
+        else:
+            raise ValueError(f"Unknown flow: {flow}")
+    seconds = time.perf_counter() - start
+
+    claims = max(1, len(texts))
+    return {
+        "flow": flow,
+        "claims": len(texts),
+        "seconds": round(seconds, 3),
+        "claims_per_sec": round(len(texts) / seconds, 3) if seconds > 0 else 0.0,
+        "llm_calls_per_claim": round(llm_server.requests / claims, 3),
+        "llm_prompt_tokens_per_claim": round(llm_server.prompt_tokens / claims, 1),
+        "search_requests_per_claim": round(search_server.requests / claims, 3),
+        "rounds_per_claim": round(sum(rounds) / claims, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "decisions": decisions,
+    }
+
+
+def compare_to_baseline(current, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    :param current: Metrics of this run.
+    :param baseline: Stored metrics of the baseline run.
+    :param tolerance: Relative change beyond which a metric is reported as a regression or an improvement.
+    :return: Tuple (list of (metric, baseline, current, relative change, status) rows, any regression).
+    """
+    rows = []
+    regressed = False
+    for metric, higher_is_better in BENCHMARK_METRICS.items():
+        old, new = baseline.get(metric), current.get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        better = change > tolerance if higher_is_better else change < -tolerance
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        status = "regressed" if worse else "improved" if better else "ok"
+        regressed = regressed or worse
+        rows.append((metric, old, new, change, status))
+    if baseline.get("decisions") and len(baseline["decisions"]) == len(current["decisions"]):
+        same = sum(a == b for a, b in zip(baseline["decisions"], current["decisions"]))
+        rows.append(("decision_agreement", 1.0, round(same / len(current["decisions"]), 3), same / len(current["decisions"]) - 1.0,
+                     "ok" if same == len(current["decisions"]) else "changed"))
+    return rows, regressed
+
+
+if __name__ == "__main__":
+    import sys
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local LLM and search stand-ins.")
+    parser.add_argument("--input", default="politifact.csv", help="CSV file with a 'text' column")
+    parser.add_argument("--offset", type=int, default=0, help="First row of the subset")
+    parser.add_argument("--limit", type=int, default=50, help="Number of rows in the subset")
+    parser.add_argument("--flow", choices=["many", "main"], default="many", help="process_many or the main.py batch loop")
+    parser.add_argument("--concurrency", type=int, default=agents.PROCESS_MANY_CONCURRENCY, help="Inputs in flight (many flow)")
+    parser.add_argument("--workers", type=int, default=4, help="Rows in flight (main flow)")
+    parser.add_argument("--analysis-mode", choices=["per_item", "fused"], default=agents.ANALYSIS_MODE)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM request")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per fake search request")
+    parser.add_argument("--search-results", type=int, default=25, help="Results available per query")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="Stored baseline metrics")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Relative change reported as a regression")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline output")
+    args = parser.parse_args()
+
+    texts = pd.read_csv(args.input)['text'].iloc[args.offset:args.offset + args.limit].tolist()
+    agents.ANALYSIS_MODE = args.analysis_mode
+    llm_server = FakeOpenAIServer(latency=args.llm_latency)
+    search_server = FakeSearchServer(latency=args.search_latency, results_per_query=args.search_results)
+    use_stand_ins(llm_server, search_server)
+
+    metrics = run_benchmark(texts, llm_server, search_server, flow=args.flow, concurrency=args.concurrency,
+                            workers=args.workers, verbose=args.verbose)
+    metrics["settings"] = {key: value for key, value in vars(args).items() if key not in ("baseline", "save_baseline", "verbose")}
+    print(json.dumps({key: value for key, value in metrics.items() if key != "decisions"}, indent=2))
+
+    exit_code = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != metrics["settings"]:
+            print("Warning: the baseline was recorded with different settings")
+        rows, regressed = compare_to_baseline(metrics, baseline, tolerance=args.tolerance)
+        print(f"\n{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}  status")
+        for metric, old, new, change, status in rows:
+            print(f"{metric:<28}{old:>12}{new:>12}{change:>+10.1%}  {status}")
+        exit_code = 1 if regressed else 0
+    sys.exit(exit_code)
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# -------------------------- Persistent Key-Value Cache -------------------------- #
+
+# Cache modes
+READ_WRITE = "readwrite"  # Serve hits and store new entries
+READ_ONLY = "readonly"    # Replay stored entries, never write
+BYPASS = "bypass"         # Neither read nor write
+
+CACHE_MODES = (READ_WRITE, READ_ONLY, BYPASS)
+
+
+def make_key(*parts):
+    """
+    Builds a content-addressed cache key from JSON-serializable parts.
+
+    :param parts: Values that identify the cached entry.
+    :return: Hex digest of the canonical JSON encoding of the parts.
+    """
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    SQLite-backed key-value cache with TTL and size eviction and hit/miss counters.
+
+    Values are stored as JSON. Entries older than `ttl` seconds are treated as missing, and when the
+    cache grows beyond `max_entries` entries or `max_bytes` bytes the least recently used entries are evicted.
+    """
+
+    # Number of writes between two eviction passes
+    EVICT_EVERY = 64
+
+    def __init__(self, path, mode=READ_WRITE, ttl=None, max_entries=None, max_bytes=None):
+        """
+        :param path: Path of the SQLite database file.
+        :param mode: One of "readwrite", "readonly" or "bypass".
+        :param ttl: Time to live of an entry in seconds (None keeps entries forever).
+        :param max_entries: Maximum number of entries kept (None for unbounded).
+        :param max_bytes: Maximum total size of the stored values in bytes (None for unbounded).
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """
+        Looks up a cached value.
+
+        :param key: Cache key.
+        :return: The cached value, or None on a miss.
+        """
+        if self.mode == BYPASS:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            if self.mode == READ_WRITE:
+                conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+                conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        Stores a value, unless the cache is read-only or bypassed.
+
+        :param key: Cache key.
+        :param value: JSON-serializable value.
+        """
+        if self.mode != READ_WRITE:
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded.encode("utf-8")), now, now),
+            )
+            conn.commit()
+            self.writes += 1
+            if self.writes % self.EVICT_EVERY == 0:
+                self._evict(conn)
+
+    def values(self):
+        """
+        Iterates over all stored values that have not expired, without touching the counters.
+
+        :return: Generator of cached values.
+        """
+        min_created = time.time() - self.ttl if self.ttl is not None else 0
+        with self._lock:
+            rows = self._connect().execute("SELECT value FROM cache WHERE created >= ?", (min_created,)).fetchall()
+        for (value,) in rows:
+            yield json.loads(value)
+
+    def evict(self):
+        """
+        Removes expired entries and the least recently used entries above the size limits.
+        """
+        if self.mode != READ_WRITE:
+            return
+        with self._lock:
+            self._evict(self._connect())
+
+    def _evict(self, conn):
+        removed = 0
+        if self.ttl is not None:
+            removed += conn.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        if self.max_entries is not None:
+            removed += conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if self.max_bytes is not None:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed ASC"):
+                    if excess <= 0:
+                        break
+                    victims.append((key,))
+                    excess -= size
+                conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+                removed += len(victims)
+        conn.commit()
+        self.evictions += removed
+
+    def stats(self):
+        """
+        :return: Dictionary with the hit, miss, write and eviction counters.
+        """
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes, "evictions": self.evictions}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
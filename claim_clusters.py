@@ -0,0 +1,86 @@
+import hashlib
+
+from evidence_filter import NUM_PERMUTATIONS, estimated_similarity, minhash_signature
+from evidence_memo import normalize_claim
+
+# -------------------------- Configuration -------------------------- #
+
+# Estimated Jaccard similarity of the input shingles above which two inputs are verified once
+CLAIM_DUPLICATE_THRESHOLD = 0.8
+
+# Locality-sensitive hashing of the MinHash signatures: inputs are only compared when all the rows
+# of at least one band agree. NUM_PERMUTATIONS must be divisible by LSH_BANDS
+LSH_BANDS = 16
+
+# Words that change the verdict of an otherwise identical claim. Inputs are only clustered when they
+# contain the same negations and numbers, so "X did Y" and "X did not Y" are verified separately
+NEGATIONS = frozenset("not no never none nobody nothing neither nor without cannot isn didn doesn wasn weren won".split())
+
+# -------------------------- Clustering -------------------------- #
+
+def claim_guard(text):
+    """
+    :param text: Input text.
+    :return: The negations and numbers of the text, which must match for two inputs to be clustered.
+    """
+    return frozenset(token for token in normalize_claim(text).split() if token in NEGATIONS or token.isdigit())
+
+
+def cluster_texts(texts, threshold=CLAIM_DUPLICATE_THRESHOLD):
+    """
+    Groups identical and near-duplicate inputs. Inputs with the same normalized text share a cluster;
+    other inputs join the first cluster whose representative has an estimated similarity of at least
+    `threshold` and the same negations and numbers (see claim_guard). Candidate representatives are
+    found with MinHash LSH, so the cost stays close to linear in the number of inputs.
+
+    :param texts: List of input texts.
+    :param threshold: Minimum estimated Jaccard similarity with the representative of a cluster,
+                      or None to only cluster exact duplicates.
+    :return: List giving, for each input, the position of its cluster representative (the first input of the cluster).
+    """
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    exact = {}
+    buckets = {}
+    signatures = {}
+    guards = {}
+    representatives = []
+    for position, text in enumerate(texts):
+        digest = hashlib.sha256(normalize_claim(text).encode("utf-8")).hexdigest()
+        if digest in exact:
+            representatives.append(exact[digest])
+            continue
+        if threshold is None:
+            exact[digest] = position
+            representatives.append(position)
+            continue
+
+        signature = minhash_signature(text)
+        guard = claim_guard(text)
+        bands = [(band, signature[band * rows:(band + 1) * rows]) for band in range(LSH_BANDS)]
+        candidates = sorted({candidate for band in bands for candidate in buckets.get(band, ())})
+        representative = next((candidate for candidate in candidates
+                               if guards[candidate] == guard
+                               and estimated_similarity(signature, signatures[candidate]) >= threshold), None)
+        if representative is None:
+            # A new cluster; only representatives are indexed, so clusters do not drift by chaining
+            representative = position
+            signatures[position] = signature
+            guards[position] = guard
+            for band in bands:
+                buckets.setdefault(band, []).append(position)
+        exact[digest] = representative
+        representatives.append(representative)
+    return representatives
+
+
+def cluster_members(representatives):
+    """
+    :param representatives: Output of cluster_texts.
+    :return: Dictionary mapping each representative position to the positions of its other members.
+    """
+    members = {}
+    for position, representative in enumerate(representatives):
+        members.setdefault(representative, [])
+        if representative != position:
+            members[representative].append(position)
+    return members
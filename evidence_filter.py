@@ -0,0 +1,140 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from retrieval import tokenize
+
+# -------------------------- Configuration -------------------------- #
+
+# Number of MinHash permutations and shingle size (in tokens) for near-duplicate detection
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 2
+
+# Estimated Jaccard similarity of title+snippet shingles above which two results are near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.6
+
+# Query parameters that do not change the page content
+TRACKING_PARAM_PREFIXES = ("utm_", "mc_")
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "cmpid", "ocid"}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME)
+    for i in range(NUM_PERMUTATIONS)
+]
+
+# -------------------------- URL and Text Similarity -------------------------- #
+
+def canonicalize_url(url):
+    """
+    Normalizes a URL so that copies of the same page compare equal: lowercases the host,
+    drops "www."/"m." prefixes, AMP suffixes, fragments, tracking parameters and trailing slashes.
+
+    :param url: URL string.
+    :return: Canonical URL string.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.hostname or ""
+    for prefix in ("www.", "m.", "amp."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path
+    for suffix in ("/amp", "/amp/", ".amp"):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+    path = path.rstrip("/")
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query)
+                             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)))
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def minhash_signature(text):
+    """
+    Computes the MinHash signature of the token shingles of a text.
+
+    :param text: Input text.
+    :return: Tuple of NUM_PERMUTATIONS integers.
+    """
+    tokens = tokenize(text)
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+              for shingle in shingles]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def estimated_similarity(signature_a, signature_b):
+    """
+    :return: Estimated Jaccard similarity of the shingle sets behind two MinHash signatures.
+    """
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / len(signature_a)
+
+
+def lexical_relevance(claim_tokens, text):
+    """
+    :param claim_tokens: Set of tokens of the key claim.
+    :param text: Candidate evidence text.
+    :return: Fraction of the claim tokens that occur in the text.
+    """
+    if not claim_tokens:
+        return 0.0
+    return len(claim_tokens & set(tokenize(text))) / len(claim_tokens)
+
+# -------------------------- Evidence Filter -------------------------- #
+
+class EvidenceFilter:
+    """
+    Cheap local filtering between search and analysis for one claim. Drops results whose canonical URL
+    was already seen, near-duplicates (MinHash of title+snippet) of earlier results, and results sharing
+    no terms with the key claim, then keeps the top_n most relevant ones in search-rank order.
+    State is kept across the retrieval rounds of the claim.
+    """
+
+    def __init__(self, claim, top_n=None):
+        """
+        :param claim: The key claim.
+        :param top_n: Maximum number of results kept per round (None keeps all relevant results).
+        """
+        self.claim_tokens = set(tokenize(claim))
+        self.top_n = top_n
+        self.seen_urls = set()
+        self.signatures = []
+        self.report = {"input": 0, "duplicate_urls": 0, "near_duplicates": 0, "irrelevant": 0, "trimmed": 0, "kept": 0}
+
+    def filter(self, items):
+        """
+        :param items: Search result items of a round, in search-rank order.
+        :return: The items to analyze, in search-rank order.
+        """
+        self.report["input"] += len(items)
+        candidates = []
+        for rank, item in enumerate(items):
+            url = canonicalize_url(item.get('link', ''))
+            if url and url in self.seen_urls:
+                self.report["duplicate_urls"] += 1
+                continue
+            text = f"{item.get('title', '')} {item.get('snippet', '')}"
+            signature = minhash_signature(text)
+            if any(estimated_similarity(signature, seen) >= NEAR_DUPLICATE_THRESHOLD for seen in self.signatures):
+                self.report["near_duplicates"] += 1
+                continue
+            self.seen_urls.add(url)
+            self.signatures.append(signature)
+            relevance = lexical_relevance(self.claim_tokens, text)
+            if relevance == 0:
+                self.report["irrelevant"] += 1
+                continue
+            candidates.append((relevance, rank, item))
+
+        if self.top_n is not None and len(candidates) > self.top_n:
+            self.report["trimmed"] += len(candidates) - self.top_n
+            candidates = sorted(candidates, key=lambda candidate: (-candidate[0], candidate[1]))[:self.top_n]
+        kept = [item for _, _, item in sorted(candidates, key=lambda candidate: candidate[1])]
+        self.report["kept"] += len(kept)
+        return kept
+
+    @property
+    def calls_saved(self):
+        """
+        Number of per-result analysis calls avoided so far.
+        """
+        return self.report["input"] - self.report["kept"]
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from evidence_filter import canonicalize_url
+from retrieval import tokenize
+
+# -------------------------- Evidence Memo -------------------------- #
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def normalize_claim(claim):
+    """
+    Normalizes a claim for memo lookups: lowercase, punctuation removed, whitespace collapsed.
+
+    :param claim: Claim text.
+    :return: Normalized claim text.
+    """
+    return " ".join(_NON_WORD.sub(" ", claim.lower()).split())
+
+
+def evidence_key(link, snippet, model=None):
+    """
+    :param link: Search result link.
+    :param snippet: Search result snippet.
+    :param model: Model that analyzes the evidence (None leaves it out of the key).
+    :return: Hash identifying the evidence (canonical URL and snippet) and the model analyzing it.
+    """
+    key = f"{canonicalize_url(link)}\n{snippet}"
+    if model is not None:
+        key = f"{model}\n{key}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class EvidenceMemo:
+    """
+    Persistent store of analyses keyed on (normalized claim, evidence hash), shared across claims and runs.
+    The evidence hash includes the analysis model, so changing the model does not reuse analyses of the previous one.
+    Optionally, a lookup also matches a stored claim for the same evidence whose token set has a Jaccard
+    similarity of at least `similarity_threshold` with the claim. The least recently used entries are
+    evicted above `max_entries`.
+    """
+
+    # Number of writes between two eviction passes
+    EVICT_EVERY = 64
+
+    def __init__(self, path, max_entries=100000, similarity_threshold=None):
+        """
+        :param path: Path of the SQLite database file.
+        :param max_entries: Maximum number of stored analyses.
+        :param similarity_threshold: Minimum claim similarity for a fuzzy match (None for exact matches only).
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS memo ("
+                "evidence TEXT NOT NULL, claim TEXT NOT NULL, analysis TEXT NOT NULL, accessed REAL NOT NULL, "
+                "PRIMARY KEY (evidence, claim))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS memo_accessed ON memo (accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, claim, link, snippet, model=None):
+        """
+        Looks up the stored analysis of a (claim, search result) pair.
+
+        :param claim: The claim to verify.
+        :param link: Search result link.
+        :param snippet: Search result snippet.
+        :param model: Model of the analysis.
+        :return: Dictionary with "support_or_contradict_or_unrelated", "confidence" and "rationale", or None.
+        """
+        evidence = evidence_key(link, snippet, model)
+        normalized = normalize_claim(claim)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT claim, analysis FROM memo WHERE evidence = ? AND claim = ?",
+                               (evidence, normalized)).fetchone()
+            if row is None and self.similarity_threshold is not None:
+                claim_tokens = set(tokenize(normalized))
+                best_score = 0.0
+                for candidate in conn.execute("SELECT claim, analysis FROM memo WHERE evidence = ?", (evidence,)):
+                    candidate_tokens = set(tokenize(candidate[0]))
+                    union = claim_tokens | candidate_tokens
+                    score = len(claim_tokens & candidate_tokens) / len(union) if union else 0.0
+                    if score >= self.similarity_threshold and score > best_score:
+                        row, best_score = candidate, score
+                if row is not None:
+                    self.similar_hits += 1
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE memo SET accessed = ? WHERE evidence = ? AND claim = ?", (time.time(), evidence, row[0]))
+            conn.commit()
+            self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, claim, link, snippet, analysis, model=None):
+        """
+        Stores the analysis of a (claim, search result) pair.
+
+        :param claim: The claim to verify.
+        :param link: Search result link.
+        :param snippet: Search result snippet.
+        :param analysis: Analysis dictionary; only the label, confidence and rationale are stored.
+        :param model: Model of the analysis.
+        """
+        stored = {key: analysis[key] for key in ("support_or_contradict_or_unrelated", "confidence", "rationale") if key in analysis}
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO memo (evidence, claim, analysis, accessed) VALUES (?, ?, ?, ?)",
+                         (evidence_key(link, snippet, model), normalize_claim(claim), json.dumps(stored, ensure_ascii=False), time.time()))
+            self.writes += 1
+            if self.writes % self.EVICT_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM memo WHERE rowid IN (SELECT rowid FROM memo ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            conn.commit()
+
+    def stats(self):
+        """
+        :return: Dictionary with the hit (including similar), similar hit, miss and write counters.
+        """
+        return {"hits": self.hits, "similar_hits": self.similar_hits, "misses": self.misses, "writes": self.writes}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
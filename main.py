@@ -1,28 +1,259 @@
+import argparse
+import asyncio
+import time
+
 import pandas as pd
-from agents_LLM_RAG import process_content
+import agents_LLM_RAG
+import structured_output
+import tracing
+import triage
+from agents_LLM_RAG import get_evidence_memo, get_llm_cache, process_content_async, run_sync
+from article_fetch import get_article_cache
+from claim_clusters import CLAIM_DUPLICATE_THRESHOLD, cluster_texts
+from results_sink import ResultsSink, iter_results, load_results, result_record
+from rate_limit import llm_scheduler, search_scheduler
 from sklearn.metrics import classification_report
 
-df = pd.read_csv("politifact.csv")
 
-assert 'text' in df.columns, "'text' column not found"
-assert 'label' in df.columns, "'label' column not found"
+def load_finished_rows(results_path):
+    """
+    Reads the rows that were already processed from an append-only JSONL results file.
+
+    :param results_path: Path of the JSONL results file.
+    :return: Set of the finished row indices.
+    """
+    return {record["row"] for record in iter_results(results_path, columns=["row"])}
+
+
+# Fields of a result record that are copied from a cluster representative to the other members
+VERDICT_FIELDS = ("key_claim", "predicted_label", "confidence", "first_tier_label", "escalated", "triage_label",
+                  "triage_margin", "triage_decided", "analyses", "explanation")
+
+# Result fields loaded back for the evaluation report (explanations and analyses stay on disk)
+REPORT_COLUMNS = ["row", "cluster", "predicted_label", "first_tier_label", "confidence", "rounds", "seconds", "llm_calls",
+                  "decision_calls", "decision_prompt_tokens", "analysis_calls", "analysis_prompt_tokens",
+                  "analysis_completion_tokens", "analysis_seconds", "analysis_calls_saved", "analysis_memo_hits",
+                  "outputs_rescued", "rounds_avoided", "escalated", "escalation_calls", "prompt_tokens", "completion_tokens",
+                  "articles_fetched", "articles_failed", "articles_enriched", "triage_label", "triage_margin", "triage_decided"]
+
+
+def run_batch(df, results_path, workers=4, dedup=False, dedup_threshold=CLAIM_DUPLICATE_THRESHOLD, parquet_dir=None):
+    """
+    Processes all rows of the dataframe concurrently on one event loop, so the async clients and the
+    per-loop concurrency limits are shared by the whole batch. Every finished row is streamed to
+    an append-only JSONL file (and optionally Parquet row groups). Rows already present in the
+    file are skipped, so an interrupted run resumes where it stopped. Results are not kept in
+    memory; read them back with results_sink.load_results.
+
+    With deduplication, identical and near-duplicate texts are clustered first, only the first row
+    of each cluster is verified, and its verdict and explanation are copied to the other rows.
+
+    :param df: Dataframe with a 'text' column.
+    :param results_path: Path of the JSONL results file.
+    :param workers: Number of claims processed concurrently.
+    :param dedup: Whether to verify one row per cluster of duplicate texts.
+    :param dedup_threshold: Similarity threshold of near-duplicate texts (None clusters exact duplicates only).
+    :param parquet_dir: Optional directory receiving the results as Parquet files.
+    :return: Set of the finished row indices.
+    """
+    finished = load_finished_rows(results_path)
+    pending = [i for i in df.index if i not in finished]
+    print(f"{len(finished)} rows already processed, {len(pending)} remaining")
+
+    members = {}
+    if dedup:
+        rows = list(df.index)
+        representatives = cluster_texts([str(text) for text in df['text']], threshold=dedup_threshold)
+        for i, representative in zip(rows, representatives):
+            if rows[representative] != i and i in pending:
+                members.setdefault(rows[representative], []).append(i)
+        duplicates = {i for rows_of_cluster in members.values() for i in rows_of_cluster}
+        pending = [i for i in pending if i not in duplicates]
+        print(f"{len(set(representatives))} clusters for {len(df)} rows, {len(pending)} remaining after deduplication")
+
+    def fan_out(record, sink):
+        # Copies the verdict of a representative to the members of its cluster
+        for i in members.pop(record["row"], []):
+            sink.write({"row": int(i), "cluster": record["row"], "input": df.at[i, 'text'],
+                        **{field: record[field] for field in VERDICT_FIELDS if field in record}})
+            finished.add(i)
+
+    start_time = time.time()
+    done = 0
+
+    async def process_rows(sink):
+        rows = iter(pending)
+
+        async def worker():
+            nonlocal done
+            # The workers share the iterator, so each row is taken by exactly one of them
+            for i in rows:
+                stats = {}
+                started = time.perf_counter()
+                try:
+                    result, explanation = await process_content_async(df.at[i, 'text'], stats=stats)
+                except Exception as e:
+                    print(f"\nRow {i+1} failed: {e}")
+                    continue
+                record = result_record(df.at[i, 'text'], result, explanation, stats, seconds=time.perf_counter() - started,
+                                       row=int(i), cluster=int(i))
+                sink.write(record)
+                finished.add(i)
+                fan_out(record, sink)
+                done += 1
+                elapsed = time.time() - start_time
+                rate = done / elapsed * 60 if elapsed > 0 else 0.0
+                eta = (len(pending) - done) / rate if rate > 0 else float('inf')
+                print(f"\nProgress: {len(finished)}/{len(df)} rows, {rate:.1f} claims/min, ETA {eta:.1f} min")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+
+    with ResultsSink(results_path, parquet_dir=parquet_dir) as sink:
+        # Representatives finished in an earlier run
+        if any(i in finished for i in members):
+            for record in iter_results(results_path):
+                if record["row"] in members:
+                    fan_out(record, sink)
+        if pending:
+            run_sync(process_rows(sink))
+
+    return finished
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the verification pipeline on a labeled CSV dataset.")
+    parser.add_argument("--input", default="politifact.csv", help="CSV file with 'text' and 'label' columns")
+    parser.add_argument("--results", default="politifact_results.jsonl", help="Append-only JSONL checkpoint file")
+    parser.add_argument("--output", default="politifact_results_with_predictions.csv",
+                        help="CSV file with the predictions and per-claim statistics (explanations stay in the results file)")
+    parser.add_argument("--parquet", help="Directory also receiving the results as Parquet row groups (requires pyarrow)")
+    parser.add_argument("--workers", type=int, default=4, help="Number of claims processed concurrently")
+    parser.add_argument("--analysis-mode", choices=["per_item", "fused"], default=agents_LLM_RAG.ANALYSIS_MODE,
+                        help="Analyze search results with one request each or one fused request per round")
+    parser.add_argument("--evidence-filter", action="store_true",
+                        help="Drop duplicate and irrelevant search results before analysis")
+    parser.add_argument("--evidence-top-n", type=int, default=agents_LLM_RAG.EVIDENCE_TOP_N,
+                        help="Number of search results kept per round by the evidence filter")
+    parser.add_argument("--evidence-memo", action="store_true",
+                        help="Reuse stored analyses of (claim, search result) pairs across claims and runs")
+    parser.add_argument("--evidence-memo-similarity", type=float, default=agents_LLM_RAG.EVIDENCE_MEMO_SIMILARITY,
+                        help="Minimum claim similarity (0-1) for reusing an analysis stored for a different claim")
+    parser.add_argument("--fetch-articles", action="store_true",
+                        help="Give the analyzer the passages of the linked articles most relevant to the key claim")
+    parser.add_argument("--trace", help="JSONL file receiving the per-stage tracing spans of the run")
+    parser.add_argument("--stage-model", action="append", default=[], metavar="STAGE=MODEL",
+                        help="Model of a pipeline stage (key_claim, query, analysis, decision, explanation), repeatable")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Decide NEI and low-confidence claims again with the escalation model")
+    parser.add_argument("--escalation-model", default=agents_LLM_RAG.ESCALATION_MODEL,
+                        help="Model used for the escalated decisions of the cascade")
+    parser.add_argument("--triage", action="store_true",
+                        help="Decide inputs the local triage classifier is confident about without the agent pipeline")
+    parser.add_argument("--triage-margin", type=float, default=agents_LLM_RAG.TRIAGE_MARGIN,
+                        help="Minimum probability margin (0-1) of a triage decision; 1 scores every input without deciding any")
+    parser.add_argument("--triage-model", default=agents_LLM_RAG.TRIAGE_MODEL_PATH, help="Model trained with triage.py train")
+    parser.add_argument("--full-trace", action="store_true",
+                        help="Run all rounds of every claim so that simulate.py can replay other stopping rules")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Verify one row per cluster of identical or near-duplicate texts and copy its verdict to the others")
+    parser.add_argument("--dedup-threshold", type=float, default=CLAIM_DUPLICATE_THRESHOLD,
+                        help="Minimum estimated similarity (0-1) of near-duplicate texts")
+    args = parser.parse_args()
+    agents_LLM_RAG.ANALYSIS_MODE = args.analysis_mode
+    agents_LLM_RAG.EVIDENCE_FILTER = args.evidence_filter
+    agents_LLM_RAG.EVIDENCE_TOP_N = args.evidence_top_n
+    agents_LLM_RAG.EVIDENCE_MEMO = args.evidence_memo
+    agents_LLM_RAG.EVIDENCE_MEMO_SIMILARITY = args.evidence_memo_similarity
+    agents_LLM_RAG.ARTICLE_FETCH = args.fetch_articles
+    for assignment in args.stage_model:
+        stage, _, model = assignment.partition("=")
+        if stage not in agents_LLM_RAG.OUTPUT_SCHEMAS or not model:
+            parser.error(f"--stage-model expects STAGE=MODEL with a stage in {', '.join(agents_LLM_RAG.OUTPUT_SCHEMAS)}")
+        agents_LLM_RAG.STAGE_MODELS[stage] = model
+    agents_LLM_RAG.CASCADE = args.cascade
+    agents_LLM_RAG.TRIAGE = args.triage
+    agents_LLM_RAG.TRIAGE_MARGIN = args.triage_margin
+    agents_LLM_RAG.TRIAGE_MODEL_PATH = args.triage_model
+    agents_LLM_RAG.ESCALATION_MODEL = args.escalation_model
+    agents_LLM_RAG.FULL_TRACE = args.full_trace
+
+    df = pd.read_csv(args.input)
+
+    assert 'text' in df.columns, "'text' column not found"
+    assert 'label' in df.columns, "'label' column not found"
+
+    tracer = tracing.start_run(args.trace)
+    run_batch(df, args.results, workers=args.workers, dedup=args.dedup, dedup_threshold=args.dedup_threshold,
+              parquet_dir=args.parquet)
+    tracing.stop_run()
 
-predicted_labels = []
-explanations = []
+    # Only the report columns are read back, one result at a time
+    predictions = load_results(args.results, columns=REPORT_COLUMNS).set_index('row')
+    df = df.join(predictions, how='left')
+    df['predicted_label'] = df['predicted_label'].fillna('NEI')
+    df['first_tier_label'] = df['first_tier_label'].fillna(df['predicted_label'])
+    df['cluster'] = df['cluster'].fillna(pd.Series(df.index, index=df.index)).astype(int)
+    df['escalated'] = df['escalated'].fillna(False).astype(bool)
+    df['triage_decided'] = df['triage_decided'].fillna(False).astype(bool)
+    durations = ['confidence', 'seconds', 'analysis_seconds']
+    counts = [column for column in REPORT_COLUMNS
+              if column not in durations + ['row', 'cluster', 'predicted_label', 'first_tier_label', 'escalated',
+                                            'triage_label', 'triage_margin', 'triage_decided']]
+    df[durations] = df[durations].fillna(0.0)
+    df[counts] = df[counts].fillna(0).astype(int)
 
-for i, row in df.iterrows():
-    print(f"\nProcessing row {i+1}/{len(df)}")
-    result, explanation = process_content(row['text'])
-    predicted_labels.append(result.get('decision', 'NEI'))
-    explanations.append(str(explanation))
+    filtered_df = df[df['predicted_label'].isin(['real', 'fake'])]
+    df.to_csv(args.output, index=False)
 
-df['predicted_label'] = predicted_labels
-df['explanation'] = explanations
 
-filtered_df = df[df['predicted_label'].isin(['real', 'fake'])]
-df.to_csv("politifact_results_with_predictions.csv", index=False)
+    print(f"\nDecision calls per claim: {df['decision_calls'].mean():.2f}, decision prompt tokens per claim: {df['decision_prompt_tokens'].mean():.1f}")
 
+    print(f"Analysis ({args.analysis_mode}) per claim: {df['analysis_calls'].mean():.2f} calls, "
+          f"{df['analysis_prompt_tokens'].mean():.1f} prompt tokens, {df['analysis_completion_tokens'].mean():.1f} completion tokens, "
+          f"{df['analysis_seconds'].mean():.2f}s")
+    if args.evidence_filter:
+        print(f"Evidence filter (top {args.evidence_top_n}): {df['analysis_calls_saved'].mean():.2f} analysis calls saved per claim")
+    if args.evidence_memo:
+        print(f"Evidence memo: {df['analysis_memo_hits'].mean():.2f} analyses reused per claim, {get_evidence_memo().stats()}")
+    if args.fetch_articles:
+        print(f"Article enrichment: {df['articles_enriched'].sum()}/{df['articles_fetched'].sum() + df['articles_failed'].sum()} "
+              f"results enriched, {df['articles_failed'].sum()} pages failed, cache: {get_article_cache().stats()}")
+    print(f"Structured output ({agents_LLM_RAG.STRUCTURED_OUTPUT}): {structured_output.stats()}, "
+          f"{df['outputs_rescued'].sum()} outputs repaired or re-requested, {df['rounds_avoided'].sum()} retrieval rounds avoided")
+    if args.dedup:
+        copied = df[df['cluster'] != df.index]
+        calls_saved = int(df['llm_calls'].reindex(copied['cluster']).fillna(0).sum())
+        print(f"Deduplication: {df['cluster'].nunique()} clusters for {len(df)} rows, {len(copied)} verdicts copied, "
+              f"{calls_saved} LLM calls saved")
+    if args.cascade:
+        escalated = df[df['escalated']]
+        print(f"Cascade ({args.escalation_model}): {len(escalated)}/{len(df)} claims escalated ({df['escalated'].mean():.1%}), "
+              f"{(escalated['predicted_label'] != escalated['first_tier_label']).sum()} decisions changed")
+    if args.triage:
+        triaged = df[df['triage_decided']]
+        print(f"Triage (margin {args.triage_margin}): {len(triaged)}/{len(df)} claims decided locally ({df['triage_decided'].mean():.1%}), "
+              f"{(triaged['predicted_label'] == triaged['label']).mean() if len(triaged) else 0:.1%} of them correct")
+        # Savings at other margins are estimated from the LLM calls and tokens of the claims the pipeline verified
+        scored = df[df['triage_margin'].notna()]
+        prompt_price, completion_price = tracing.MODEL_PRICES.get(agents_LLM_RAG.llm_model, (0.0, 0.0))
+        costs = (scored['prompt_tokens'] * prompt_price + scored['completion_tokens'] * completion_price) / 1e6
+        print(triage.format_margin_report(triage.margin_report(
+            list(zip(scored['triage_label'], scored['triage_margin'])), list(scored['label']),
+            pipeline_labels=list(scored['predicted_label']) if not scored['triage_decided'].any() else None,
+            llm_calls=list(scored['llm_calls']), costs=list(costs))))
+    print(f"LLM cache: {get_llm_cache().stats()}")
+    print(f"LLM scheduler: {llm_scheduler.stats()}, search scheduler: {search_scheduler.stats()}")
+    if tracer.spans:
+        print("\nStage latency, tokens and cost:")
+        print(tracing.format_summary(tracer.summary()))
+        print(tracing.format_summary(tracer.claim_summary()))
+        print("\nModel tier latency, tokens and cost:")
+        print(tracing.format_summary(tracer.model_summary(), title="model"))
 
-print("\nClassification Report (excluding NEI):")
-print(classification_report(filtered_df['label'], filtered_df['predicted_label'], target_names=["fake", "real"]))
+    print("\nClassification Report (excluding NEI):")
+    print(classification_report(filtered_df['label'], filtered_df['predicted_label'], target_names=["fake", "real"]))
 
+    if args.cascade:
+        first_tier_df = df[df['first_tier_label'].isin(['real', 'fake'])]
+        print("Classification Report of the first tier alone (excluding NEI):")
+        print(classification_report(first_tier_df['label'], first_tier_df['first_tier_label'], target_names=["fake", "real"]))
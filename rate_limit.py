@@ -0,0 +1,233 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+# -------------------------- Configuration -------------------------- #
+
+# OpenAI request and token rate limits of the account (per minute)
+LLM_RPM = int(os.getenv('LLM_RPM', 500))
+LLM_TPM = int(os.getenv('LLM_TPM', 200000))
+
+# Google Custom Search requests per minute
+SEARCH_QPM = int(os.getenv('SEARCH_QPM', 100))
+
+# Per-run budgets; unset means unlimited
+LLM_TOKEN_BUDGET = int(os.getenv('LLM_TOKEN_BUDGET')) if os.getenv('LLM_TOKEN_BUDGET') else None
+SEARCH_REQUEST_BUDGET = int(os.getenv('SEARCH_REQUEST_BUDGET')) if os.getenv('SEARCH_REQUEST_BUDGET') else None
+
+# Priorities: lower values are served first when requests are queued
+PRIORITY_HIGH = 0    # Decisions and explanations, which complete a claim
+PRIORITY_NORMAL = 1  # Claim extraction and query generation
+PRIORITY_LOW = 2     # Per-result analyses
+
+# Adaptive backoff: the rate is halved on every rate-limit response and recovers slowly on success
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.02
+DEFAULT_COOLDOWN = 5.0  # Seconds paused after a rate-limit response without Retry-After
+
+# Longest sleep of a queued request before it checks its turn again
+POLL_INTERVAL = 0.05
+
+
+class BudgetExhausted(Exception):
+    """
+    Raised when a request would exceed the per-run budget of a backend.
+    """
+
+
+def estimate_tokens(messages):
+    """
+    Estimates the number of prompt tokens of a list of chat messages
+    (about four characters per token plus a small per-message overhead).
+
+    :param messages: List of chat messages.
+    :return: Estimated number of tokens.
+    """
+    text = json.dumps(messages, ensure_ascii=False)
+    return len(text) // 4 + 4 * len(messages)
+
+# -------------------------- Token Bucket Scheduler -------------------------- #
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second up to `capacity`.
+    Not thread-safe on its own; RequestScheduler serializes access.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now, factor=1.0):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * factor)
+        self.updated = now
+
+    def wait_time(self, cost, factor=1.0):
+        """
+        :return: Seconds until `cost` tokens are available (0 if they are available now).
+        """
+        missing = min(cost, self.capacity) - self.level
+        return 0.0 if missing <= 0 else missing / (self.rate * factor)
+
+
+class RequestScheduler:
+    """
+    Shared scheduler for one backend. Each request takes one token from a request bucket
+    and its estimated cost from a token bucket. Waiting requests are served in priority order,
+    the rate is reduced after rate-limit responses and recovers on success, and a per-run
+    budget raises BudgetExhausted instead of sending requests that would exceed it.
+    """
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute=None, budget=None):
+        """
+        :param name: Backend name used in messages.
+        :param requests_per_minute: Request rate limit.
+        :param tokens_per_minute: Token rate limit (None for backends without token limits).
+        :param budget: Maximum number of tokens (or requests, without token limits) for the run.
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1, requests_per_minute / 60.0 * 5))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute / 6.0) if tokens_per_minute else None
+        self.budget = budget
+        self.used = 0
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.exhausted = False
+        self.rate_limited = 0
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._queue = []
+        self._cancelled = set()
+        self._counter = itertools.count()
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._counter))
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _cancel(self, ticket):
+        with self._lock:
+            self._cancelled.add(ticket)
+            self._drop_cancelled()
+
+    def _drop_cancelled(self):
+        while self._queue and self._queue[0] in self._cancelled:
+            self._cancelled.discard(heapq.heappop(self._queue))
+
+    def _check_budget(self, cost):
+        if self.exhausted or (self.budget is not None and self.used + cost > self.budget):
+            self.exhausted = True
+            raise BudgetExhausted(f"{self.name} budget exhausted ({self.used} used of {self.budget})")
+
+    def _try_acquire(self, ticket, cost):
+        """
+        :return: 0 if the request may be sent now, otherwise the number of seconds to wait.
+        """
+        with self._lock:
+            self._drop_cancelled()
+            self._check_budget(cost)
+            now = time.monotonic()
+            self.requests.refill(now, self.factor)
+            if self.tokens is not None:
+                self.tokens.refill(now, self.factor)
+            if self._queue[0] != ticket:
+                return POLL_INTERVAL
+            wait = max(self.paused_until - now, self.requests.wait_time(1, self.factor))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.wait_time(cost, self.factor))
+            if wait > 0:
+                return min(wait, 1.0)
+            heapq.heappop(self._queue)
+            self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= min(cost, self.tokens.capacity)
+            self.used += cost if self.tokens is not None else 1
+            self.sent += 1
+            return 0
+
+    def acquire(self, cost=1, priority=PRIORITY_NORMAL):
+        """
+        Blocks until the request may be sent.
+
+        :param cost: Estimated number of tokens of the request.
+        :param priority: Request priority (lower values first).
+        """
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_acquire(ticket, cost)
+                if wait == 0:
+                    return
+                time.sleep(wait)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    async def acquire_async(self, cost=1, priority=PRIORITY_NORMAL):
+        """
+        Async version of acquire.
+        """
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_acquire(ticket, cost)
+                if wait == 0:
+                    return
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    def settle(self, estimated, actual):
+        """
+        Corrects the token accounting once the actual token usage of a request is known.
+
+        :param estimated: Cost passed to acquire.
+        :param actual: Actual number of tokens reported by the provider.
+        """
+        with self._lock:
+            if self.tokens is not None:
+                self.tokens.level -= actual - estimated
+                self.used += actual - estimated
+
+    def on_success(self):
+        with self._lock:
+            self.factor = min(1.0, self.factor + RATE_RECOVERY_STEP)
+
+    def on_rate_limited(self, retry_after=None):
+        """
+        Halves the sending rate and pauses all requests after a rate-limit response.
+
+        :param retry_after: Seconds suggested by the provider, if any.
+        """
+        with self._lock:
+            self.rate_limited += 1
+            self.factor = max(MIN_RATE_FACTOR, self.factor / 2)
+            pause = retry_after if retry_after is not None else DEFAULT_COOLDOWN
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+    def exhaust(self):
+        """
+        Marks the budget as exhausted, e.g. after the provider reported that the quota is used up.
+        """
+        with self._lock:
+            self.exhausted = True
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of sent and rate-limited requests, the budget use and the current rate factor.
+        """
+        return {"sent": self.sent, "rate_limited": self.rate_limited, "used": self.used,
+                "budget": self.budget, "exhausted": self.exhausted, "rate_factor": round(self.factor, 3)}
+
+# -------------------------- Shared Schedulers -------------------------- #
+
+llm_scheduler = RequestScheduler("LLM", LLM_RPM, tokens_per_minute=LLM_TPM, budget=LLM_TOKEN_BUDGET)
+search_scheduler = RequestScheduler("Search", SEARCH_QPM, budget=SEARCH_REQUEST_BUDGET)
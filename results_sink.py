@@ -0,0 +1,232 @@
+import glob
+import json
+import os
+import threading
+import time
+
+# -------------------------- Configuration -------------------------- #
+
+# Number of results buffered per Parquet row group
+ROW_GROUP_SIZE = 1000
+
+# Columns of the Parquet files. Fields of a result record that are not listed are only kept in the JSONL file
+_SCALAR_COLUMNS = {
+    "row": "int64", "cluster": "int64", "input": "string", "key_claim": "string", "predicted_label": "string",
+    "confidence": "float64", "first_tier_label": "string", "escalated": "bool", "rounds": "int64",
+    "seconds": "float64", "llm_calls": "int64", "prompt_tokens": "int64", "completion_tokens": "int64",
+    "decision_calls": "int64", "decision_prompt_tokens": "int64", "analysis_calls": "int64",
+    "analysis_prompt_tokens": "int64", "analysis_completion_tokens": "int64", "analysis_seconds": "float64",
+    "analysis_calls_saved": "int64", "analysis_memo_hits": "int64", "outputs_rescued": "int64",
+    "rounds_avoided": "int64", "escalation_calls": "int64", "articles_fetched": "int64", "articles_failed": "int64",
+    "articles_enriched": "int64", "triage_label": "string", "triage_margin": "float64",
+    "triage_decided": "bool", "finished_at": "float64",
+}
+_ANALYSIS_FIELDS = {"title": "string", "link": "string", "support_or_contradict_or_unrelated": "string",
+                    "confidence": "float64", "rationale": "string"}
+_EXPLANATION_FIELDS = {"type": "string", "label": "string", "confidence": "float64", "content": "string", "idx": "int64",
+                       "title": "string", "rationale": "string", "link": "string", "support_label": "string"}
+
+
+def parquet_schema():
+    """
+    :return: pyarrow schema of the Parquet result files; analyses and explanations are lists of structs.
+    """
+    import pyarrow as pa
+
+    def struct(fields):
+        return pa.struct([(name, pa.type_for_alias(kind)) for name, kind in fields.items()])
+
+    return pa.schema([(name, pa.type_for_alias(kind)) for name, kind in _SCALAR_COLUMNS.items()] + [
+        ("analyses", pa.list_(struct(_ANALYSIS_FIELDS))),
+        ("explanation", pa.list_(struct(_EXPLANATION_FIELDS))),
+    ])
+
+
+def _parquet_row(record):
+    row = {name: record.get(name) for name in _SCALAR_COLUMNS}
+    row["analyses"] = [{name: item.get(name) for name in _ANALYSIS_FIELDS} for item in record.get("analyses") or []]
+    row["explanation"] = [{name: item.get(name) for name in _EXPLANATION_FIELDS} for item in record.get("explanation") or []]
+    return row
+
+# Per-claim statistics of process_content copied into a result record
+STAT_FIELDS = ("rounds", "llm_calls", "prompt_tokens", "completion_tokens", "decision_calls", "decision_prompt_tokens",
+               "analysis_calls", "analysis_prompt_tokens", "analysis_completion_tokens", "analysis_seconds",
+               "analysis_calls_saved", "analysis_memo_hits", "outputs_rescued", "rounds_avoided", "escalated",
+               "escalation_calls", "articles_fetched", "articles_failed", "articles_enriched")
+
+
+def result_record(content, decision, explanation, stats, seconds=None, **fields):
+    """
+    Builds the result record of one claim.
+
+    :param content: Input text content.
+    :param decision: Final decision with confidence.
+    :param explanation: Explanation returned by process_content.
+    :param stats: Per-claim statistics filled by process_content.
+    :param seconds: Wall time of the claim.
+    :param fields: Extra fields (for example the row of the input).
+    :return: JSON-serializable result dictionary.
+    """
+    record = dict(fields)
+    record.update({
+        "input": content,
+        "key_claim": stats.get("key_claim"),
+        "predicted_label": decision.get("decision", "NEI"),
+        "confidence": decision.get("confidence", 0),
+        "first_tier_label": stats.get("first_tier_decision", decision).get("decision", "NEI"),
+        "triage_label": stats.get("triage_label"),
+        "triage_margin": stats.get("triage_margin"),
+        "triage_decided": stats.get("triage_decided", False),
+        "seconds": round(seconds, 3) if seconds is not None else None,
+    })
+    record.update({field: stats.get(field, 0) for field in STAT_FIELDS})
+    record["analyses"] = [{name: analysis.get(name) for name in _ANALYSIS_FIELDS} for analysis in stats.get("analyses", [])]
+    record["explanation"] = explanation
+    if stats.get("round_trace") is not None:
+        # Per-round trace replayed by simulate.py (JSONL only)
+        record["round_trace"] = stats["round_trace"]
+    record["finished_at"] = round(time.time(), 3)
+    return record
+
+# -------------------------- Results Sink -------------------------- #
+
+class ResultsSink:
+    """
+    Streams the result of every claim as it finishes: one line of an append-only JSONL file, and
+    optionally one row of a Parquet file written in row groups. Every run writes its own Parquet
+    part file into the Parquet directory, so interrupted runs can be resumed without rewriting it.
+    """
+
+    def __init__(self, path, parquet_dir=None, row_group_size=ROW_GROUP_SIZE):
+        """
+        :param path: Path of the JSONL results file.
+        :param parquet_dir: Optional directory receiving the Parquet part files (requires pyarrow).
+        :param row_group_size: Number of results per Parquet row group.
+        """
+        self.path = path
+        self.parquet_dir = parquet_dir
+        self.row_group_size = row_group_size
+        self.written = 0
+        self._lock = threading.Lock()
+        self._rows = []
+        self._writer = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # An interrupted run left a partial line; the next result must not be appended onto it
+                    self._file.write("\n")
+        if parquet_dir is not None:
+            import pyarrow.parquet  # Fail before the run starts if pyarrow is missing
+            os.makedirs(parquet_dir, exist_ok=True)
+
+    def write(self, record):
+        """
+        Appends one result. The JSONL line is flushed immediately.
+
+        :param record: JSON-serializable result dictionary.
+        """
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.written += 1
+            if self.parquet_dir is not None:
+                self._rows.append(_parquet_row(record))
+                if len(self._rows) >= self.row_group_size:
+                    self._write_row_group()
+
+    def _write_row_group(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+        schema = parquet_schema()
+        if self._writer is None:
+            part = os.path.join(self.parquet_dir, f"part-{time.strftime('%Y%m%d_%H%M%S')}-{os.getpid()}.parquet")
+            self._writer = pq.ParquetWriter(part, schema)
+        self._writer.write_table(pa.Table.from_pylist(self._rows, schema=schema))
+        self._rows = []
+
+    def close(self):
+        """
+        Writes the last Parquet row group and closes the files.
+        """
+        with self._lock:
+            if self.parquet_dir is not None:
+                self._write_row_group()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# -------------------------- Loading -------------------------- #
+
+def iter_results(path, columns=None):
+    """
+    Reads results back lazily, one record at a time, from a JSONL results file or from a
+    Parquet file or directory of part files (read batch by batch).
+
+    :param path: JSONL file, Parquet file or Parquet directory.
+    :param columns: Optional list of fields to keep; other fields are dropped while reading.
+    :return: Generator of result dictionaries.
+    """
+    if os.path.isdir(path) or path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        files = sorted(glob.glob(os.path.join(path, "*.parquet"))) if os.path.isdir(path) else [path]
+        for file in files:
+            for batch in pq.ParquetFile(file).iter_batches(columns=columns):
+                yield from batch.to_pylist()
+        return
+
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            yield record if columns is None else {column: record.get(column) for column in columns}
+
+
+def load_results(path, columns=None):
+    """
+    Loads results into a DataFrame, keeping only the requested columns in memory. When a row was
+    written more than once, its last result is kept.
+
+    :param path: JSONL file, Parquet file or Parquet directory.
+    :param columns: Optional list of fields to load (loading "explanation" or "analyses" keeps the nested lists).
+    :return: pandas DataFrame with one row per result.
+    """
+    import pandas as pd
+
+    if columns is not None and "row" not in columns:
+        columns = ["row"] + list(columns)
+    df = pd.DataFrame.from_records(iter_results(path, columns), columns=columns)
+    if "row" in df.columns:
+        df = df.drop_duplicates("row", keep="last")
+    return df
+
+
+def explode_analyses(results):
+    """
+    One row per analyzed search result, for querying the evidence of many claims.
+
+    :param results: Iterable of result dictionaries (for example iter_results(path, ["row", "key_claim", "analyses"])).
+    :return: Generator of dictionaries with the row, key claim, and the fields of one analysis.
+    """
+    for record in results:
+        for analysis in record.get("analyses") or []:
+            yield {"row": record.get("row"), "key_claim": record.get("key_claim"), **analysis}
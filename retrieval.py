@@ -0,0 +1,205 @@
+import argparse
+import csv
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from cache import DiskCache
+from search import google_search, google_search_async
+
+# -------------------------- Retriever Interface -------------------------- #
+
+class Retriever:
+    """
+    Retrieval backend returning search result items of the form {"title", "link", "snippet"}.
+    """
+
+    def search(self, query, result_total=10, start=1):
+        """
+        :param query: The search query string.
+        :param result_total: Total number of results desired.
+        :param start: Rank of the first result to retrieve (1-based).
+        :return: List of search result items.
+        """
+        raise NotImplementedError
+
+    async def search_async(self, query, result_total=10, start=1):
+        """
+        Async version of search. Backends without network I/O answer synchronously.
+        """
+        return self.search(query, result_total=result_total, start=start)
+
+
+class GoogleRetriever(Retriever):
+    """
+    Live Google Custom Search backend.
+    """
+
+    def search(self, query, result_total=10, start=1):
+        return google_search(query, result_total=result_total, start=start)
+
+    async def search_async(self, query, result_total=10, start=1):
+        return await google_search_async(query, result_total=result_total, start=start)
+
+# -------------------------- Local BM25 Index -------------------------- #
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his in is it its of on or she that the their they this to
+was were will with not no
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercases the text and splits it into word tokens without stopwords.
+
+    :param text: Input text.
+    :return: List of tokens.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LocalIndexRetriever(Retriever):
+    """
+    BM25 index over a local corpus of evidence documents, stored on disk as a directory with
+    `docs.jsonl` (the items) and `index.json` (postings, document lengths and statistics).
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, index_dir):
+        """
+        :param index_dir: Directory written by build_index.
+        """
+        with open(os.path.join(index_dir, "docs.jsonl"), encoding="utf-8") as f:
+            self.docs = [json.loads(line) for line in f]
+        with open(os.path.join(index_dir, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        self.postings = index["postings"]
+        self.doc_lengths = index["doc_lengths"]
+        self.avg_length = index["avg_length"] or 1.0
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for term, posting in self.postings.items()}
+
+    def score(self, query):
+        """
+        :param query: The search query string.
+        :return: Dictionary mapping document ids to their BM25 score.
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in posting:
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, result_total=10, start=1):
+        scores = self.score(query)
+        top = heapq.nlargest(start - 1 + result_total, scores.items(), key=lambda item: item[1])
+        return [dict(self.docs[doc_id]) for doc_id, _ in top[start - 1:]]
+
+
+def build_index(items, index_dir):
+    """
+    Builds a BM25 index over evidence items and writes it to disk. Items are deduplicated by link.
+
+    :param items: Iterable of items with "title", "link" and "snippet" (or "text") fields.
+    :param index_dir: Output directory.
+    :return: Number of indexed documents.
+    """
+    docs = []
+    seen_links = set()
+    for item in items:
+        link = item.get("link", "")
+        if link and link in seen_links:
+            continue
+        seen_links.add(link)
+        docs.append({
+            "title": item.get("title", "No title provided."),
+            "link": link,
+            "snippet": item.get("snippet") or item.get("text", ""),
+        })
+
+    postings = {}
+    doc_lengths = []
+    for doc_id, doc in enumerate(docs):
+        counts = Counter(tokenize(f"{doc['title']} {doc['snippet']}"))
+        doc_lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append([doc_id, tf])
+
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, "docs.jsonl"), "w", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+    with open(os.path.join(index_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "postings": postings,
+            "doc_lengths": doc_lengths,
+            "avg_length": sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+        }, f)
+    return len(docs)
+
+
+def read_corpus(path):
+    """
+    Reads evidence items from a JSONL or CSV file with title/link/snippet (or text) fields.
+
+    :param path: Corpus file path.
+    :return: Generator of item dictionaries.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_search_cache(path):
+    """
+    Reads all search result items stored in a search cache database.
+
+    :param path: Path of the search cache SQLite file.
+    :return: Generator of item dictionaries.
+    """
+    cache = DiskCache(path, mode="readonly")
+    for items in cache.values():
+        yield from items
+    cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the local evidence index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build the index from corpora and/or the search cache")
+    build_parser.add_argument("--corpus", action="append", default=[], help="JSONL or CSV corpus file (repeatable)")
+    build_parser.add_argument("--search-cache", help="Search cache database with previously retrieved results")
+    build_parser.add_argument("--index-dir", default=os.path.join(".cache", "evidence_index"))
+    query_parser = subparsers.add_parser("query", help="Query the index")
+    query_parser.add_argument("query")
+    query_parser.add_argument("--index-dir", default=os.path.join(".cache", "evidence_index"))
+    query_parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        def all_items():
+            for path in args.corpus:
+                yield from read_corpus(path)
+            if args.search_cache:
+                yield from read_search_cache(args.search_cache)
+        print(f"Indexed {build_index(all_items(), args.index_dir)} documents into {args.index_dir}")
+    else:
+        for item in LocalIndexRetriever(args.index_dir).search(args.query, result_total=args.k):
+            print(f"{item['title']}\n  {item['link']}\n  {item['snippet']}\n")
@@ -0,0 +1,353 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import types
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from cache import DiskCache, make_key
+from rate_limit import search_scheduler
+
+# -------------------------- Configuration -------------------------- #
+
+SEARCH_URL = os.getenv('SEARCH_URL', 'https://www.googleapis.com/customsearch/v1')
+
+# Credentials of the Custom Search API; when None, GOOGLE_API_KEY and SEARCH_ENGINE_ID are read from the environment
+GOOGLE_API_KEY = None
+SEARCH_ENGINE_ID = None
+
+# Connection pool and retry settings
+SEARCH_POOL_SIZE = 20
+SEARCH_TIMEOUT = 10  # Seconds per request
+SEARCH_MAX_RETRIES = 3
+SEARCH_BACKOFF_BASE = 0.5  # Seconds, doubled on every retry
+SEARCH_BACKOFF_MAX = 8.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Maximum number of search requests in flight per event loop (async path)
+SEARCH_CONCURRENCY = 8
+
+# Persistent query -> items cache
+SEARCH_CACHE_PATH = os.getenv('SEARCH_CACHE_PATH', os.path.join('.cache', 'search_cache.sqlite'))
+SEARCH_CACHE_MODE = os.getenv('SEARCH_CACHE_MODE', 'readwrite')
+SEARCH_CACHE_TTL = 7 * 24 * 3600  # Seconds
+SEARCH_CACHE_MAX_ENTRIES = 100000
+
+# -------------------------- Client Libraries -------------------------- #
+
+_backends = None
+_backends_lock = threading.Lock()
+
+
+def load_backends():
+    """
+    Imports the HTTP and OpenAI client libraries on first use, all at once and under a lock, so importing
+    the pipeline stays cheap. Worker threads importing them concurrently could otherwise see partially
+    initialized modules (openai itself imports httpx).
+
+    :return: Namespace with the httpx, requests and openai modules.
+    """
+    global _backends
+    with _backends_lock:
+        if _backends is None:
+            import httpx
+            import openai
+            import requests
+            import requests.adapters
+
+            _backends = types.SimpleNamespace(httpx=httpx, requests=requests, openai=openai)
+    return _backends
+
+# -------------------------- Shared Session and Cache -------------------------- #
+
+_session = None
+_search_cache = None
+_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the shared pooled HTTP session used for all search requests.
+
+    :return: requests.Session instance.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            requests = load_backends().requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=SEARCH_POOL_SIZE, pool_maxsize=SEARCH_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+    return _session
+
+
+def get_search_cache():
+    """
+    Returns the shared search result cache, opening it on first use.
+
+    :return: DiskCache instance.
+    """
+    global _search_cache
+    with _lock:
+        if _search_cache is None:
+            _search_cache = DiskCache(SEARCH_CACHE_PATH, mode=SEARCH_CACHE_MODE, ttl=SEARCH_CACHE_TTL,
+                                      max_entries=SEARCH_CACHE_MAX_ENTRIES)
+    return _search_cache
+
+# Async clients and semaphores are bound to an event loop, so they are kept per loop
+_loop_resources = weakref.WeakKeyDictionary()
+
+
+def _get_loop_resources():
+    loop = asyncio.get_running_loop()
+    resources = _loop_resources.get(loop)
+    if resources is None:
+        httpx = load_backends().httpx
+        limits = httpx.Limits(max_connections=SEARCH_POOL_SIZE, max_keepalive_connections=SEARCH_POOL_SIZE)
+        resources = {
+            "client": httpx.AsyncClient(limits=limits, timeout=SEARCH_TIMEOUT),
+            "semaphore": asyncio.Semaphore(SEARCH_CONCURRENCY),
+        }
+        _loop_resources[loop] = resources
+    return resources
+
+
+async def aclose_search_client():
+    """
+    Closes the async HTTP client of the running event loop, if one was opened.
+    """
+    resources = _loop_resources.pop(asyncio.get_running_loop(), None)
+    if resources is not None:
+        await resources["client"].aclose()
+
+# -------------------------- Google Search Function -------------------------- #
+
+def build_payload(query, start=1, num=10, **params):
+    """
+    Builds the payload for the Google Search API request.
+
+    :param query: Search term.
+    :param start: The index of the first result to return.
+    :param num: Number of search results per request.
+    :param params: Additional parameters for the API request.
+    :return: Dictionary containing the API request parameters.
+    """
+    # api_key = "Aput your key here"
+    api_key = GOOGLE_API_KEY or os.getenv('GOOGLE_API_KEY')
+    # search_engine_ID = "put your key here"
+    search_engine_ID = SEARCH_ENGINE_ID or os.getenv('SEARCH_ENGINE_ID')
+    payload = {
+        'key': api_key,
+        'q': query,
+        'cx': search_engine_ID,
+        'start': start,
+        'num': num,
+    }
+    payload.update(params)
+    return payload
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Computes the delay before a retry using exponential backoff with full jitter.
+
+    :param attempt: Number of the failed attempt, starting at 0.
+    :param retry_after: Value of a Retry-After header, if the server sent one.
+    :return: Delay in seconds.
+    """
+    if retry_after is not None:
+        try:
+            return min(SEARCH_BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(SEARCH_BACKOFF_MAX, SEARCH_BACKOFF_BASE * 2 ** attempt))
+
+
+def make_request(payload):
+    """
+    Sends a GET request to the Google Search API over the shared session, retrying
+    rate-limited (429), server (5xx) and connection errors with jittered backoff.
+    Every attempt goes through the shared search rate limiter; a 429 slows it down and
+    a 403 (quota exceeded) marks the search budget as exhausted.
+
+    :param payload: Dictionary containing the API request parameters.
+    :return: JSON response from the API.
+    """
+    requests = load_backends().requests
+    session = get_session()
+    for attempt in range(SEARCH_MAX_RETRIES + 1):
+        last_attempt = attempt == SEARCH_MAX_RETRIES
+        if attempt:
+            tracing.record_retry()
+        search_scheduler.acquire()
+        try:
+            response = session.get(SEARCH_URL, params=payload, timeout=SEARCH_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_attempt:
+                raise Exception(f'Request failed: {e}')
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code == 200:
+            search_scheduler.on_success()
+            return response.json()
+        elif response.status_code == 403:
+            search_scheduler.exhaust()
+            raise Exception('API key quota exceeded or access forbidden.')
+        elif response.status_code == 429 and not last_attempt:
+            search_scheduler.on_rate_limited(backoff_delay(attempt, response.headers.get('Retry-After')))
+        elif response.status_code in RETRY_STATUS_CODES and not last_attempt:
+            time.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+        else:
+            raise Exception(f'Request failed with status code {response.status_code}')
+
+
+async def make_request_async(payload):
+    """
+    Async version of make_request, using the pooled async HTTP client of the running event loop.
+
+    :param payload: Dictionary containing the API request parameters.
+    :return: JSON response from the API.
+    """
+    httpx = load_backends().httpx
+    resources = _get_loop_resources()
+    for attempt in range(SEARCH_MAX_RETRIES + 1):
+        last_attempt = attempt == SEARCH_MAX_RETRIES
+        if attempt:
+            tracing.record_retry()
+        await search_scheduler.acquire_async()
+        try:
+            async with resources["semaphore"]:
+                response = await resources["client"].get(SEARCH_URL, params=payload)
+        except httpx.TransportError as e:
+            if last_attempt:
+                raise Exception(f'Request failed: {e}')
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code == 200:
+            search_scheduler.on_success()
+            return response.json()
+        elif response.status_code == 403:
+            search_scheduler.exhaust()
+            raise Exception('API key quota exceeded or access forbidden.')
+        elif response.status_code == 429 and not last_attempt:
+            search_scheduler.on_rate_limited(backoff_delay(attempt, response.headers.get('Retry-After')))
+        elif response.status_code in RETRY_STATUS_CODES and not last_attempt:
+            await asyncio.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+        else:
+            raise Exception(f'Request failed with status code {response.status_code}')
+
+
+def fetch_page(query, start, num):
+    """
+    Retrieves one page of search results, using the persistent search cache.
+
+    :param query: The search query string.
+    :param start: The index of the first result to return.
+    :param num: Number of search results on the page.
+    :return: List of search result items.
+    """
+    with tracing.span("google_search_page", start=start, num=num):
+        cache = get_search_cache()
+        key = make_key(SEARCH_URL, query, start, num)
+        items = cache.get(key)
+        if items is not None:
+            tracing.record_cache_hit()
+            return items
+        response = make_request(build_payload(query, start=start, num=num))
+        items = response.get('items', [])
+        cache.set(key, items)
+        return items
+
+
+async def fetch_page_async(query, start, num):
+    """
+    Async version of fetch_page.
+    """
+    with tracing.span("google_search_page", start=start, num=num):
+        cache = get_search_cache()
+        key = make_key(SEARCH_URL, query, start, num)
+        items = cache.get(key)
+        if items is not None:
+            tracing.record_cache_hit()
+            return items
+        response = await make_request_async(build_payload(query, start=start, num=num))
+        items = response.get('items', [])
+        cache.set(key, items)
+        return items
+
+
+def page_ranges(result_total, start=1):
+    """
+    Splits a request for result_total results into pages of at most 10 results.
+
+    :param result_total: Total number of results desired.
+    :param start: Rank of the first result to retrieve (1-based).
+    :return: List of (start index, number of results) tuples.
+    """
+    pages = (result_total + 9) // 10  # Ensuring we account for all pages including the last one which might be partial
+    page_args = []
+    for i in range(pages):
+        start_index = start + i * 10
+        num_results = 10 if i < pages - 1 else result_total - (i * 10)
+        page_args.append((start_index, num_results))
+    return page_args
+
+
+def google_search(query, result_total=10, start=1):
+    """
+    Conducts a Google search using the provided query and retrieves a specified number of results.
+    Pages are fetched concurrently; a failed page is reported and skipped without dropping the others.
+
+    :param query: The search query string.
+    :param result_total: Total number of results desired.
+    :param start: Rank of the first result to retrieve (1-based), used to page through results.
+    :return: List of search result items.
+    """
+    page_args = page_ranges(result_total, start)
+
+    def fetch(args):
+        try:
+            return fetch_page(query, *args)
+        except Exception as e:
+            print(f"Google Search Error: {e}")
+            return []
+
+    if len(page_args) == 1:
+        return fetch(page_args[0])
+
+    items = []
+    with ThreadPoolExecutor(max_workers=min(len(page_args), SEARCH_POOL_SIZE)) as executor:
+        # Pages are collected in rank order
+        for page_items in executor.map(fetch, page_args):
+            items.extend(page_items)
+    return items
+
+
+async def google_search_async(query, result_total=10, start=1):
+    """
+    Async version of google_search: all pages are requested concurrently on the running event loop.
+
+    :param query: The search query string.
+    :param result_total: Total number of results desired.
+    :param start: Rank of the first result to retrieve (1-based), used to page through results.
+    :return: List of search result items.
+    """
+    async def fetch(args):
+        try:
+            return await fetch_page_async(query, *args)
+        except Exception as e:
+            print(f"Google Search Error: {e}")
+            return []
+
+    items = []
+    # Pages are collected in rank order
+    for page_items in await asyncio.gather(*(fetch(args) for args in page_ranges(result_total, start))):
+        items.extend(page_items)
+    return items
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qsl, urlsplit
+
+import agents_LLM_RAG as agents
+from cache import make_key
+from rate_limit import llm_scheduler, search_scheduler
+
+# -------------------------- Configuration -------------------------- #
+
+SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8080'))
+
+# Number of pipelines run concurrently, and number of accepted inputs waiting for a worker.
+# When the queue is full, new inputs are rejected with 503 and a Retry-After header
+SERVER_WORKERS = 16
+SERVER_QUEUE_SIZE = 64
+RETRY_AFTER_SECONDS = 5
+
+# Maximum size of a request body
+MAX_BODY_BYTES = 1 << 20
+
+# Number of recent pipeline latencies kept for the metrics percentiles
+LATENCY_WINDOW = 1000
+
+STREAM_FORMATS = ("ndjson", "sse", "json")
+
+# -------------------------- Jobs -------------------------- #
+
+class Job:
+    """
+    One in-flight pipeline run. Events are kept so that requests coalesced onto the job
+    after it started still receive the full event stream.
+    """
+
+    def __init__(self, key, content):
+        self.key = key
+        self.content = content
+        self.events = []
+        self.done = False
+        self.created = time.perf_counter()
+        self._changed = asyncio.Event()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def finish(self):
+        self.done = True
+        self._changed.set()
+
+    async def stream(self):
+        """
+        :return: Async generator of all events of the job, from the first one until the job is done.
+        """
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+async def stub_pipeline(content, stats=None, on_event=None):
+    """
+    Stand-in for process_content_async that emits the same events without calling any backend.
+    """
+    for event in ({"event": "claim", "key_claim": content, "query": content},
+                  {"event": "round", "round": 1, "retrieved": 0, "new": 0},
+                  {"event": "decision", "round": 1, "decision": "NEI", "confidence": 0, "used": 0},
+                  {"event": "explanation", "round": 1, "explanation": []}):
+        await asyncio.sleep(0)
+        if on_event is not None:
+            on_event(event)
+    if stats is not None:
+        stats["rounds"] = 1
+    return {"decision": "NEI", "confidence": 0}, []
+
+# -------------------------- Server -------------------------- #
+
+class VerificationServer:
+    """
+    HTTP/JSON service around process_content_async.
+
+    POST /verify with {"content": "..."} streams the pipeline events as JSON lines (default),
+    as server-sent events (?stream=sse or "Accept: text/event-stream"), or returns only the
+    final result (?stream=json). Identical inputs in flight share a single pipeline run.
+    GET /health and GET /metrics report the queue state and counters.
+    """
+
+    def __init__(self, pipeline=None, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE):
+        """
+        :param pipeline: Coroutine function (content, stats, on_event) -> (decision, explanation);
+                         defaults to process_content_async.
+        :param workers: Number of pipelines run concurrently.
+        :param queue_size: Maximum number of inputs waiting for a worker.
+        """
+        self.pipeline = pipeline or agents.process_content_async
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs = {}
+        self.counters = {"requests": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._queue = None
+        self._tasks = []
+        self._server = None
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        """
+        Starts the workers and listens for connections.
+
+        :return: The asyncio server (its sockets give the bound port when port is 0).
+        """
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, content):
+        """
+        Attaches to the in-flight job for the same input, or queues a new one.
+
+        :param content: Input text content.
+        :return: Tuple (job, coalesced).
+        :raises asyncio.QueueFull: When every worker is busy and the work queue is full.
+        """
+        key = make_key(content.strip())
+        job = self.jobs.get(key)
+        if job is not None:
+            self.counters["coalesced"] += 1
+            return job, True
+        # Admit on the jobs in flight: idle workers only take queued jobs once the loop runs them,
+        # so the queue size alone rejects bursts while workers are free
+        if not self.has_capacity():
+            raise asyncio.QueueFull
+        job = Job(key, content)
+        self._queue.put_nowait(job)
+        self.jobs[key] = job
+        return job, False
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        stats = {}
+        try:
+            decision, explanation = await self.pipeline(job.content, stats=stats, on_event=job.publish)
+            job.publish({"event": "result", "decision": decision, "explanation": explanation, "stats": stats})
+            self.counters["completed"] += 1
+        except Exception as e:
+            print(f"Pipeline error: {e}")
+            job.publish({"event": "error", "message": str(e)})
+            self.counters["failed"] += 1
+        finally:
+            self.jobs.pop(job.key, None)
+            self.latencies.append(time.perf_counter() - job.created)
+            job.finish()
+
+    def has_capacity(self):
+        """
+        :return: True if a new input fits in the running and waiting pipelines.
+        """
+        return len(self.jobs) < self.workers + self.queue_size
+
+    def health(self):
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return {"status": "ok" if self.has_capacity() else "overloaded",
+                "queued": queued, "in_flight": len(self.jobs) - queued}
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else None
+
+        return dict(self.counters, **self.health(), workers=self.workers, queue_size=self.queue_size,
+                    latency_p50=percentile(0.5), latency_p95=percentile(0.95),
+                    llm_cache=agents.get_llm_cache().stats(),
+                    llm_scheduler=llm_scheduler.stats(), search_scheduler=search_scheduler.stats())
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            url = urlsplit(target)
+            params = dict(parse_qsl(url.query))
+
+            if method == "GET" and url.path == "/health":
+                await self._send_json(writer, 200, self.health())
+            elif method == "GET" and url.path == "/metrics":
+                await self._send_json(writer, 200, self.metrics())
+            elif method == "POST" and url.path == "/verify":
+                await self._verify(reader, writer, headers, params)
+            else:
+                await self._send_json(writer, 404, {"error": "Not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away; a running pipeline keeps going for the other subscribers
+        except ValueError as e:
+            await self._send_json(writer, 400, {"error": f"Malformed request: {e}"})
+        finally:
+            writer.close()
+
+    async def _verify(self, reader, writer, headers, params):
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_BYTES:
+            await self._send_json(writer, 413, {"error": "Request body too large"})
+            return
+        try:
+            content = json.loads(await reader.readexactly(length))["content"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            content = None
+        if not isinstance(content, str) or not content.strip():
+            await self._send_json(writer, 400, {"error": "Expected a JSON body with a non-empty 'content' string"})
+            return
+        stream = params.get("stream") or ("sse" if "text/event-stream" in headers.get("accept", "") else "ndjson")
+        if stream not in STREAM_FORMATS:
+            await self._send_json(writer, 400, {"error": f"Unknown stream format: {stream}"})
+            return
+
+        self.counters["requests"] += 1
+        try:
+            job, coalesced = self.submit(content)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            await self._send_json(writer, 503, {"error": "Work queue is full"},
+                                  extra_headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return
+
+        if stream == "json":
+            async for event in job.stream():
+                if event["event"] in ("result", "error"):
+                    await self._send_json(writer, 200 if event["event"] == "result" else 500, event)
+            return
+
+        content_type = "text/event-stream" if stream == "sse" else "application/x-ndjson"
+        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nCache-Control: no-cache\r\n"
+                      "Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n").encode("latin-1"))
+        await self._write_event(writer, {"event": "accepted", "coalesced": coalesced}, stream)
+        async for event in job.stream():
+            await self._write_event(writer, event, stream)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _write_event(writer, event, stream):
+        data = json.dumps(event, ensure_ascii=False)
+        if stream == "sse":
+            chunk = f"event: {event['event']}\ndata: {data}\n\n".encode("utf-8")
+        else:
+            chunk = f"{data}\n".encode("utf-8")
+        writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        await writer.drain()
+
+    @staticmethod
+    async def _send_json(writer, status, body, extra_headers=None):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {reasons.get(status, '')}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n")
+        for name, value in (extra_headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + data)
+        await writer.drain()
+
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT, pipeline=None, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE):
+    """
+    Runs the verification server until cancelled.
+    """
+    server = VerificationServer(pipeline=pipeline, workers=workers, queue_size=queue_size)
+    await server.start(host, port)
+    print(f"Serving on http://{host}:{port} ({workers} workers, queue of {queue_size})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+        await agents.aclose_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the verification pipeline over HTTP.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Number of pipelines run concurrently")
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE, help="Maximum number of waiting inputs")
+    parser.add_argument("--stub", action="store_true", help="Answer with a stub pipeline that calls no backend")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, pipeline=stub_pipeline if args.stub else None,
+                          workers=args.workers, queue_size=args.queue_size))
+    except KeyboardInterrupt:
+        pass
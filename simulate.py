@@ -0,0 +1,231 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from results_sink import load_results
+
+# -------------------------- Configuration -------------------------- #
+
+# Settings swept by default; max_rounds defaults to every round count the traces cover
+THRESHOLDS = (50, 60, 70, 80, 90)
+TALLY_THRESHOLDS = (50, 100, 150, 200, 300)
+
+# Label codes of the replayed decisions
+LABEL_CODES = {"fake": 0, "real": 1}
+NEI, NO_DECISION = 2, -1
+
+# Result fields read back with the traces
+TRACE_COLUMNS = ["row", "cluster", "llm_calls", "escalation_calls", "first_tier_label", "round_trace"]
+
+# -------------------------- Trace Arrays -------------------------- #
+
+def trace_arrays(records, labels):
+    """
+    Packs the per-round traces of the claims into N x R arrays (N claims, R rounds). Claims decided by
+    triage, copied from a cluster representative, or recorded without a trace are skipped.
+
+    :param records: DataFrame of results with the TRACE_COLUMNS.
+    :param labels: Series mapping each row to its true label.
+    :return: Dictionary of arrays.
+    """
+    records = records[records["round_trace"].notna() & (records["cluster"].isna() | (records["cluster"] == records["row"]))]
+    traces = list(records["round_trace"])
+    n = len(traces)
+    r = max([trace["max_rounds"] for trace in traces] + [1])
+
+    executed = np.zeros((n, r), dtype=bool)
+    code = np.full((n, r), NO_DECISION, dtype=np.int8)
+    confidence = np.zeros((n, r))
+    calls = np.zeros((n, r))
+    decision_calls = np.zeros((n, r))
+    seconds = np.zeros((n, r))
+    decision_seconds = np.zeros((n, r))
+    margin = np.zeros((n, r))
+    setup_calls = np.zeros(n)
+    setup_seconds = np.zeros(n)
+    # Last recorded round: a trace that was not recorded in the full trace mode stops at its first confident decision
+    recorded = np.full(n, r - 1)
+
+    for i, (trace, total_calls, escalation_calls) in enumerate(zip(traces, records["llm_calls"], records["escalation_calls"])):
+        for item in trace["rounds"]:
+            j = item["round"] - 1
+            executed[i, j] = True
+            if item.get("decision"):
+                label, confidence[i, j] = item["decision"]
+                code[i, j] = LABEL_CODES.get(label, NEI)
+            calls[i, j] = item["analysis_calls"] + item["decision_calls"]
+            decision_calls[i, j] = item["decision_calls"]
+            seconds[i, j] = item["seconds"]
+            decision_seconds[i, j] = item.get("decision_seconds", 0.0)
+            for label, points in item["analyses"]:
+                if label == "support":
+                    margin[i, j] += points or 0
+                elif label in ("negate", "contradict"):
+                    margin[i, j] -= points or 0
+        setup_calls[i] = (total_calls or 0) - (escalation_calls or 0) - calls[i].sum()
+        setup_seconds[i] = trace["setup_seconds"]
+        if not trace["full"] and trace["settled_round"]:
+            recorded[i] = trace["settled_round"] - 1
+
+    # Forward-filled decision: the pipeline keeps the last decision through rounds without one
+    has_decision = code != NO_DECISION
+    last = np.maximum.accumulate(np.where(has_decision, np.arange(r), -1), axis=1)
+    decided = np.where(last >= 0, np.take_along_axis(code, np.maximum(last, 0), axis=1), NEI)
+
+    return {
+        "rows": records["row"].to_numpy(),
+        "truth": np.array([LABEL_CODES.get(labels.get(row), NEI) for row in records["row"]], dtype=np.int8),
+        "recorded_label": np.array([LABEL_CODES.get(label, NEI) for label in records["first_tier_label"]], dtype=np.int8),
+        "reference": [(trace["max_rounds"], trace["confidence_threshold"]) for trace in traces],
+        "executed": executed, "code": code, "confidence": confidence, "decided": decided,
+        "cum_calls": np.cumsum(calls, axis=1), "cum_decision_calls": np.cumsum(decision_calls, axis=1),
+        "cum_seconds": np.cumsum(seconds, axis=1), "cum_decision_seconds": np.cumsum(decision_seconds, axis=1),
+        "cum_margin": np.cumsum(margin, axis=1), "setup_calls": setup_calls, "setup_seconds": setup_seconds,
+        "recorded": recorded,
+    }
+
+# -------------------------- Replay -------------------------- #
+
+def _stop_round(confident, executed, max_rounds):
+    # First confident round within max_rounds, else the last executed one (-1 if no round ran)
+    rounds = np.arange(confident.shape[1])
+    within = rounds < max_rounds
+    confident = confident & executed & within
+    last_executed = np.where(executed & within, rounds, -1).max(axis=1)
+    return np.where(confident.any(axis=1), confident.argmax(axis=1), last_executed), confident.any(axis=1)
+
+
+def _at(values, stop):
+    return np.where(stop >= 0, np.take_along_axis(values, np.maximum(stop, 0)[:, None], axis=1)[:, 0], 0)
+
+
+def replay(arrays, max_rounds, threshold, aggregation="llm"):
+    """
+    Replays all traces under one setting.
+
+    :param arrays: Output of trace_arrays.
+    :param max_rounds: Maximum number of retrieval rounds.
+    :param threshold: CONFIDENCE_THRESHOLD of the LLM decisions, or the support/negate margin of the tally aggregation.
+    :param aggregation: "llm" replays the recorded LLM decisions; "tally" decides locally from the summed
+                        support and negate confidence of the analyses, without decision calls.
+    :return: Tuple (predicted label codes, LLM calls, seconds, extrapolated) arrays, one value per claim.
+             A claim is extrapolated when the setting would need rounds that were not recorded.
+    """
+    executed = arrays["executed"]
+    if aggregation == "llm":
+        confident = (arrays["code"] <= 1) & (arrays["code"] >= 0) & (arrays["confidence"] >= threshold)
+        stop, settled = _stop_round(confident, executed, max_rounds)
+        predicted = np.where(stop >= 0, _at(arrays["decided"], stop), NEI)
+        calls = arrays["setup_calls"] + _at(arrays["cum_calls"], stop)
+        seconds = arrays["setup_seconds"] + _at(arrays["cum_seconds"], stop)
+    elif aggregation == "tally":
+        margin = arrays["cum_margin"]
+        stop, settled = _stop_round(np.abs(margin) >= threshold, executed, max_rounds)
+        final = _at(margin, stop)
+        predicted = np.where(final >= threshold, LABEL_CODES["real"], np.where(final <= -threshold, LABEL_CODES["fake"], NEI))
+        calls = arrays["setup_calls"] + _at(arrays["cum_calls"] - arrays["cum_decision_calls"], stop)
+        seconds = arrays["setup_seconds"] + _at(arrays["cum_seconds"] - arrays["cum_decision_seconds"], stop)
+    else:
+        raise ValueError(f"Unknown aggregation: {aggregation}")
+    extrapolated = ~settled & (arrays["recorded"] < max_rounds - 1)
+    return predicted, calls, seconds, extrapolated
+
+
+def metrics(truth, predicted):
+    """
+    :param truth: Array of true label codes.
+    :param predicted: Array of predicted label codes (NEI counts as wrong).
+    :return: Dictionary with the coverage, the accuracy, the accuracy on decided claims and the macro F1 of real/fake.
+    """
+    decided = predicted != NEI
+    f1 = []
+    for label in LABEL_CODES.values():
+        true_positives = np.sum((predicted == label) & (truth == label))
+        precision = true_positives / max(1, np.sum(predicted == label))
+        recall = true_positives / max(1, np.sum(truth == label))
+        f1.append(2 * precision * recall / (precision + recall) if precision + recall else 0.0)
+    return {"coverage": decided.mean() if len(truth) else 0.0,
+            "accuracy": np.mean(predicted == truth) if len(truth) else 0.0,
+            "decided_accuracy": np.mean(predicted[decided] == truth[decided]) if decided.any() else np.nan,
+            "macro_f1": float(np.mean(f1))}
+
+
+def pareto(df, maximize="accuracy", minimize=("llm_calls", "seconds")):
+    """
+    :param df: Sweep results.
+    :return: Boolean Series, True for the settings that no other setting beats on all objectives.
+    """
+    values = np.column_stack([-df[maximize].to_numpy()] + [df[column].to_numpy() for column in minimize])
+    no_worse = (values[None, :, :] <= values[:, None, :]).all(axis=2)
+    better = (values[None, :, :] < values[:, None, :]).any(axis=2)
+    return pd.Series(~(no_worse & better).any(axis=1), index=df.index)
+
+
+def sweep(arrays, max_rounds=None, thresholds=THRESHOLDS, tally_thresholds=TALLY_THRESHOLDS):
+    """
+    Replays the traces under every combination of the settings.
+
+    :param arrays: Output of trace_arrays.
+    :param max_rounds: Round limits to sweep (defaults to 1 up to the rounds covered by the traces).
+    :param thresholds: Confidence thresholds of the LLM aggregation.
+    :param tally_thresholds: Margins of the tally aggregation (empty to skip it).
+    :return: DataFrame with one row per setting: accuracy, LLM calls and latency per claim, and a Pareto flag.
+    """
+    if max_rounds is None:
+        max_rounds = range(1, arrays["executed"].shape[1] + 1)
+    settings = [("llm", m, t) for m in max_rounds for t in thresholds] + [("tally", m, t) for m in max_rounds for t in tally_thresholds]
+    rows = []
+    for aggregation, m, t in settings:
+        predicted, calls, seconds, extrapolated = replay(arrays, m, t, aggregation)
+        rows.append({"aggregation": aggregation, "max_rounds": m, "threshold": t,
+                     **metrics(arrays["truth"], predicted),
+                     "llm_calls": calls.mean() if len(calls) else 0.0,
+                     "seconds": seconds.mean() if len(seconds) else 0.0,
+                     "p95_seconds": np.percentile(seconds, 95) if len(seconds) else 0.0,
+                     "extrapolated": extrapolated.mean() if len(extrapolated) else 0.0})
+    df = pd.DataFrame(rows).round(3)
+    df["pareto"] = pareto(df)
+    return df
+
+
+def replay_agreement(arrays):
+    """
+    Replays every claim under the setting it was recorded with.
+
+    :return: Share of the claims whose replayed decision matches the recorded first-tier decision.
+    """
+    if not len(arrays["rows"]):
+        return 1.0
+    matches = 0
+    for reference in set(arrays["reference"]):
+        selected = np.array([item == reference for item in arrays["reference"]])
+        predicted = replay(arrays, *reference)[0]
+        matches += np.sum(predicted[selected] == arrays["recorded_label"][selected])
+    return matches / len(arrays["rows"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded per-round traces under other stopping rules without API calls.")
+    parser.add_argument("results", help="JSONL results file written by main.py (ideally with --full-trace)")
+    parser.add_argument("--input", default="politifact.csv", help="CSV file with the true 'label' of every row")
+    parser.add_argument("--max-rounds", type=int, nargs="+", help="Round limits to sweep")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS, help="Confidence thresholds to sweep")
+    parser.add_argument("--tally-thresholds", type=float, nargs="*", default=TALLY_THRESHOLDS,
+                        help="Support/negate margins of the local tally aggregation to sweep")
+    parser.add_argument("--output", help="CSV file receiving the sweep")
+    args = parser.parse_args()
+
+    labels = pd.read_csv(args.input)["label"]
+    arrays = trace_arrays(load_results(args.results, columns=TRACE_COLUMNS), labels)
+    print(f"{len(arrays['rows'])} traces, {arrays['executed'].shape[1]} rounds, "
+          f"{(arrays['recorded'] < arrays['executed'].shape[1] - 1).mean() if len(arrays['rows']) else 0:.0%} recorded without --full-trace")
+    print(f"Replay of the recorded settings matches {replay_agreement(arrays):.1%} of the recorded decisions")
+
+    results = sweep(arrays, args.max_rounds, args.thresholds, args.tally_thresholds)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(results.to_string(index=False))
+        print("\nPareto frontier (accuracy vs. LLM calls vs. seconds):")
+        print(results[results["pareto"]].sort_values("llm_calls").to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
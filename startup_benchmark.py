@@ -0,0 +1,124 @@
+import argparse
+import json
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# -------------------------- Configuration -------------------------- #
+
+# Number of fresh interpreters timed per measurement
+STARTUP_RUNS = 10
+
+# Dependencies that must not be imported by `import agents_LLM_RAG`; they load on first use
+HEAVY_MODULES = ("openai", "httpx", "requests", "dotenv", "pandas", "numpy", "sklearn", "pyarrow")
+
+# Run in a fresh interpreter: times the import of the module and lists the heavy modules it loaded
+_IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+import_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"import_ms": import_ms, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+# Run in a fresh interpreter after the import: times building the clients on first use
+_FIRST_USE_SNIPPET = """
+import json, time
+import agents_LLM_RAG
+start = time.perf_counter()
+agents_LLM_RAG.configure(agents_LLM_RAG.Config(openai_api_key="startup-benchmark"))
+agents_LLM_RAG.get_client()
+print(json.dumps({"first_use_ms": (time.perf_counter() - start) * 1000}))
+"""
+
+# -------------------------- Measurements -------------------------- #
+
+def _run_python(code):
+    start = time.perf_counter()
+    lines = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.splitlines()
+    # The measurement is the last line of the output
+    return (time.perf_counter() - start) * 1000, json.loads(lines[-1]) if lines and lines[-1].startswith("{") else {}
+
+
+def measure_import(module="agents_LLM_RAG", runs=STARTUP_RUNS):
+    """
+    Imports the module in fresh interpreters.
+
+    :param module: Module to import.
+    :param runs: Number of interpreters.
+    :return: Dictionary with the median import time, the median wall time of the whole
+             interpreter (startup, import and exit) and the heavy modules loaded by the import.
+    """
+    import_ms, process_ms, heavy = [], [], set()
+    for _ in range(runs):
+        wall, result = _run_python(_IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES))
+        process_ms.append(wall)
+        import_ms.append(result["import_ms"])
+        heavy.update(result["heavy"])
+    return {"import_ms": round(statistics.median(import_ms), 1), "process_ms": round(statistics.median(process_ms), 1),
+            "heavy_modules_loaded": sorted(heavy)}
+
+
+def measure_interpreter(runs=STARTUP_RUNS):
+    """
+    :return: Median wall time in ms of a fresh interpreter that imports nothing, for reference.
+    """
+    return round(statistics.median(_run_python("pass")[0] for _ in range(runs)), 1)
+
+
+def measure_first_use(runs=STARTUP_RUNS):
+    """
+    :return: Median time in ms to configure and build the OpenAI client after the import (None if openai is not installed).
+    """
+    try:
+        return round(statistics.median(_run_python(_FIRST_USE_SNIPPET)[1]["first_use_ms"] for _ in range(runs)), 1)
+    except subprocess.CalledProcessError:
+        return None
+
+
+def _worker_ready():
+    import agents_LLM_RAG  # noqa: F401
+    return time.perf_counter()
+
+
+def measure_spawn(workers=4):
+    """
+    Starts a pool of spawned worker processes that each import the pipeline.
+
+    :param workers: Number of worker processes.
+    :return: Time in ms until all workers have imported the pipeline and answered.
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_worker_ready) for _ in range(workers)]
+        for future in futures:
+            future.result()
+        ready_ms = (time.perf_counter() - start) * 1000
+    return round(ready_ms, 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how fast a fresh process can import and use the pipeline.")
+    parser.add_argument("--runs", type=int, default=STARTUP_RUNS, help="Fresh interpreters per measurement")
+    parser.add_argument("--workers", type=int, default=4, help="Spawned worker processes")
+    parser.add_argument("--max-import-ms", type=float, help="Exit with status 1 if the median import time exceeds this")
+    args = parser.parse_args()
+
+    if not sys.flags.dont_write_bytecode:
+        _run_python("import agents_LLM_RAG")  # Writes the bytecode caches, so the runs do not time compilation
+    metrics = {"interpreter_ms": measure_interpreter(args.runs), **measure_import(runs=args.runs),
+               "first_use_ms": measure_first_use(args.runs), "spawn_workers": args.workers,
+               "spawn_ready_ms": measure_spawn(args.workers)}
+    print(json.dumps(metrics, indent=2))
+
+    exit_code = 0
+    if metrics["heavy_modules_loaded"]:
+        print(f"Importing agents_LLM_RAG loaded {', '.join(metrics['heavy_modules_loaded'])}")
+        exit_code = 1
+    if args.max_import_ms is not None and metrics["import_ms"] > args.max_import_ms:
+        print(f"Import took {metrics['import_ms']} ms, more than {args.max_import_ms} ms")
+        exit_code = 1
+    sys.exit(exit_code)
@@ -0,0 +1,168 @@
+import ast
+import json
+import re
+import threading
+
+# -------------------------- Output Schemas -------------------------- #
+#
+# A schema maps each field of the expected JSON object to its kind: STRING, NUMBER or a tuple of
+# allowed string values. Fields whose name ends with "?" are optional.
+
+STRING = "string"
+NUMBER = "number"
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_NUMBER_TEXT = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*%?\s*$")
+
+# Outcome counters of all parsed and re-requested outputs of the process
+counters = {"valid": 0, "repaired": 0, "invalid": 0, "retried": 0, "failed": 0}
+_lock = threading.Lock()
+
+
+def record(outcome):
+    """
+    Counts one output outcome ("valid", "repaired", "invalid", "retried" or "failed").
+    """
+    with _lock:
+        counters[outcome] += 1
+
+
+def stats():
+    """
+    :return: Copy of the outcome counters.
+    """
+    with _lock:
+        return dict(counters)
+
+
+def load_json(text):
+    """
+    Parses a JSON value from model output, repairing common formatting problems: Markdown code fences,
+    text before or after the value, trailing commas and Python-style single quotes.
+
+    :param text: Model output.
+    :return: Tuple (parsed value, whether a repair was needed).
+    :raises ValueError: When no JSON value can be recovered.
+    """
+    try:
+        return json.loads(text), False
+    except (json.JSONDecodeError, TypeError):
+        pass
+    if not isinstance(text, str):
+        raise ValueError("Output is not text")
+
+    candidate = text.strip()
+    fence = _FENCE.search(candidate)
+    if fence:
+        candidate = fence.group(1).strip()
+    starts = [i for i in (candidate.find("{"), candidate.find("[")) if i >= 0]
+    if starts:
+        start = min(starts)
+        end = candidate.rfind("}" if candidate[start] == "{" else "]")
+        if end > start:
+            candidate = candidate[start:end + 1]
+
+    for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+        try:
+            return json.loads(attempt), True
+        except json.JSONDecodeError:
+            pass
+    try:
+        value = ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        value = None
+    if isinstance(value, (dict, list)):
+        return value, True
+    raise ValueError("No JSON value found in the output")
+
+
+def validate(value, schema):
+    """
+    Checks a parsed value against a schema, normalizing numbers given as text ("85", "85%")
+    and enumeration values in the wrong case.
+
+    :param value: Parsed JSON value.
+    :param schema: Output schema.
+    :return: Tuple (normalized value or None, whether a value was normalized, error message or None).
+    """
+    if not isinstance(value, dict):
+        return None, False, "expected a JSON object"
+    result = dict(value)
+    normalized = False
+    for field, kind in schema.items():
+        name = field.rstrip("?")
+        if name not in value:
+            if field.endswith("?"):
+                continue
+            return None, False, f"missing field '{name}'"
+        item = value[name]
+        if kind == NUMBER:
+            if isinstance(item, str) and _NUMBER_TEXT.match(item):
+                number = float(_NUMBER_TEXT.match(item).group(1))
+                item = int(number) if number.is_integer() else number
+                normalized = True
+            if not isinstance(item, (int, float)) or isinstance(item, bool):
+                return None, False, f"field '{name}' must be a number"
+        elif kind == STRING:
+            if not isinstance(item, str):
+                return None, False, f"field '{name}' must be a string"
+        else:
+            matches = [allowed for allowed in kind if isinstance(item, str) and allowed.lower() == item.strip().lower()]
+            if not matches:
+                return None, False, f"field '{name}' must be one of {', '.join(kind)}"
+            normalized = normalized or matches[0] != item
+            item = matches[0]
+        result[name] = item
+    return result, normalized, None
+
+
+def parse(output, schema):
+    """
+    Parses and validates model output against a schema.
+
+    :param output: Model output.
+    :param schema: Output schema.
+    :return: Tuple (validated value or None, whether a repair was needed, error message or None).
+    """
+    try:
+        value, repaired = load_json(output)
+    except ValueError as e:
+        return None, False, str(e)
+    value, normalized, error = validate(value, schema)
+    return value, repaired or normalized, error
+
+
+def response_format(name, schema, mode):
+    """
+    Builds the response_format argument of a chat completion request.
+
+    :param name: Schema name.
+    :param schema: Output schema.
+    :param mode: "json_object" (JSON mode), "json_schema" (schema-constrained output) or None.
+    :return: Dictionary for the request, or None.
+    """
+    if mode is None:
+        return None
+    if mode == "json_object":
+        return {"type": "json_object"}
+    if mode != "json_schema":
+        raise ValueError(f"Unknown structured output mode: {mode}")
+    properties = {}
+    for field, kind in schema.items():
+        if kind == STRING:
+            properties[field.rstrip("?")] = {"type": "string"}
+        elif kind == NUMBER:
+            properties[field.rstrip("?")] = {"type": "number"}
+        else:
+            properties[field.rstrip("?")] = {"type": "string", "enum": list(kind)}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            # Strict schemas require every property, including the optional ones
+            "schema": {"type": "object", "properties": properties, "required": list(properties),
+                       "additionalProperties": False},
+        },
+    }
@@ -0,0 +1,313 @@
+import argparse
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# -------------------------- Configuration -------------------------- #
+
+# USD per million (prompt, completion) tokens, used to estimate the cost of a span
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+SUMMARY_FIELDS = ("count", "p50_seconds", "p95_seconds", "total_seconds", "prompt_tokens",
+                  "completion_tokens", "retries", "cache_hits", "cost_usd")
+
+# -------------------------- Spans -------------------------- #
+#
+# A span covers one stage of the pipeline (claim extraction, query generation, a search page,
+# a search result analysis, a decision, an explanation). Spans opened while a claim trace is
+# active are collected per claim, and all spans are forwarded to the run tracer if one is started.
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_run_tracer = None
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Times a pipeline stage. LLM and search calls made inside the span add their tokens,
+    retries and cache hits to it.
+
+    :param stage: Stage name.
+    :param attributes: Extra JSON-serializable fields stored with the span.
+    :return: Context manager yielding the span dictionary.
+    """
+    trace = _current_trace.get()
+    record = dict(stage=stage, claim_id=trace.claim_id if trace is not None else None, **attributes,
+                  timestamp=time.time(), seconds=0.0, calls=0, prompt_tokens=0, completion_tokens=0,
+                  retries=0, cache_hits=0, cost_usd=0.0)
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - started, 6)
+        _current_span.reset(token)
+        if trace is not None:
+            trace.spans.append(record)
+        if _run_tracer is not None:
+            _run_tracer.record(record)
+
+
+def record_tokens(model, prompt_tokens, completion_tokens):
+    """
+    Adds the token usage of one model response to the current span.
+    """
+    record = _current_span.get()
+    if record is None:
+        return
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    record["model"] = model
+    record["calls"] += 1
+    record["prompt_tokens"] += prompt_tokens
+    record["completion_tokens"] += completion_tokens
+    record["cost_usd"] += (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+def record_retry():
+    record = _current_span.get()
+    if record is not None:
+        record["retries"] += 1
+
+
+def record_cache_hit(model=None):
+    record = _current_span.get()
+    if record is not None:
+        record["cache_hits"] += 1
+        if model is not None:
+            record["model"] = model
+
+# -------------------------- Aggregation -------------------------- #
+
+def percentile(values, q):
+    """
+    :param values: Sorted list of numbers.
+    :param q: Quantile in [0, 1].
+    :return: Nearest-rank percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(spans, key="stage"):
+    """
+    Aggregates spans by stage (or another span field).
+
+    :param spans: Iterable of span dictionaries.
+    :param key: Span field to group by.
+    :return: Dictionary mapping each group to its count, p50/p95/total seconds, tokens, retries, cache hits and cost.
+    """
+    groups = {}
+    for record in spans:
+        groups.setdefault(record.get(key), []).append(record)
+    summary = {}
+    for group, records in groups.items():
+        seconds = sorted(record["seconds"] for record in records)
+        summary[group] = {
+            "count": len(records),
+            "p50_seconds": round(percentile(seconds, 0.5), 3),
+            "p95_seconds": round(percentile(seconds, 0.95), 3),
+            "total_seconds": round(sum(seconds), 3),
+            "prompt_tokens": sum(record["prompt_tokens"] for record in records),
+            "completion_tokens": sum(record["completion_tokens"] for record in records),
+            "retries": sum(record["retries"] for record in records),
+            "cache_hits": sum(record["cache_hits"] for record in records),
+            "cost_usd": round(sum(record["cost_usd"] for record in records), 6),
+        }
+    return summary
+
+
+def summarize_models(spans):
+    """
+    Aggregates the spans that called a model by model, giving the latency, tokens and cost of each model tier.
+
+    :param spans: Iterable of span dictionaries.
+    :return: Dictionary mapping each model to its summary (see summarize).
+    """
+    return summarize([record for record in spans if record.get("model")], key="model")
+
+
+def claim_rows(spans):
+    """
+    Combines the spans of each claim into one row: the wall time of its "process_content" span,
+    and the tokens, retries, cache hits and cost of all its stages.
+
+    :param spans: Iterable of span dictionaries.
+    :return: List of per-claim rows that can be passed to summarize.
+    """
+    claims = {}
+    for record in spans:
+        if record.get("claim_id") is None:
+            continue
+        row = claims.setdefault(record["claim_id"], {"stage": "claim", "claim_id": record["claim_id"], "seconds": 0.0,
+                                                     "prompt_tokens": 0, "completion_tokens": 0, "retries": 0,
+                                                     "cache_hits": 0, "cost_usd": 0.0})
+        if record["stage"] == "process_content":
+            row["seconds"] = record["seconds"]
+        for field in ("prompt_tokens", "completion_tokens", "retries", "cache_hits", "cost_usd"):
+            row[field] += record[field]
+    return list(claims.values())
+
+
+def format_summary(summary, title="stage"):
+    """
+    :param summary: Output of summarize.
+    :param title: Header of the group column.
+    :return: The summary as a plain-text table, slowest total time first.
+    """
+    rows = sorted(summary.items(), key=lambda item: -item[1]["total_seconds"])
+    width = max([len(title)] + [len(str(group)) for group, _ in rows])
+    lines = [f"{title:<{width}}  " + "  ".join(f"{field:>{len(field)}}" for field in SUMMARY_FIELDS)]
+    for group, values in rows:
+        lines.append(f"{str(group):<{width}}  " + "  ".join(f"{values[field]:>{len(field)}}" for field in SUMMARY_FIELDS))
+    return "\n".join(lines)
+
+
+class ClaimTrace:
+    """
+    Spans of one claim.
+    """
+
+    def __init__(self, claim_id):
+        self.claim_id = claim_id
+        self.spans = []
+
+    def totals(self):
+        """
+        :return: Per-stage totals of the claim (see summarize).
+        """
+        return summarize(self.spans)
+
+    def model_totals(self):
+        """
+        :return: Per-model totals of the claim (see summarize_models).
+        """
+        return summarize_models(self.spans)
+
+
+@contextmanager
+def claim_trace(claim_id):
+    """
+    Collects the spans opened in the current context (and the tasks it starts) for one claim.
+
+    :param claim_id: Identifier stored in every span of the claim.
+    :return: Context manager yielding the ClaimTrace.
+    """
+    trace = ClaimTrace(claim_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+class Tracer:
+    """
+    Collects the spans of a run and optionally appends them to a JSONL file as they finish.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: Optional JSONL export path.
+        """
+        self.path = path
+        self.spans = []
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def record(self, record):
+        with self._lock:
+            self.spans.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def summary(self):
+        """
+        :return: Per-stage summary of the run (see summarize).
+        """
+        with self._lock:
+            return summarize(list(self.spans))
+
+    def model_summary(self):
+        """
+        :return: Per-model summary of the run (see summarize_models).
+        """
+        with self._lock:
+            return summarize_models(list(self.spans))
+
+    def claim_summary(self):
+        """
+        :return: Summary of the per-claim totals of the run (see claim_rows).
+        """
+        with self._lock:
+            return summarize(claim_rows(list(self.spans)))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def start_run(path=None):
+    """
+    Starts collecting all spans of the process in a run tracer.
+
+    :param path: Optional JSONL export path.
+    :return: The Tracer.
+    """
+    global _run_tracer
+    _run_tracer = Tracer(path)
+    return _run_tracer
+
+
+def stop_run():
+    """
+    Stops the run tracer and closes its export file.
+
+    :return: The stopped Tracer, or None.
+    """
+    global _run_tracer
+    tracer, _run_tracer = _run_tracer, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+
+def read_spans(path):
+    """
+    :param path: JSONL file written by a Tracer.
+    :return: List of span dictionaries.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize exported pipeline spans.")
+    parser.add_argument("path", help="JSONL file written with main.py --trace")
+    args = parser.parse_args()
+
+    spans = read_spans(args.path)
+    print(format_summary(summarize(spans)))
+    models = summarize_models(spans)
+    if models:
+        print()
+        print(format_summary(models, title="model"))
+    claims = claim_rows(spans)
+    if claims:
+        print()
+        print(format_summary(summarize(claims)))
@@ -0,0 +1,218 @@
+import argparse
+import math
+import os
+import pickle
+import re
+import time
+from collections import Counter
+
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.utils import murmurhash3_32
+
+# -------------------------- Configuration -------------------------- #
+
+# Hashed feature space of word unigrams and bigrams; no vocabulary is stored with the model
+N_FEATURES = 1 << 18
+NGRAM_RANGE = (1, 2)
+
+# Inverse regularization strength of the linear model
+C = 4.0
+
+# Margins reported by default: difference between the probabilities of the two labels
+REPORT_MARGINS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+LABELS = ("fake", "real")
+
+# Default token pattern of scikit-learn's vectorizers, reproduced by the single-input fast path
+_TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# -------------------------- Triage Classifier -------------------------- #
+
+class TriageClassifier:
+    """
+    Compact local fake/real classifier (hashed TF-IDF features and logistic regression) used to decide
+    confident inputs before the agent pipeline. A single input is scored in pure Python from the hashed
+    features it contains (tens of microseconds), without building sparse matrices.
+    """
+
+    def __init__(self):
+        self.vectorizer = HashingVectorizer(n_features=N_FEATURES, ngram_range=NGRAM_RANGE,
+                                            alternate_sign=False, norm=None)
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        self.model = LogisticRegression(C=C, max_iter=1000, class_weight="balanced")
+        self.trained_on = 0
+
+    def fit(self, texts, labels):
+        """
+        :param texts: List of input texts.
+        :param labels: List of "fake"/"real" labels.
+        :return: self
+        """
+        features = self.tfidf.fit_transform(self.vectorizer.transform(texts))
+        self.model.fit(features, labels)
+        self.trained_on = len(texts)
+        return self
+
+    def _feature_indices(self, text):
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return Counter(abs(murmurhash3_32(feature, seed=0)) % N_FEATURES for feature in features)
+
+    def score(self, text):
+        """
+        Scores one input with the same features and model as scores, without scikit-learn's matrix overhead.
+
+        :param text: Input text.
+        :return: Tuple (label, margin), see scores.
+        """
+        idf = self.tfidf.idf_
+        coef = self.model.coef_[0]
+        weights = {index: (math.log(count) + 1.0) * idf[index] for index, count in self._feature_indices(text).items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        logit = float(self.model.intercept_[0]) + sum(weight * coef[index] for index, weight in weights.items()) / norm
+        # Probability of the second class; the margin is |p - (1 - p)|
+        probability = 1.0 / (1.0 + math.exp(-logit))
+        label = self.model.classes_[1] if probability >= 0.5 else self.model.classes_[0]
+        return str(label), abs(2.0 * probability - 1.0)
+
+    def scores(self, texts):
+        """
+        :param texts: List of input texts.
+        :return: List of (label, margin) tuples, where the margin is the difference between the
+                 probabilities of the predicted label and the other label (0 to 1).
+        """
+        probabilities = self.model.predict_proba(self.tfidf.transform(self.vectorizer.transform(texts)))
+        classes = list(self.model.classes_)
+        results = []
+        for row in probabilities:
+            best = int(row.argmax())
+            results.append((classes[best], float(row[best] - row[1 - best])))
+        return results
+
+    def decide(self, text, margin):
+        """
+        :param text: Input text.
+        :param margin: Minimum probability margin for a triage decision.
+        :return: Tuple (decision with confidence or None if the input is uncertain, label, margin).
+        """
+        label, score = self.score(text)
+        if score < margin:
+            return None, label, score
+        return {"decision": label, "confidence": round(50 + 50 * score)}, label, score
+
+    def save(self, path):
+        """
+        Saves the fitted components (not the class itself, so the file loads from any entry point).
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump({"tfidf": self.tfidf, "model": self.model, "trained_on": self.trained_on}, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a model saved with save. Only load model files you created yourself (pickle format).
+
+        :return: TriageClassifier instance.
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        classifier = cls()
+        classifier.tfidf = state["tfidf"]
+        classifier.model = state["model"]
+        classifier.trained_on = state["trained_on"]
+        return classifier
+
+
+def read_labeled_csvs(paths, text_column="text", label_column="label"):
+    """
+    :param paths: List of CSV files with text and fake/real label columns.
+    :return: Tuple (texts, labels); rows with other labels are skipped.
+    """
+    import pandas as pd
+
+    texts, labels = [], []
+    for path in paths:
+        df = pd.read_csv(path)
+        df = df[df[label_column].isin(LABELS)]
+        texts.extend(str(text) for text in df[text_column])
+        labels.extend(df[label_column])
+    return texts, labels
+
+# -------------------------- Margin Report -------------------------- #
+
+def margin_report(scores, labels, pipeline_labels=None, llm_calls=None, costs=None, margins=REPORT_MARGINS):
+    """
+    Shows, for each margin, the share of inputs triage would decide and what that saves.
+
+    :param scores: List of (triage label, margin) tuples.
+    :param labels: List of true labels.
+    :param pipeline_labels: Optional list of the labels predicted by the agent pipeline for the same inputs.
+    :param llm_calls: Optional list of the LLM calls the pipeline made per input.
+    :param costs: Optional list of the estimated pipeline cost (USD) per input.
+    :param margins: Margins to report.
+    :return: List of dictionaries, one per margin.
+    """
+    rows = []
+    for margin in margins:
+        decided = [i for i, (_, score) in enumerate(scores) if score >= margin]
+        row = {"margin": margin, "triaged_share": round(len(decided) / len(scores), 3) if scores else 0.0,
+               "triage_accuracy": round(sum(scores[i][0] == labels[i] for i in decided) / len(decided), 3) if decided else None}
+        if pipeline_labels is not None:
+            row["pipeline_accuracy"] = (round(sum(pipeline_labels[i] == labels[i] for i in decided) / len(decided), 3)
+                                        if decided else None)
+        if llm_calls is not None:
+            row["llm_calls_saved"] = int(sum(llm_calls[i] for i in decided))
+        if costs is not None:
+            row["cost_saved_usd"] = round(sum(costs[i] for i in decided), 4)
+        rows.append(row)
+    return rows
+
+
+def format_margin_report(rows):
+    """
+    :param rows: Output of margin_report.
+    :return: The report as a plain-text table.
+    """
+    fields = list(rows[0]) if rows else []
+    lines = ["  ".join(f"{field:>{len(field)}}" for field in fields)]
+    for row in rows:
+        lines.append("  ".join(f"{'-' if row[field] is None else row[field]:>{len(field)}}" for field in fields))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import random
+
+    parser = argparse.ArgumentParser(description="Train and evaluate the local triage classifier.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="Train on labeled CSV files and save the model")
+    train.add_argument("inputs", nargs="+", help="CSV files with 'text' and 'label' columns")
+    train.add_argument("--model", default=os.path.join(".cache", "triage_model.pkl"), help="Path of the saved model")
+    report = subparsers.add_parser("report", help="Train on part of a labeled CSV file and report the held-out margins")
+    report.add_argument("input", help="CSV file with 'text' and 'label' columns")
+    report.add_argument("--holdout", type=float, default=0.3, help="Share of the rows held out for the report")
+    report.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        texts, labels = read_labeled_csvs(args.inputs)
+        classifier = TriageClassifier().fit(texts, labels)
+        classifier.save(args.model)
+        print(f"Trained on {len(texts)} labeled inputs, saved to {args.model}")
+    else:
+        texts, labels = read_labeled_csvs([args.input])
+        order = list(range(len(texts)))
+        random.Random(args.seed).shuffle(order)
+        cut = int(len(order) * (1 - args.holdout))
+        train_rows, test_rows = order[:cut], order[cut:]
+        classifier = TriageClassifier().fit([texts[i] for i in train_rows], [labels[i] for i in train_rows])
+        test_texts = [texts[i] for i in test_rows]
+        start = time.perf_counter()
+        scores = [classifier.score(text) for text in test_texts]
+        per_input = (time.perf_counter() - start) / max(1, len(test_texts))
+        print(f"Trained on {len(train_rows)} inputs, {len(test_rows)} held out, {per_input * 1e6:.0f} µs per input")
+        print(format_margin_report(margin_report(scores, [labels[i] for i in test_rows])))